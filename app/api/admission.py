@@ -0,0 +1,235 @@
+"""准入控制：并发上限与有界等待队列"""
+
+import asyncio
+import math
+import time
+from typing import Dict, List, Optional
+
+from fastapi import HTTPException
+
+from app.config import settings
+from app.metrics import metrics
+
+
+class AdmissionController:
+    """
+    单个并发上限及其有界等待队列
+
+    并发数未满时立即放行；已满时进入等待队列，队列已满直接拒绝（429），
+    在排队时间预算内仍未获得名额则超时拒绝（503）。
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int):
+        """
+        初始化准入控制器
+
+        Args:
+            name: 名称（global 或提供者名称），用作指标标签
+            max_concurrency: 最大并发请求数，小于等于 0 表示不限制
+            max_queue: 最大等待请求数
+        """
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(max(max_concurrency, 1))
+
+        labels = {"pool": name}
+        self._in_flight_gauge = metrics.gauge("admission_in_flight", labels)
+        self._queue_depth_gauge = metrics.gauge("admission_queue_depth", labels)
+        self._wait_time = metrics.histogram("admission_wait_seconds", labels)
+        self._hold_time = metrics.histogram("admission_hold_seconds", labels)
+        self._rejected = {
+            429: metrics.counter(
+                "admission_rejected_total", {**labels, "status": "429"}
+            ),
+            503: metrics.counter(
+                "admission_rejected_total", {**labels, "status": "503"}
+            ),
+        }
+
+    @property
+    def unlimited(self) -> bool:
+        """是否不限制并发"""
+        return self.max_concurrency <= 0
+
+    def retry_after(self) -> int:
+        """按平均占用时长和排队人数估算建议的重试间隔（秒）"""
+        average_hold = self._hold_time.snapshot()["avg"] or 1.0
+        slots = max(self.max_concurrency, 1)
+        return max(1, math.ceil(average_hold * (self.waiting + 1) / slots))
+
+    def _reject(self, status_code: int, detail: str) -> HTTPException:
+        self._rejected[status_code].inc()
+        return HTTPException(
+            status_code=status_code,
+            detail=detail,
+            headers={"Retry-After": str(self.retry_after())},
+        )
+
+    async def acquire(self, timeout: float) -> None:
+        """
+        获取一个并发名额
+
+        Args:
+            timeout: 最长排队时间（秒）
+
+        Raises:
+            HTTPException: 队列已满（429）或排队超时（503）
+        """
+        if self.unlimited:
+            self._enter()
+            return
+
+        if self._semaphore.locked():
+            if self.waiting >= self.max_queue:
+                raise self._reject(429, f"Too many requests queued for {self.name}")
+            if timeout <= 0:
+                raise self._reject(503, f"Queue time budget exhausted for {self.name}")
+
+        started = time.monotonic()
+        self.waiting += 1
+        self._queue_depth_gauge.set(self.waiting)
+        try:
+            if self._semaphore.locked():
+                await asyncio.wait_for(self._semaphore.acquire(), timeout)
+            else:
+                # 有空闲名额时直接获取，即使排队时间预算已在前一级用完
+                await self._semaphore.acquire()
+        except asyncio.TimeoutError:
+            raise self._reject(
+                503, f"Timed out waiting for capacity on {self.name}"
+            ) from None
+        finally:
+            self.waiting -= 1
+            self._queue_depth_gauge.set(self.waiting)
+            self._wait_time.observe(time.monotonic() - started)
+        self._enter()
+
+    def _enter(self) -> None:
+        self.in_flight += 1
+        self._in_flight_gauge.set(self.in_flight)
+
+    def release(self, held_for: float) -> None:
+        """
+        归还并发名额
+
+        Args:
+            held_for: 名额占用时长（秒），用于估算 Retry-After
+        """
+        self.in_flight -= 1
+        self._in_flight_gauge.set(self.in_flight)
+        self._hold_time.observe(held_for)
+        if not self.unlimited:
+            self._semaphore.release()
+
+
+class AdmissionSlot:
+    """已获得的并发名额，可多次调用 release（只有第一次生效）"""
+
+    def __init__(self, controllers: List[AdmissionController]):
+        self.controllers = controllers
+        self.acquired_at = time.monotonic()
+        self.released = False
+
+    def release(self) -> None:
+        """归还所有名额"""
+        if self.released:
+            return
+        self.released = True
+        held_for = time.monotonic() - self.acquired_at
+        for controller in reversed(self.controllers):
+            controller.release(held_for)
+
+    async def __aenter__(self) -> "AdmissionSlot":
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+
+class Admission:
+    """全局并发上限 + 按提供者的并发上限，共享同一个排队时间预算"""
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        provider_max_concurrency: int,
+        max_queue: int,
+        queue_timeout: float,
+    ):
+        """
+        初始化准入控制
+
+        Args:
+            max_concurrency: 全局最大并发请求数，小于等于 0 表示不限制
+            provider_max_concurrency: 每个提供者的最大并发请求数，小于等于 0 表示不限制
+            max_queue: 每个等待队列的最大长度
+            queue_timeout: 排队时间预算（秒）
+        """
+        self.provider_max_concurrency = provider_max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.global_controller = AdmissionController(
+            "global", max_concurrency, max_queue
+        )
+        self.providers: Dict[str, AdmissionController] = {}
+
+    def provider(self, name: str) -> AdmissionController:
+        """获取指定提供者的准入控制器"""
+        controller = self.providers.get(name)
+        if controller is None:
+            controller = AdmissionController(
+                name, self.provider_max_concurrency, self.max_queue
+            )
+            self.providers[name] = controller
+        return controller
+
+    async def acquire(self, provider: str) -> AdmissionSlot:
+        """
+        依次获取提供者名额和全局名额
+
+        先获取提供者名额，避免等待某个繁忙提供者时占用全局名额。
+
+        Args:
+            provider: 提供者名称
+
+        Returns:
+            已获得的名额，使用完毕后必须 release
+
+        Raises:
+            HTTPException: 被拒绝时为 429 或 503，带 Retry-After 头
+        """
+        deadline = time.monotonic() + self.queue_timeout
+        acquired: List[AdmissionController] = []
+        try:
+            for controller in (self.provider(provider), self.global_controller):
+                await controller.acquire(deadline - time.monotonic())
+                acquired.append(controller)
+        except BaseException:
+            AdmissionSlot(acquired).release()
+            raise
+        return AdmissionSlot(acquired)
+
+
+def _build_admission() -> Admission:
+    """按配置创建准入控制"""
+    return Admission(
+        max_concurrency=settings.admission_max_concurrency,
+        provider_max_concurrency=settings.admission_provider_max_concurrency,
+        max_queue=settings.admission_max_queue,
+        queue_timeout=settings.admission_queue_timeout,
+    )
+
+
+# 全局准入控制实例
+admission: Optional[Admission] = None
+
+
+def get_admission() -> Admission:
+    """获取准入控制实例（单例模式）"""
+    global admission
+    if admission is None:
+        admission = _build_admission()
+    return admission
@@ -0,0 +1,82 @@
+"""批量任务的并发执行"""
+
+import asyncio
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Sequence,
+    TypeVar,
+)
+
+from app import codec
+
+T = TypeVar("T")
+
+# NDJSON 响应的媒体类型
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# 所有工作协程已结束的队列哨兵
+_DONE = object()
+
+
+def ndjson_line(data: Dict[str, Any]) -> str:
+    """编码一行 NDJSON"""
+    return codec.dumps(data).decode("utf-8") + "\n"
+
+
+async def run_bounded(
+    items: Sequence[T],
+    worker: Callable[[int, T], Awaitable[Dict[str, Any]]],
+    concurrency: int,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    以有限并发执行批量任务，按完成顺序逐个产出结果
+
+    固定数量的工作协程从共享的下标中取任务，任意时刻最多 concurrency 个任务在执行。
+    迭代提前结束（如客户端断开）时取消所有未完成的任务。
+
+    Args:
+        items: 任务列表
+        worker: 处理单个任务的协程函数，参数为 (下标, 任务)，返回结果字典；
+            抛出异常时结果为 {"index": 下标, "error": 错误信息}
+        concurrency: 最大并发数
+
+    Yields:
+        各任务的结果，按完成顺序而不是输入顺序
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    next_index = iter(range(len(items)))
+
+    async def run_worker() -> None:
+        for index in next_index:
+            try:
+                result = await worker(index, items[index])
+            except Exception as e:
+                error_detail = str(e) if str(e) else repr(e)
+                result = {"index": index, "error": error_detail}
+            queue.put_nowait(result)
+
+    workers: List["asyncio.Task[None]"] = [
+        asyncio.create_task(run_worker())
+        for _ in range(max(1, min(concurrency, len(items))))
+    ]
+
+    async def wait_workers() -> None:
+        await asyncio.gather(*workers)
+        queue.put_nowait(_DONE)
+
+    waiter = asyncio.create_task(wait_workers())
+    try:
+        while True:
+            result = await queue.get()
+            if result is _DONE:
+                break
+            yield result
+        await waiter
+    finally:
+        for task in [*workers, waiter]:
+            task.cancel()
@@ -1,30 +1,49 @@
 """对话 API 端点"""
 
+from contextlib import ExitStack
 from typing import Any, Dict, List, Optional, Union
 
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 
+from app.api.admission import get_admission
+from app.api.codec_routing import CodecJSONResponse, CodecRoute
+from app.api.batch import NDJSON_MEDIA_TYPE, ndjson_line, run_bounded
 from app.api.chat_history import (
-    add_message,
     clear_history,
     generate_session_id,
     merge_history_and_messages,
+    save_turn,
+)
+from app.api.session_locks import get_session_locks
+from app.api.streaming import (
+    SSE_HEADERS,
+    SSE_MEDIA_TYPE,
+    CleanupStreamingResponse,
+    stream_chat_completion,
+)
+from app.config import settings
+from app.models.cache import cache_mode, resolve_cache_mode
+from app.models.llm_client import BaseLLMClient
+from app.models.registry import get_provider_registry
+from app.models.stream_result import (
+    StreamAccumulator,
+    collect_stream_metadata,
+    observe_stream_result,
 )
-from app.models.llm_client import DoubaoClient
 
-router = APIRouter(prefix="/chat", tags=["chat"])
+router = APIRouter(prefix="/chat", tags=["chat"], route_class=CodecRoute)
 
-# 全局 LLM 客户端实例
-llm_client: Optional[DoubaoClient] = None
+# 替换默认客户端（为 None 时使用提供者注册表中的豆包客户端）
+llm_client: Optional[BaseLLMClient] = None
 
 
-def get_llm_client() -> DoubaoClient:
-    """获取 LLM 客户端实例（单例模式）"""
-    global llm_client
-    if llm_client is None:
-        llm_client = DoubaoClient()
-    return llm_client
+def get_llm_client() -> BaseLLMClient:
+    """获取 LLM 客户端实例（由提供者注册表创建并在应用关闭时释放）"""
+    if llm_client is not None:
+        return llm_client
+    return get_provider_registry().get("doubao")
 
 
 class Message(BaseModel):
@@ -57,6 +76,11 @@ class ChatRequest(BaseModel):
     )
     stream: bool = Field(False, description="是否流式返回")
     clear_history: bool = Field(False, description="是否清除历史对话")
+    cache: bool = Field(
+        False,
+        description="是否缓存回复。temperature 为 0 的请求默认缓存；"
+        "请求头 Cache-Control: no-cache 可跳过缓存",
+    )
 
 
 class ChatResponse(BaseModel):
@@ -65,70 +89,147 @@ class ChatResponse(BaseModel):
     content: str = Field(..., description="AI 回复内容")
     model: str = Field(..., description="使用的模型名称")
     session_id: str = Field(..., description="会话 ID，用于后续对话")
+    finish_reason: Optional[str] = Field(
+        None, description="结束原因（stop、length 等），上游未返回时为空"
+    )
+    usage: Optional[Dict[str, Any]] = Field(
+        None, description="上游返回的 token 用量，命中缓存时为空"
+    )
+    ttft_ms: Optional[float] = Field(
+        None, description="首 token 延迟（毫秒），非流式请求为收到完整回复的时间"
+    )
+    duration_ms: Optional[float] = Field(None, description="生成总耗时（毫秒）")
+    chunk_count: Optional[int] = Field(None, description="收到的增量数")
+    inter_chunk_mean_ms: Optional[float] = Field(
+        None, description="相邻增量的平均间隔（毫秒）"
+    )
+    inter_chunk_max_ms: Optional[float] = Field(
+        None, description="相邻增量的最大间隔（毫秒）"
+    )
+
+
+class BatchConversation(BaseModel):
+    """批量请求中的单个对话"""
+
+    messages: List[Message] = Field(..., description="消息列表")
+    session_id: Optional[str] = Field(
+        None, description="会话 ID，用于维护对话上下文。如果不提供，将创建新会话"
+    )
+    temperature: float = Field(0.7, ge=0.0, le=2.0, description="温度参数，控制随机性")
+    max_tokens: Optional[int] = Field(None, gt=0, description="最大生成 token 数")
+    max_completion_tokens: Optional[int] = Field(
+        None, gt=0, description="最大完成 token 数（火山引擎 API 参数）"
+    )
+    reasoning_effort: Optional[str] = Field(
+        None, description="推理努力程度：low, medium, high"
+    )
+
+
+class BatchChatRequest(BaseModel):
+    """批量聊天请求模型"""
+
+    conversations: List[BatchConversation] = Field(
+        ...,
+        min_length=1,
+        max_length=settings.batch_max_conversations,
+        description="相互独立的对话列表",
+    )
+    max_concurrency: Optional[int] = Field(
+        None, gt=0, description="最大并发数，不超过服务端配置的上限"
+    )
 
 
 @router.post("", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, http_request: Request):
     """
     对话接口（支持上下文）
 
     接收用户消息，调用 AI 模型生成回复。
     如果提供 session_id，将使用历史对话上下文。
+    stream=true 时以 SSE（text/event-stream）逐个返回增量，流结束后发送 done 事件；
+    客户端中途断开时立即停止上游生成，部分回复带截断标记保存到历史。
     """
     try:
         client = get_llm_client()
 
-        # 如果请求清除历史，先清除
-        if request.clear_history and request.session_id:
-            clear_history(request.session_id)
-
         # 生成或使用会话 ID
         session_id = request.session_id or generate_session_id()
 
+        # 设置本次请求的缓存模式
+        cache_mode.set(
+            resolve_cache_mode(http_request.headers.get("cache-control"), request.cache)
+        )
+
         # 转换当前消息格式
         current_messages = [
             {"role": msg.role, "content": msg.content} for msg in request.messages
         ]
 
-        # 合并历史消息和当前消息
-        all_messages = merge_history_and_messages(session_id, current_messages)
+        with ExitStack() as cleanup:
+            # 同一会话的「读取历史 - 调用模型 - 写入历史」串行执行，不同会话并行
+            session_lock = await get_session_locks().acquire(session_id)
+            cleanup.callback(session_lock.release)
 
-        # 调用 LLM
-        if request.stream:
-            # 流式响应（这里简化处理，返回完整内容）
-            # 实际应用中可以使用 StreamingResponse
-            content = ""
-            async for chunk in client.chat_stream(
-                all_messages,
-                temperature=request.temperature,
-                max_tokens=request.max_tokens,
-                max_completion_tokens=request.max_completion_tokens,
-                reasoning_effort=request.reasoning_effort,
-            ):
-                content += chunk
-        else:
-            content = await client.chat(
-                all_messages,
-                temperature=request.temperature,
-                max_tokens=request.max_tokens,
-                max_completion_tokens=request.max_completion_tokens,
-                reasoning_effort=request.reasoning_effort,
-                stream=False,
-            )
+            # 如果请求清除历史，先清除
+            if request.clear_history and request.session_id:
+                await clear_history(request.session_id)
 
-        # 保存对话历史
-        # 保存用户消息
-        for msg in current_messages:
-            if msg["role"] == "user":
-                add_message(session_id, "user", msg["content"])
+            # 合并历史消息和当前消息
+            all_messages = await merge_history_and_messages(
+                session_id, current_messages, model=client.model_name
+            )
 
-        # 保存 AI 回复
-        add_message(session_id, "assistant", content)
+            # 准入控制：超过并发上限时排队，队列已满或排队超时直接拒绝
+            slot = await get_admission().acquire("doubao")
+            cleanup.callback(slot.release)
+
+            # 流式响应：每个增量到达后立即以 SSE 事件发送，流结束后再保存历史
+            # 准入名额和会话锁在响应发送结束时才释放（即使响应体从未开始读取）
+            if request.stream:
+                return CleanupStreamingResponse(
+                    stream_chat_completion(
+                        client,
+                        session_id,
+                        all_messages,
+                        current_messages,
+                        request=http_request,
+                        provider="doubao",
+                        temperature=request.temperature,
+                        max_tokens=request.max_tokens,
+                        max_completion_tokens=request.max_completion_tokens,
+                        reasoning_effort=request.reasoning_effort,
+                    ),
+                    on_finish=cleanup.pop_all().close,
+                    media_type=SSE_MEDIA_TYPE,
+                    headers={**SSE_HEADERS, "X-Session-Id": session_id},
+                )
+
+            # 调用 LLM，同时记录耗时、用量和结束原因
+            with collect_stream_metadata(StreamAccumulator()) as accumulator:
+                content = await client.chat(
+                    all_messages,
+                    temperature=request.temperature,
+                    max_tokens=request.max_tokens,
+                    max_completion_tokens=request.max_completion_tokens,
+                    reasoning_effort=request.reasoning_effort,
+                    stream=False,
+                )
+            accumulator.add(content)
+            result = accumulator.result()
+            observe_stream_result(result, "doubao")
+
+            # 保存对话历史（用户消息和 AI 回复）
+            await save_turn(session_id, current_messages, content)
 
         return ChatResponse(
-            content=content, model=client.model_name, session_id=session_id
+            content=content,
+            model=client.model_name,
+            session_id=session_id,
+            **result.stats(),
         )
 
+    except HTTPException:
+        raise
     except Exception as e:
         import traceback
 
@@ -141,7 +242,68 @@ async def chat(request: ChatRequest):
         )
 
 
-@router.post("/simple")
+async def _run_batch_conversation(
+    client: BaseLLMClient, index: int, conversation: BatchConversation
+) -> Dict[str, Any]:
+    """执行批量请求中的单个对话，返回一行 NDJSON 结果"""
+    session_id = conversation.session_id or generate_session_id()
+    current_messages = [
+        {"role": msg.role, "content": msg.content} for msg in conversation.messages
+    ]
+
+    async with await get_session_locks().acquire(session_id):
+        all_messages = await merge_history_and_messages(
+            session_id, current_messages, model=client.model_name
+        )
+        async with await get_admission().acquire("doubao"):
+            content = await client.chat(
+                all_messages,
+                temperature=conversation.temperature,
+                max_tokens=conversation.max_tokens,
+                max_completion_tokens=conversation.max_completion_tokens,
+                reasoning_effort=conversation.reasoning_effort,
+            )
+
+        await save_turn(session_id, current_messages, content)
+
+    return {
+        "index": index,
+        "content": content,
+        "model": client.model_name,
+        "session_id": session_id,
+    }
+
+
+@router.post("/batch")
+async def chat_batch(request: BatchChatRequest):
+    """
+    批量对话接口
+
+    在一次 HTTP 调用中并发执行多个相互独立的对话（并发数有上限），
+    每个对话完成后立即以一行 NDJSON 返回，顺序为完成顺序而不是输入顺序。
+    每行包含 index（输入中的下标），成功时包含 content、model、session_id，
+    失败时包含 error。
+    """
+    client = get_llm_client()
+    concurrency = min(
+        request.max_concurrency or settings.batch_max_concurrency,
+        settings.batch_max_concurrency,
+    )
+
+    async def worker(index: int, conversation: BatchConversation) -> Dict[str, Any]:
+        try:
+            return await _run_batch_conversation(client, index, conversation)
+        except HTTPException as e:
+            return {"index": index, "error": e.detail, "status_code": e.status_code}
+
+    async def results():
+        async for result in run_bounded(request.conversations, worker, concurrency):
+            yield ndjson_line(result)
+
+    return StreamingResponse(results(), media_type=NDJSON_MEDIA_TYPE)
+
+
+@router.post("/simple", response_class=CodecJSONResponse)
 async def chat_simple(
     message: str = Query(..., description="用户消息"),
     session_id: Optional[str] = Query(
@@ -160,24 +322,28 @@ async def chat_simple(
         # 生成或使用会话 ID
         session_id = session_id or generate_session_id()
 
-        # 合并历史消息和当前消息
-        current_messages = [{"role": "user", "content": message}]
-        all_messages = merge_history_and_messages(session_id, current_messages)
+        # 同一会话的「读取历史 - 调用模型 - 写入历史」串行执行，不同会话并行
+        async with await get_session_locks().acquire(session_id):
+            # 合并历史消息和当前消息
+            current_messages = [{"role": "user", "content": message}]
+            all_messages = await merge_history_and_messages(
+                session_id, current_messages, model=client.model_name
+            )
 
-        # 调试：打印消息格式（开发环境）
-        print(f"DEBUG: Session ID: {session_id}")
-        print(f"DEBUG: Total messages count: {len(all_messages)}")
-        # 只打印前2条
-        print(
-            f"DEBUG: Messages format: {all_messages[:2] if len(all_messages) > 0 else 'empty'}"
-        )
+            # 调试：打印消息格式（开发环境）
+            print(f"DEBUG: Session ID: {session_id}")
+            print(f"DEBUG: Total messages count: {len(all_messages)}")
+            # 只打印前2条
+            print(
+                f"DEBUG: Messages format: {all_messages[:2] if len(all_messages) > 0 else 'empty'}"
+            )
 
-        # 调用 LLM
-        content = await client.chat(all_messages)
+            # 调用 LLM
+            async with await get_admission().acquire("doubao"):
+                content = await client.chat(all_messages)
 
-        # 保存对话历史
-        add_message(session_id, "user", message)
-        add_message(session_id, "assistant", content)
+            # 保存对话历史
+            await save_turn(session_id, current_messages, content)
 
         return {
             "message": content,
@@ -185,6 +351,8 @@ async def chat_simple(
             "session_id": session_id,
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         import traceback
 
@@ -197,10 +365,10 @@ async def chat_simple(
         )
 
 
-@router.delete("/history/{session_id}")
+@router.delete("/history/{session_id}", response_class=CodecJSONResponse)
 async def clear_chat_history(session_id: str):
     """
     清除指定会话的对话历史
     """
-    clear_history(session_id)
+    await clear_history(session_id)
     return {"message": f"History cleared for session {session_id}"}
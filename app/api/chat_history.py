@@ -1,15 +1,56 @@
 """对话历史管理模块"""
 
 import uuid
-from collections import defaultdict
-from typing import Any, Dict, List, Optional
-
-# 内存存储对话历史
-# 格式: {session_id: [{"role": "user", "content": "..."}, ...]}
-chat_histories: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
-
-# 最大历史消息数（避免 token 超限）
-MAX_HISTORY_MESSAGES = 20
+from typing import Any, Dict, List, Optional, Sequence
+
+from app.api.session_backend import SessionBackend
+from app.api.session_store import SessionStore
+from app.config import settings
+from app.models.tokens import estimate_message_tokens
+
+# 每个会话最多保存的历史消息数（存储上限；实际发送的历史由 token 预算决定）
+MAX_HISTORY_MESSAGES = settings.history_max_messages
+
+
+def _build_session_backend() -> SessionBackend:
+    """按配置创建会话存储后端"""
+    if settings.session_backend == "sqlite":
+        from app.api.session_sqlite import SQLiteSessionBackend
+
+        return SQLiteSessionBackend(
+            settings.session_sqlite_path,
+            max_messages=MAX_HISTORY_MESSAGES,
+            flush_interval=settings.session_flush_interval,
+            flush_batch_size=settings.session_flush_batch_size,
+            cache_size=settings.session_cache_size,
+            cache_ttl=settings.session_cache_ttl,
+        )
+    if settings.session_backend == "redis":
+        from app.api.session_redis import RedisSessionBackend
+
+        return RedisSessionBackend.from_url(
+            settings.session_redis_url,
+            max_messages=MAX_HISTORY_MESSAGES,
+            ttl=int(settings.session_store_ttl),
+        )
+    if settings.session_backend != "memory":
+        raise ValueError(f"Unknown session backend: {settings.session_backend}")
+    # 空闲过期、会话数上限和内存上限由 SessionStore 按 LRU 淘汰
+    return SessionStore(
+        max_messages=MAX_HISTORY_MESSAGES,
+        ttl=settings.session_store_ttl,
+        max_sessions=settings.session_store_max_sessions,
+        max_bytes=settings.session_store_max_bytes,
+        cache_json=settings.session_store_cache_json,
+    )
+
+
+# 对话历史存储，每个会话保存消息列表和每条消息的估算 token 数
+# （写入时计算一次并缓存，合并历史时无需重新估算）
+session_store: SessionBackend = _build_session_backend()
+
+# 流式回复被中途截断（如客户端断开）时追加到内容末尾的标记
+TRUNCATED_MARKER = "\n\n[truncated]"
 
 
 def generate_session_id() -> str:
@@ -17,39 +58,128 @@ def generate_session_id() -> str:
     return str(uuid.uuid4())
 
 
-def get_history(session_id: str) -> List[Dict[str, Any]]:
-    """获取指定会话的历史消息"""
-    return chat_histories.get(session_id, [])
+async def get_history(session_id: str) -> Sequence[Dict[str, Any]]:
+    """获取指定会话的历史消息（只读视图，不复制）"""
+    session = await session_store.get(session_id)
+    return session.messages if session is not None else []
+
+
+async def get_history_token_counts(session_id: str) -> Sequence[int]:
+    """获取指定会话每条历史消息的估算 token 数"""
+    session = await session_store.get(session_id)
+    return session.token_counts if session is not None else []
+
+
+async def add_message(session_id: str, role: str, content: Any):
+    """添加消息到历史记录（同时缓存消息的估算 token 数）"""
+    message = {"role": role, "content": content}
+    # 超过 MAX_HISTORY_MESSAGES 时只保留最近的 N 条消息
+    await session_store.append(session_id, message, estimate_message_tokens(message))
+    await _maybe_compact(session_id)
+
+
+async def save_turn(
+    session_id: str, current_messages: List[Dict[str, Any]], content: str
+) -> None:
+    """
+    保存一轮对话：当前请求中的用户消息和 AI 回复
+
+    一轮中的所有消息一次性写入存储后端（远程后端只需一次往返）。
 
+    Args:
+        session_id: 会话 ID
+        current_messages: 当前请求的消息列表（只保存其中的用户消息）
+        content: AI 回复内容
+    """
+    messages = [
+        {"role": "user", "content": msg["content"]}
+        for msg in current_messages
+        if msg["role"] == "user"
+    ]
+    messages.append({"role": "assistant", "content": content})
+    await session_store.append_many(
+        session_id,
+        [(message, estimate_message_tokens(message)) for message in messages],
+    )
+    await _maybe_compact(session_id)
 
-def add_message(session_id: str, role: str, content: Any):
-    """添加消息到历史记录"""
-    if session_id not in chat_histories:
-        chat_histories[session_id] = []
 
-    chat_histories[session_id].append({"role": role, "content": content})
+async def _maybe_compact(session_id: str) -> None:
+    """可选的后台压缩：历史过长时把最早的消息总结成一条摘要"""
+    if settings.history_compaction_enabled:
+        from app.api.compaction import get_compactor  # 避免循环导入
 
-    # 限制历史长度，只保留最近的 N 条消息
-    if len(chat_histories[session_id]) > MAX_HISTORY_MESSAGES:
-        # 保留最近的 N 条消息（从后往前取）
-        chat_histories[session_id] = chat_histories[session_id][-MAX_HISTORY_MESSAGES:]
+        await get_compactor().maybe_schedule(session_id)
 
 
-def clear_history(session_id: str):
+async def clear_history(session_id: str):
     """清除指定会话的历史"""
-    if session_id in chat_histories:
-        del chat_histories[session_id]
+    await session_store.delete(session_id)
 
 
-def merge_history_and_messages(
-    session_id: Optional[str], current_messages: List[Dict[str, Any]]
+async def replace_history_prefix(
+    session_id: str, prefix: List[Dict[str, Any]], message: Dict[str, Any]
+) -> Optional[int]:
+    """
+    把会话历史开头的 prefix 替换为一条消息（用于写入压缩后的摘要）
+
+    比较和替换由存储后端原子地完成，其他请求（或 worker）同时追加的消息不会丢失。
+
+    Args:
+        session_id: 会话 ID
+        prefix: 要替换的消息，必须仍是当前历史的开头
+        message: 替换后的消息
+
+    Returns:
+        节省的估算 token 数；prefix 已不是历史开头（被裁剪、清除等）时返回 None，
+        替换后不能节省 token 时不做替换
+    """
+    return await session_store.replace_prefix(
+        session_id, prefix, message, estimate_message_tokens(message)
+    )
+
+
+def history_token_budget(model: Optional[str] = None) -> int:
+    """获取模型的历史 token 预算，未单独配置时使用默认预算"""
+    if model and model in settings.history_token_budgets:
+        return settings.history_token_budgets[model]
+    return settings.history_token_budget
+
+
+def select_history_window(token_counts: Sequence[int], budget: int) -> int:
+    """
+    选出 token 总数不超过预算的最长历史后缀
+
+    Args:
+        token_counts: 每条历史消息的 token 数
+        budget: token 预算
+
+    Returns:
+        后缀的起始下标（等于 len(token_counts) 表示不使用历史）
+    """
+    start = len(token_counts)
+    used = 0
+    while start > 0 and used + token_counts[start - 1] <= budget:
+        start -= 1
+        used += token_counts[start]
+    return start
+
+
+async def merge_history_and_messages(
+    session_id: Optional[str],
+    current_messages: List[Dict[str, Any]],
+    model: Optional[str] = None,
 ) -> List[Dict[str, Any]]:
     """
     合并历史消息和当前消息
 
+    只保留能放进模型 token 预算的最近历史：预算先扣除当前消息，
+    再从最新的历史消息往前取，直到放不下为止。
+
     Args:
         session_id: 会话 ID，如果为 None 则不使用历史
         current_messages: 当前请求的消息列表
+        model: 模型名称，用于选择 token 预算
 
     Returns:
         合并后的消息列表
@@ -57,6 +187,13 @@ def merge_history_and_messages(
     if not session_id:
         return current_messages
 
-    history = get_history(session_id)
-    # 合并历史消息和当前消息
-    return history + current_messages
+    # 消息和 token 数一次读出（远程后端只需一次往返）
+    session = await session_store.get(session_id)
+    if session is None:
+        return current_messages
+    budget = history_token_budget(model) - sum(
+        estimate_message_tokens(msg) for msg in current_messages
+    )
+    start = select_history_window(session.token_counts, budget)
+    # 合并历史消息和当前消息（只复制放得进预算的窗口）
+    return list(session.messages[start:]) + current_messages
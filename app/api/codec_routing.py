@@ -0,0 +1,48 @@
+"""使用快速 JSON 编解码器的请求解析和响应编码"""
+
+from typing import Any, Callable, Coroutine
+
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+
+from app import codec
+
+
+class CodecJSONResponse(JSONResponse):
+    """
+    使用全局编解码器编码的 JSON 响应
+
+    用于返回普通字典的端点。声明了 response_model 的端点保持默认响应类，
+    FastAPI 会直接用 Pydantic 把响应模型序列化为 JSON 字节，同样不经过标准库 json。
+    """
+
+    def render(self, content: Any) -> bytes:
+        return codec.dumps(content)
+
+
+class CodecRequest(Request):
+    """请求体使用全局编解码器解析的请求"""
+
+    async def json(self) -> Any:
+        if not hasattr(self, "_json"):
+            self._json = codec.loads(await self.body())
+        return self._json
+
+
+class CodecRoute(APIRoute):
+    """
+    请求体使用全局编解码器解析的路由
+
+    FastAPI 通过 request.json() 解析 JSON 请求体，再交给 Pydantic 校验（如 ChatRequest），
+    这里把请求替换为 CodecRequest。解码失败时抛出 json.JSONDecodeError，
+    仍然返回 422 校验错误。
+    """
+
+    def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        handler = super().get_route_handler()
+
+        async def codec_route_handler(request: Request) -> Response:
+            return await handler(CodecRequest(request.scope, request.receive))
+
+        return codec_route_handler
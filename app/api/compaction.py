@@ -0,0 +1,184 @@
+"""长会话的后台增量摘要（压缩）"""
+
+import asyncio
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from app.api import chat_history
+from app.config import settings
+from app.metrics import metrics
+from app.models.llm_client import BaseLLMClient
+from app.models.registry import get_provider_registry
+
+# 摘要消息的前缀，便于识别和在下一次压缩时继续合并
+SUMMARY_PREFIX = "以下是之前对话的摘要：\n"
+
+SUMMARY_PROMPT = (
+    "你负责压缩对话历史。请用简洁的中文总结下面的对话，保留用户的目标、"
+    "已确认的事实、做出的决定和尚未解决的问题，不要添加对话中没有的信息。"
+    "如果对话以已有的摘要开头，请把它与后续内容合并成一份新的摘要。"
+)
+
+
+def _content_text(content: Any) -> str:
+    """提取消息内容中的文本（多模态内容中的图片用占位符表示）"""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        parts = []
+        for part in content:
+            if isinstance(part, dict) and part.get("type") == "text":
+                parts.append(part.get("text", ""))
+            elif isinstance(part, dict) and part.get("type") in ("image_url", "image"):
+                parts.append("[图片]")
+        return " ".join(parts)
+    return "" if content is None else str(content)
+
+
+def format_transcript(messages: List[Dict[str, Any]]) -> str:
+    """把消息列表格式化为供摘要模型阅读的对话记录"""
+    return "\n".join(
+        f"{msg['role']}: {_content_text(msg.get('content'))}" for msg in messages
+    )
+
+
+class HistoryCompactor:
+    """
+    会话历史的后台压缩器
+
+    会话历史的 token 数超过阈值时，在后台任务中调用一个便宜的模型把最早的消息
+    总结成一条 system 消息，完成后替换掉这些消息。压缩不在请求路径上执行，
+    摘要完成之前的请求照常使用原来的历史窗口；摘要期间这些消息若已被裁剪或清除，
+    则丢弃本次摘要。
+    """
+
+    def __init__(
+        self,
+        client_factory: Callable[[], BaseLLMClient],
+        threshold: int = 6000,
+        keep_recent: int = 6,
+        max_concurrency: int = 2,
+    ):
+        """
+        初始化压缩器
+
+        Args:
+            client_factory: 创建摘要模型客户端的函数（首次压缩时才调用）
+            threshold: 触发压缩的会话历史 token 数
+            keep_recent: 保留原文、不参与压缩的最近消息数
+            max_concurrency: 同时进行的最大压缩任务数
+        """
+        self.client_factory = client_factory
+        self.threshold = threshold
+        self.keep_recent = keep_recent
+        self._client: Optional[BaseLLMClient] = None
+        self._semaphore = asyncio.Semaphore(max(max_concurrency, 1))
+        self._tasks: Dict[str, "asyncio.Task[None]"] = {}
+
+        self._latency = metrics.histogram("history_compaction_seconds")
+        self._tokens_saved = metrics.counter("history_compaction_tokens_saved_total")
+        self._results = {
+            result: metrics.counter("history_compactions_total", {"result": result})
+            for result in ("applied", "stale", "skipped", "error")
+        }
+
+    @property
+    def client(self) -> BaseLLMClient:
+        """摘要模型客户端"""
+        if self._client is None:
+            self._client = self.client_factory()
+        return self._client
+
+    def pending(self, session_id: str) -> Optional["asyncio.Task[None]"]:
+        """获取会话正在进行的压缩任务"""
+        return self._tasks.get(session_id)
+
+    async def maybe_schedule(self, session_id: str) -> Optional["asyncio.Task[None]"]:
+        """
+        会话历史超过阈值时安排一次后台压缩
+
+        同一会话同时最多只有一个压缩任务。
+
+        Args:
+            session_id: 会话 ID
+
+        Returns:
+            新创建的压缩任务，未安排时返回 None
+        """
+        if session_id in self._tasks:
+            return None
+        session = await chat_history.session_store.get(session_id)
+        # 读取期间可能已为同一会话安排了压缩
+        if session_id in self._tasks:
+            return None
+        if session is None or sum(session.token_counts) <= self.threshold:
+            return None
+        count = len(session.messages) - self.keep_recent
+        if count < 2:
+            return None
+
+        prefix = list(session.messages[:count])
+        task = asyncio.create_task(self._compact(session_id, prefix))
+        self._tasks[session_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(session_id, None))
+        return task
+
+    async def _compact(self, session_id: str, prefix: List[Dict[str, Any]]) -> None:
+        """总结 prefix 中的消息，并在它们仍是会话历史开头时替换掉"""
+        async with self._semaphore:
+            started = time.monotonic()
+            try:
+                summary = await self.client.chat(
+                    messages=[
+                        {"role": "system", "content": SUMMARY_PROMPT},
+                        {"role": "user", "content": format_transcript(prefix)},
+                    ],
+                    temperature=0.0,
+                )
+            except Exception as e:
+                self._results["error"].inc()
+                print(f"压缩会话 {session_id} 的历史失败: {e}")
+                return
+            finally:
+                self._latency.observe(time.monotonic() - started)
+
+        message = {"role": "system", "content": SUMMARY_PREFIX + summary}
+        saved = await chat_history.replace_history_prefix(session_id, prefix, message)
+        if saved is None:
+            self._results["stale"].inc()
+        elif saved <= 0:
+            self._results["skipped"].inc()
+        else:
+            self._results["applied"].inc()
+            self._tokens_saved.inc(saved)
+
+    async def drain(self) -> None:
+        """等待所有正在进行的压缩任务结束"""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks.values()), return_exceptions=True)
+
+
+def _build_summary_client() -> BaseLLMClient:
+    """
+    摘要模型客户端（默认使用对话模型）
+
+    从提供者注册表获取，摘要请求和对话请求一样经过熔断器和客户端限流，客户端由注册表关闭。
+    """
+    return get_provider_registry().get("summary")
+
+
+# 全局压缩器实例
+compactor: Optional[HistoryCompactor] = None
+
+
+def get_compactor() -> HistoryCompactor:
+    """获取压缩器实例（单例模式）"""
+    global compactor
+    if compactor is None:
+        compactor = HistoryCompactor(
+            _build_summary_client,
+            threshold=settings.history_compaction_threshold,
+            keep_recent=settings.history_compaction_keep_recent,
+            max_concurrency=settings.history_compaction_max_concurrency,
+        )
+    return compactor
@@ -0,0 +1,136 @@
+"""会话历史存储后端接口"""
+
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Protocol, Sequence, Tuple
+
+
+class SessionData(Protocol):
+    """后端返回的会话：按时间顺序的历史消息和每条消息的估算 token 数"""
+
+    @property
+    def messages(self) -> Sequence[Dict[str, Any]]: ...
+
+    @property
+    def token_counts(self) -> Sequence[int]: ...
+
+
+class Session:
+    """以列表保存的会话（持久化后端读出的会话）"""
+
+    __slots__ = ("messages", "token_counts", "nbytes", "last_access")
+
+    def __init__(self, now: float):
+        self.messages: List[Dict[str, Any]] = []
+        self.token_counts: List[int] = []
+        self.nbytes = 0
+        self.last_access = now
+
+
+class SessionBackend(ABC):
+    """
+    会话历史存储后端基类
+
+    读写方法都是协程，在事件循环中调用：需要网络或磁盘 I/O 的实现应使用异步客户端，
+    或把 I/O 放到线程中执行，不能阻塞事件循环。flush() 可能在后台线程中调用。
+    """
+
+    @abstractmethod
+    async def get(self, session_id: str) -> Optional[SessionData]:
+        """
+        读取会话
+
+        Args:
+            session_id: 会话 ID
+
+        Returns:
+            会话，不存在时返回 None
+        """
+        pass
+
+    @abstractmethod
+    async def append(
+        self, session_id: str, message: Dict[str, Any], tokens: int
+    ) -> None:
+        """
+        追加一条消息（会话不存在时创建），超过每会话消息数上限时丢弃最早的消息
+
+        Args:
+            session_id: 会话 ID
+            message: 消息
+            tokens: 消息的估算 token 数
+        """
+        pass
+
+    async def append_many(
+        self, session_id: str, entries: List[Tuple[Dict[str, Any], int]]
+    ) -> None:
+        """
+        依次追加多条消息（远程后端应覆盖此方法，在一次往返中完成）
+
+        Args:
+            session_id: 会话 ID
+            entries: (消息, 估算 token 数) 列表
+        """
+        for message, tokens in entries:
+            await self.append(session_id, message, tokens)
+
+    @abstractmethod
+    async def replace(
+        self,
+        session_id: str,
+        messages: List[Dict[str, Any]],
+        token_counts: List[int],
+    ) -> None:
+        """整体替换会话的历史消息（会话不存在时创建）"""
+        pass
+
+    async def replace_prefix(
+        self,
+        session_id: str,
+        prefix: List[Dict[str, Any]],
+        message: Dict[str, Any],
+        tokens: int,
+    ) -> Optional[int]:
+        """
+        若 prefix 仍是会话历史的开头，把它替换为一条消息（比较和替换是原子的）
+
+        默认实现读取会话后比较并整体替换，两者之间不让出事件循环（replace 不应挂起），
+        只适用于单进程内的后端；多个进程共享的后端应覆盖此方法。
+
+        Args:
+            session_id: 会话 ID
+            prefix: 要替换的消息
+            message: 替换后的消息
+            tokens: 替换后的消息的估算 token 数
+
+        Returns:
+            节省的估算 token 数；prefix 已不是历史开头时返回 None，
+            替换后不能节省 token 时不做替换
+        """
+        session = await self.get(session_id)
+        if session is None or len(session.messages) < len(prefix):
+            return None
+        if any(old != new for old, new in zip(session.messages, prefix)):
+            return None
+        saved = sum(session.token_counts[: len(prefix)]) - tokens
+        if saved <= 0:
+            return saved
+        await self.replace(
+            session_id,
+            [message] + list(session.messages[len(prefix) :]),
+            [tokens] + list(session.token_counts[len(prefix) :]),
+        )
+        return saved
+
+    @abstractmethod
+    async def delete(self, session_id: str) -> bool:
+        """删除会话，返回会话是否存在"""
+        pass
+
+    def flush(self) -> None:
+        """把缓冲的写入落盘（默认无操作）"""
+        pass
+
+    async def close(self) -> None:
+        """关闭后端，释放资源前写入所有缓冲的数据"""
+        self.flush()
@@ -0,0 +1,120 @@
+"""会话级串行化：按会话加锁的分片锁表"""
+
+import asyncio
+from typing import Dict, List, Optional
+
+from app.config import settings
+from app.metrics import metrics
+
+
+class _SessionLock:
+    """单个会话的锁及其使用者计数（计数归零时从锁表移除）"""
+
+    __slots__ = ("lock", "users")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+
+class SessionLockHandle:
+    """已持有的会话锁，可多次调用 release（只有第一次生效）"""
+
+    def __init__(self, table: "SessionLockTable", session_id: str, entry: _SessionLock):
+        self.table = table
+        self.session_id = session_id
+        self.entry = entry
+        self.released = False
+
+    def release(self) -> None:
+        """释放会话锁"""
+        if self.released:
+            return
+        self.released = True
+        self.entry.lock.release()
+        self.table._leave(self.session_id, self.entry)
+
+    async def __aenter__(self) -> "SessionLockHandle":
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+
+class SessionLockTable:
+    """
+    按会话 ID 加锁的分片锁表
+
+    同一会话的请求按到达顺序串行执行，不同会话使用各自独立的锁，完全并行。
+    锁按需创建，没有使用者时立即移除，锁表大小只与活跃会话数有关。
+    """
+
+    def __init__(self, shards: int = 64):
+        """
+        初始化锁表
+
+        Args:
+            shards: 分片数，会话按哈希分散到各分片中
+        """
+        self._shards: List[Dict[str, _SessionLock]] = [{} for _ in range(shards)]
+        self._waiting = metrics.gauge("session_lock_waiting")
+        self._wait_time = metrics.histogram("session_lock_wait_seconds")
+
+    def _shard(self, session_id: str) -> Dict[str, _SessionLock]:
+        return self._shards[hash(session_id) % len(self._shards)]
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self._shards)
+
+    async def acquire(self, session_id: str) -> SessionLockHandle:
+        """
+        获取会话锁，同一会话已有请求在执行时排队等待
+
+        Args:
+            session_id: 会话 ID
+
+        Returns:
+            已持有的会话锁，使用完毕后必须 release
+        """
+        shard = self._shard(session_id)
+        entry = shard.get(session_id)
+        if entry is None:
+            entry = _SessionLock()
+            shard[session_id] = entry
+        entry.users += 1
+
+        if not entry.lock.locked():
+            await entry.lock.acquire()
+            return SessionLockHandle(self, session_id, entry)
+
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        self._waiting.inc()
+        try:
+            await entry.lock.acquire()
+        except BaseException:
+            self._leave(session_id, entry)
+            raise
+        finally:
+            self._waiting.dec()
+            self._wait_time.observe(loop.time() - started)
+        return SessionLockHandle(self, session_id, entry)
+
+    def _leave(self, session_id: str, entry: _SessionLock) -> None:
+        entry.users -= 1
+        if entry.users == 0:
+            shard = self._shard(session_id)
+            if shard.get(session_id) is entry:
+                del shard[session_id]
+
+
+# 全局会话锁表实例
+session_locks: Optional[SessionLockTable] = None
+
+
+def get_session_locks() -> SessionLockTable:
+    """获取会话锁表实例（单例模式）"""
+    global session_locks
+    if session_locks is None:
+        session_locks = SessionLockTable(settings.session_lock_shards)
+    return session_locks
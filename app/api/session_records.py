@@ -0,0 +1,264 @@
+"""紧凑的会话历史表示：__slots__ 消息记录、内容去重池、环形缓冲区和零拷贝视图"""
+
+import sys
+from typing import Any, Dict, Hashable, Iterator, List, Optional, Sequence, Union
+
+from app.models.encoding import EncodedMessage, encode_json
+
+
+class MessageRecord:
+    """
+    一条历史消息：角色（驻留字符串）、内容（来自去重池）、估算 token 数，
+    以及可选的缓存 JSON 编码（拼接请求体时直接复用）
+    """
+
+    __slots__ = ("role", "content", "tokens", "encoded")
+
+    def __init__(
+        self, role: str, content: Any, tokens: int, encoded: Optional[bytes] = None
+    ):
+        self.role = role
+        self.content = content
+        self.tokens = tokens
+        self.encoded = encoded
+
+    def as_dict(self) -> Dict[str, Any]:
+        """转换为发送给模型的消息字典（内容不复制，带上缓存的编码）"""
+        message = {"role": self.role, "content": self.content}
+        if self.encoded is None:
+            return message
+        return EncodedMessage(message, self.encoded)
+
+
+# 单条记录的内存开销（对象本身 + 列表中的一个指针）
+RECORD_BYTES = sys.getsizeof(MessageRecord("user", "", 0)) + 8
+
+
+class _PoolEntry:
+    __slots__ = ("value", "refs", "nbytes")
+
+    def __init__(self, value: Any, nbytes: int):
+        self.value = value
+        self.refs = 0
+        self.nbytes = nbytes
+
+
+# 内容池中每个条目的额外开销（条目对象 + 字典槽位）
+POOL_ENTRY_BYTES = sys.getsizeof(_PoolEntry("", 0)) + 100
+
+
+def estimate_content_bytes(content: Any) -> int:
+    """估算消息内容占用的内存字节数"""
+    if isinstance(content, str):
+        return sys.getsizeof(content)
+    if isinstance(content, list):
+        total = sys.getsizeof(content)
+        for part in content:
+            total += estimate_content_bytes(part)
+        return total
+    if isinstance(content, dict):
+        return sys.getsizeof(content) + sum(
+            estimate_content_bytes(value) for value in content.values()
+        )
+    return sys.getsizeof(content)
+
+
+class ContentPool:
+    """
+    按内容寻址的去重池
+
+    内容相同的消息（例如大量会话中相同的提示词、常见的简短回复）共享同一个对象，
+    按引用计数释放。池中的内容被多个会话共享，不能原地修改。
+    """
+
+    def __init__(self):
+        self._entries: Dict[Hashable, _PoolEntry] = {}
+        self.nbytes = 0
+        self.hits = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _key(content: Any) -> Optional[Hashable]:
+        if isinstance(content, (str, bytes)):
+            return content
+        if isinstance(content, (list, dict)):
+            # 多模态内容按规范化 JSON 寻址，与字符串内容区分
+            return ("json", encode_json(content))
+        return None
+
+    def acquire(self, content: Any) -> Any:
+        """
+        获取内容的共享对象，引用计数加一
+
+        Args:
+            content: 消息内容
+
+        Returns:
+            与 content 相等的共享对象（无法寻址的内容原样返回）
+        """
+        key = self._key(content)
+        if key is None:
+            return content
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = _PoolEntry(
+                content, estimate_content_bytes(content) + POOL_ENTRY_BYTES
+            )
+            self._entries[key] = entry
+            self.nbytes += entry.nbytes
+        else:
+            self.hits += 1
+        entry.refs += 1
+        return entry.value
+
+    def release(self, content: Any) -> None:
+        """引用计数减一，归零时从池中移除"""
+        key = self._key(content)
+        if key is None:
+            return
+        entry = self._entries.get(key)
+        if entry is None:
+            return
+        entry.refs -= 1
+        if entry.refs <= 0:
+            del self._entries[key]
+            self.nbytes -= entry.nbytes
+
+
+class MessagesView(Sequence):
+    """
+    会话历史的只读视图
+
+    切片返回新的视图而不复制记录，只在逐条读取时生成消息字典。
+    视图直接引用会话的环形缓冲区，缓冲区写满后的新消息会覆盖视图中的内容，
+    应在持有会话锁的一次请求内使用，不要长期保存。
+    """
+
+    __slots__ = ("_records", "_head", "_start", "_stop")
+
+    def __init__(
+        self,
+        records: List[MessageRecord],
+        head: int = 0,
+        start: int = 0,
+        stop: Optional[int] = None,
+    ):
+        self._records = records
+        self._head = head
+        self._start = start
+        self._stop = len(records) if stop is None else stop
+
+    def _record(self, index: int) -> MessageRecord:
+        return self._records[(self._head + index) % len(self._records)]
+
+    def _item(self, record: MessageRecord) -> Any:
+        return record.as_dict()
+
+    def __len__(self) -> int:
+        return max(self._stop - self._start, 0)
+
+    def __getitem__(self, index: Union[int, slice]) -> Any:
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            return type(self)(
+                self._records,
+                self._head,
+                self._start + start,
+                self._start + max(start, stop),
+            )
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("history index out of range")
+        return self._item(self._record(self._start + index))
+
+    def __iter__(self) -> Iterator[Any]:
+        for i in range(self._start, self._stop):
+            yield self._item(self._record(i))
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Sequence) or isinstance(other, (str, bytes)):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({list(self)!r})"
+
+
+class TokenCountsView(MessagesView):
+    """会话历史每条消息估算 token 数的只读视图"""
+
+    __slots__ = ()
+
+    def _item(self, record: MessageRecord) -> int:
+        return record.tokens
+
+
+class CompactSession:
+    """
+    紧凑的会话：消息记录保存在定长环形缓冲区中
+
+    达到容量后新消息覆盖最早的消息，不需要切片重建列表。
+    """
+
+    __slots__ = ("_records", "_head", "nbytes", "last_access")
+
+    def __init__(self, now: float):
+        self._records: List[MessageRecord] = []
+        self._head = 0  # 缓冲区已满时最早一条消息的位置
+        self.nbytes = 0
+        self.last_access = now
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def records(self) -> Iterator[MessageRecord]:
+        """按时间顺序遍历所有记录"""
+        records = self._records
+        for i in range(len(records)):
+            yield records[(self._head + i) % len(records)]
+
+    def push(self, record: MessageRecord, capacity: int) -> Optional[MessageRecord]:
+        """
+        追加一条记录
+
+        Args:
+            record: 消息记录
+            capacity: 缓冲区容量
+
+        Returns:
+            缓冲区已满时被覆盖的最早一条记录，否则为 None
+        """
+        records = self._records
+        if len(records) < capacity:
+            records.append(record)
+            return None
+        if not records:
+            return record
+        dropped = records[self._head]
+        records[self._head] = record
+        self._head = (self._head + 1) % len(records)
+        return dropped
+
+    def reset(self, records: List[MessageRecord]) -> None:
+        """用新的记录整体替换"""
+        self._records = records
+        self._head = 0
+
+    @property
+    def messages(self) -> MessagesView:
+        """历史消息视图"""
+        return MessagesView(self._records, self._head)
+
+    @property
+    def token_counts(self) -> TokenCountsView:
+        """每条历史消息估算 token 数的视图"""
+        return TokenCountsView(self._records, self._head)
+
+
+# 单个会话的固定内存开销（会话对象、记录列表，以及会话 ID 字符串和 LRU 表中的条目）
+SESSION_OVERHEAD_BYTES = sys.getsizeof(CompactSession(0.0)) + sys.getsizeof([]) + 200
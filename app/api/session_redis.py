@@ -0,0 +1,172 @@
+"""Redis 会话存储后端（多个 worker 进程共享会话）"""
+
+from typing import Any, Dict, List, Optional, Tuple
+
+import redis.asyncio as redis
+from redis.exceptions import WatchError
+
+from app import codec
+from app.api.session_backend import Session, SessionBackend
+from app.metrics import metrics
+from app.models.encoding import EncodedMessage, encode_message
+
+
+class RedisSessionBackend(SessionBackend):
+    """
+    基于 Redis 协议的会话存储
+
+    每个会话保存为两个有长度上限的列表（消息 JSON 和估算 token 数），空闲超过 ttl
+    后由 Redis 过期删除。读取和写入各通过一个 pipeline 完成，每次调用只需一次往返；
+    写入使用 MULTI/EXEC，两个列表始终保持一致。使用 redis.asyncio 客户端，
+    网络 I/O 不阻塞事件循环。
+    """
+
+    def __init__(
+        self,
+        client: "redis.Redis",
+        max_messages: int = 100,
+        ttl: int = 3600,
+        key_prefix: str = "chat:",
+    ):
+        """
+        初始化 Redis 后端
+
+        Args:
+            client: Redis 异步客户端（建议设置较短的 socket 超时）
+            max_messages: 每个会话最多保存的消息数
+            ttl: 会话空闲过期时间（秒），小于等于 0 表示不过期
+            key_prefix: 键前缀
+        """
+        self.client = client
+        self.max_messages = max_messages
+        self.ttl = ttl
+        self.key_prefix = key_prefix
+        self._round_trips = metrics.counter("session_store_round_trips_total")
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs) -> "RedisSessionBackend":
+        """按 URL 创建后端，例如 redis://localhost:6379/0"""
+        client = redis.Redis.from_url(
+            url, socket_timeout=1.0, socket_connect_timeout=1.0
+        )
+        return cls(client, **kwargs)
+
+    def _keys(self, session_id: str) -> Tuple[str, str]:
+        # 花括号是 Redis Cluster 的 hash tag，保证同一会话的两个键在同一个分片
+        base = f"{self.key_prefix}{{{session_id}}}"
+        return f"{base}:messages", f"{base}:tokens"
+
+    def _expire(self, pipe: "redis.client.Pipeline", *keys: str) -> None:
+        if self.ttl > 0:
+            for key in keys:
+                pipe.expire(key, self.ttl)
+
+    async def get(self, session_id: str) -> Optional[Session]:
+        """读取会话并刷新空闲过期时间（一次往返）"""
+        messages_key, tokens_key = self._keys(session_id)
+        pipe = self.client.pipeline(transaction=False)
+        pipe.lrange(messages_key, 0, -1)
+        pipe.lrange(tokens_key, 0, -1)
+        self._expire(pipe, messages_key, tokens_key)
+        raw_messages, raw_tokens = (await pipe.execute())[:2]
+        self._round_trips.inc()
+        if not raw_messages:
+            return None
+
+        session = Session(0.0)
+        # 列表中保存的就是消息的规范化编码，拼接请求体时直接复用
+        session.messages = [
+            EncodedMessage(codec.loads(raw), raw) for raw in raw_messages
+        ]
+        session.token_counts = [int(raw) for raw in raw_tokens]
+        return session
+
+    async def append(
+        self, session_id: str, message: Dict[str, Any], tokens: int
+    ) -> None:
+        """追加一条消息"""
+        await self.append_many(session_id, [(message, tokens)])
+
+    async def append_many(
+        self, session_id: str, entries: List[Tuple[Dict[str, Any], int]]
+    ) -> None:
+        """追加多条消息并裁剪到消息数上限（一次往返）"""
+        if not entries:
+            return
+        messages_key, tokens_key = self._keys(session_id)
+        pipe = self.client.pipeline(transaction=True)
+        pipe.rpush(messages_key, *[encode_message(message) for message, _ in entries])
+        pipe.rpush(tokens_key, *[tokens for _, tokens in entries])
+        # 保留最近的 N 条消息（从后往前取）
+        pipe.ltrim(messages_key, -self.max_messages, -1)
+        pipe.ltrim(tokens_key, -self.max_messages, -1)
+        self._expire(pipe, messages_key, tokens_key)
+        await pipe.execute()
+        self._round_trips.inc()
+
+    async def replace(
+        self,
+        session_id: str,
+        messages: List[Dict[str, Any]],
+        token_counts: List[int],
+    ) -> None:
+        """整体替换会话的历史消息（一次往返）"""
+        messages_key, tokens_key = self._keys(session_id)
+        pipe = self.client.pipeline(transaction=True)
+        pipe.delete(messages_key, tokens_key)
+        if messages:
+            pipe.rpush(messages_key, *[encode_message(message) for message in messages])
+            pipe.rpush(tokens_key, *token_counts)
+            self._expire(pipe, messages_key, tokens_key)
+        await pipe.execute()
+        self._round_trips.inc()
+
+    async def replace_prefix(
+        self,
+        session_id: str,
+        prefix: List[Dict[str, Any]],
+        message: Dict[str, Any],
+        tokens: int,
+    ) -> Optional[int]:
+        """
+        若 prefix 仍是会话历史的开头，把它替换为一条消息
+
+        WATCH 两个列表后读取开头的 len(prefix) 条消息并比较编码，再在 MULTI/EXEC 中
+        裁掉 prefix、在头部插入新消息；比较之后其他 worker 修改了会话时事务不执行，
+        重新比较，期间追加的消息不会被覆盖。
+        """
+        messages_key, tokens_key = self._keys(session_id)
+        expected = [encode_message(old) for old in prefix]
+        async with self.client.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(messages_key, tokens_key)
+                    raw_messages = await pipe.lrange(messages_key, 0, len(prefix) - 1)
+                    raw_tokens = await pipe.lrange(tokens_key, 0, len(prefix) - 1)
+                    self._round_trips.inc(3)
+                    if raw_messages != expected:
+                        return None
+                    saved = sum(int(raw) for raw in raw_tokens) - tokens
+                    if saved <= 0:
+                        return saved
+                    pipe.multi()
+                    pipe.ltrim(messages_key, len(prefix), -1)
+                    pipe.ltrim(tokens_key, len(prefix), -1)
+                    pipe.lpush(messages_key, encode_message(message))
+                    pipe.lpush(tokens_key, tokens)
+                    self._expire(pipe, messages_key, tokens_key)
+                    await pipe.execute()
+                    self._round_trips.inc()
+                    return saved
+                except WatchError:
+                    continue
+
+    async def delete(self, session_id: str) -> bool:
+        """删除会话"""
+        deleted = await self.client.delete(*self._keys(session_id))
+        self._round_trips.inc()
+        return deleted > 0
+
+    async def close(self) -> None:
+        """关闭连接池"""
+        await self.client.aclose()
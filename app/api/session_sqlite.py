@@ -0,0 +1,462 @@
+"""SQLite 会话存储后端（WAL 模式，延迟批量写入）"""
+
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from app import codec
+from app.api.session_backend import Session, SessionBackend
+from app.metrics import metrics
+from app.models.encoding import EncodedMessage, encode_message
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS session_messages (
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    message BLOB NOT NULL,
+    tokens INTEGER NOT NULL,
+    PRIMARY KEY (session_id, seq)
+)
+"""
+
+_INSERT = (
+    "INSERT INTO session_messages (session_id, seq, message, tokens) "
+    "VALUES (?, ?, ?, ?)"
+)
+
+# 只保留会话最近的 N 条消息
+_TRIM = (
+    "DELETE FROM session_messages WHERE session_id = ? AND seq NOT IN "
+    "(SELECT seq FROM session_messages WHERE session_id = ? ORDER BY seq DESC LIMIT ?)"
+)
+
+
+class _Pending:
+    """一个会话尚未写入数据库的操作：是否先清空已有的消息，以及之后追加的消息"""
+
+    __slots__ = ("reset", "entries")
+
+    def __init__(self, reset: bool):
+        self.reset = reset
+        self.entries: List[Tuple[Dict[str, Any], int]] = []
+
+
+class SQLiteSessionBackend(SessionBackend):
+    """
+    基于 SQLite 的会话存储
+
+    数据库使用 WAL 模式，同一台机器上的多个进程可以共享历史，重启后历史仍然存在。
+    每条消息一行，写入只修改内存中的会话并记录待写入的操作，由后台线程按时间间隔
+    或脏会话数阈值在一个事务中批量写入：追加只插入新消息，替换和删除先删除会话的
+    已有行，多个进程写入同一会话时不会互相覆盖。请求路径上没有同步磁盘写。
+    最近使用的会话保存在读缓存中，有未落盘写入的会话不会被移出缓存。
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_messages: int = 100,
+        flush_interval: float = 1.0,
+        flush_batch_size: int = 64,
+        cache_size: int = 1024,
+        cache_ttl: float = 5.0,
+        start_flusher: bool = True,
+    ):
+        """
+        初始化 SQLite 后端
+
+        Args:
+            path: 数据库文件路径
+            max_messages: 每个会话最多保存的消息数
+            flush_interval: 后台写入间隔（秒）
+            flush_batch_size: 脏会话数达到该值时立即唤醒后台写入
+            cache_size: 读缓存的最大会话数
+            cache_ttl: 读缓存中未修改的会话多久后重新从数据库读取（秒），
+                使其他进程的写入可见
+            start_flusher: 是否启动后台写入线程（关闭时需手动调用 flush）
+        """
+        self.path = path
+        self.max_messages = max_messages
+        self.flush_interval = flush_interval
+        self.flush_batch_size = flush_batch_size
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._read_conn = self._connect()
+        self._write_conn = self._connect()
+        self._write_conn.execute(_SCHEMA)
+
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._cache: "OrderedDict[str, Session]" = OrderedDict()
+        self._pending: Dict[str, _Pending] = {}
+        # 正在写入数据库的操作，写入完成前会话视同有未落盘写入
+        self._flushing: Dict[str, _Pending] = {}
+
+        self._dirty_gauge = metrics.gauge("session_store_dirty")
+        self._flush_time = metrics.histogram("session_store_flush_seconds")
+        self._flushed_rows = metrics.counter("session_store_flushed_rows_total")
+        self._flush_errors = metrics.counter("session_store_flush_errors_total")
+        self._cache_hits = metrics.counter("session_store_cache_hits_total")
+        self._cache_misses = metrics.counter("session_store_cache_misses_total")
+
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        if start_flusher:
+            self._thread = threading.Thread(
+                target=self._run, name="session-flush", daemon=True
+            )
+            self._thread.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        # 自动提交模式，写事务由 _transaction() 显式开始
+        conn = sqlite3.connect(
+            self.path, check_same_thread=False, timeout=5.0, isolation_level=None
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """写事务：BEGIN IMMEDIATE 开始时即获取写锁，多个进程的读-改-写不会交错"""
+        conn = self._write_conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+
+    def _pinned(self, session_id: str) -> bool:
+        return session_id in self._pending or session_id in self._flushing
+
+    def _deleted_pending(self, session_id: str) -> bool:
+        """会话已删除、删除尚未提交，且之后没有重新写入（在锁内调用）"""
+        pending = self._pending.get(session_id)
+        if pending is None:
+            pending = self._flushing.get(session_id)
+        return pending is not None and pending.reset and not pending.entries
+
+    def _cached(self, session_id: str) -> Optional[Session]:
+        """读缓存中可直接使用的会话：有未落盘写入，或未超过 cache_ttl（在锁内调用）"""
+        session = self._cache.get(session_id)
+        if session is not None and (
+            self._pinned(session_id)
+            or time.monotonic() - session.last_access < self.cache_ttl
+        ):
+            self._cache.move_to_end(session_id)
+            return session
+        return None
+
+    async def get(self, session_id: str) -> Optional[Session]:
+        """读取会话：优先从读缓存中读取，未命中时在线程中读取数据库"""
+        with self._lock:
+            if self._deleted_pending(session_id):
+                return None
+            session = self._cached(session_id)
+        if session is not None:
+            self._cache_hits.inc()
+            return session
+        self._cache_misses.inc()
+        return await asyncio.to_thread(self._load, session_id)
+
+    def _load(self, session_id: str) -> Optional[Session]:
+        """
+        从数据库读取会话并放入读缓存（在线程中执行）
+
+        读取和检查期间持有写入锁，后台线程不会在两者之间提交：读取之后的删除一定
+        还在待写入的操作中，读到的旧行不会让已删除的会话重新出现。
+        """
+        with self._flush_lock:
+            rows = self._read_conn.execute(
+                "SELECT message, tokens FROM session_messages "
+                "WHERE session_id = ? ORDER BY seq",
+                (session_id,),
+            ).fetchall()
+            with self._lock:
+                if self._deleted_pending(session_id):
+                    return None
+                # 读取期间其他请求已写入或读入的会话比读到的行更新
+                session = self._cached(session_id)
+                if session is not None:
+                    return session
+                if not rows:
+                    self._cache.pop(session_id, None)
+                    return None
+                session = Session(time.monotonic())
+                session.messages = [
+                    EncodedMessage(codec.loads(raw), raw) for raw, _ in rows
+                ]
+                session.token_counts = [tokens for _, tokens in rows]
+                self._cache_put(session_id, session)
+                return session
+
+    def _current(self, session_id: str, loaded: Optional[Session]) -> Session:
+        """
+        要修改的会话（在锁内调用）
+
+        get() 可能在线程中读取数据库，返回后会话可能已被删除，或已被其他请求写入新的对象，
+        以缓存中的当前状态为准。
+        """
+        if self._deleted_pending(session_id):
+            return Session(time.monotonic())
+        session = self._cache.get(session_id)
+        if session is not None:
+            return session
+        return loaded or Session(time.monotonic())
+
+    def _cache_put(self, session_id: str, session: Session) -> None:
+        self._cache[session_id] = session
+        self._cache.move_to_end(session_id)
+        if len(self._cache) <= self.cache_size:
+            return
+        # 淘汰最久未使用且没有未落盘写入的会话
+        for candidate in list(self._cache):
+            if len(self._cache) <= self.cache_size:
+                break
+            if candidate != session_id and not self._pinned(candidate):
+                del self._cache[candidate]
+
+    def _mark_dirty(self, session_id: str, session: Session, pending: _Pending) -> None:
+        session.last_access = time.monotonic()
+        self._pending[session_id] = pending
+        self._cache_put(session_id, session)
+        self._dirty_gauge.set(len(self._pending))
+        if len(self._pending) >= self.flush_batch_size:
+            self._wakeup.set()
+
+    def _trim_entries(self, pending: _Pending) -> None:
+        # 超出上限的消息写入后也会被裁掉，不必保留
+        if len(pending.entries) > self.max_messages:
+            del pending.entries[: -self.max_messages]
+
+    async def append(
+        self, session_id: str, message: Dict[str, Any], tokens: int
+    ) -> None:
+        """追加一条消息，只修改缓存中的会话，由后台线程插入数据库"""
+        loaded = await self.get(session_id)
+        with self._lock:
+            session = self._current(session_id, loaded)
+            session.messages.append(message)
+            session.token_counts.append(tokens)
+            overflow = len(session.messages) - self.max_messages
+            if overflow > 0:
+                # 保留最近的 N 条消息（从后往前取）
+                session.messages = session.messages[overflow:]
+                session.token_counts = session.token_counts[overflow:]
+            pending = self._pending.get(session_id) or _Pending(reset=False)
+            pending.entries.append((message, tokens))
+            self._trim_entries(pending)
+            self._mark_dirty(session_id, session, pending)
+
+    async def replace(
+        self,
+        session_id: str,
+        messages: List[Dict[str, Any]],
+        token_counts: List[int],
+    ) -> None:
+        """整体替换会话的历史消息（不需要读取原来的会话）"""
+        session = Session(time.monotonic())
+        session.messages = list(messages)
+        session.token_counts = list(token_counts)
+        pending = _Pending(reset=True)
+        pending.entries = list(zip(messages, token_counts))
+        self._trim_entries(pending)
+        with self._lock:
+            self._mark_dirty(session_id, session, pending)
+
+    async def replace_prefix(
+        self,
+        session_id: str,
+        prefix: List[Dict[str, Any]],
+        message: Dict[str, Any],
+        tokens: int,
+    ) -> Optional[int]:
+        """
+        若 prefix 仍是会话历史的开头，把它替换为一条消息（在线程中执行）
+
+        先写入缓冲的操作，再在 BEGIN IMMEDIATE 事务中读取开头的 len(prefix) 条消息并比较
+        编码，删除这些行并在原位置插入新消息；事务持有写锁，其他进程的写入不会插在
+        比较和替换之间，之后追加的消息也不会被覆盖。
+        """
+        return await asyncio.to_thread(
+            self._replace_prefix, session_id, prefix, message, tokens
+        )
+
+    def _replace_prefix(
+        self,
+        session_id: str,
+        prefix: List[Dict[str, Any]],
+        message: Dict[str, Any],
+        tokens: int,
+    ) -> Optional[int]:
+        expected = [encode_message(old) for old in prefix]
+        with self._flush_lock:
+            self._flush_pending()
+            with self._transaction() as conn:
+                rows = conn.execute(
+                    "SELECT seq, message, tokens FROM session_messages "
+                    "WHERE session_id = ? ORDER BY seq LIMIT ?",
+                    (session_id, len(prefix)),
+                ).fetchall()
+                if [raw for _, raw, _ in rows] != expected:
+                    return None
+                saved = sum(count for _, _, count in rows) - tokens
+                if saved <= 0:
+                    return saved
+                last = rows[-1][0]
+                conn.execute(
+                    "DELETE FROM session_messages WHERE session_id = ? AND seq <= ?",
+                    (session_id, last),
+                )
+                conn.execute(
+                    _INSERT, (session_id, last, encode_message(message), tokens)
+                )
+            with self._lock:
+                self._replace_cached_prefix(session_id, prefix, message, tokens)
+            return saved
+
+    def _replace_cached_prefix(
+        self,
+        session_id: str,
+        prefix: List[Dict[str, Any]],
+        message: Dict[str, Any],
+        tokens: int,
+    ) -> None:
+        """把数据库中的前缀替换同步到读缓存（在锁内调用）"""
+        session = self._cache.get(session_id)
+        pending = self._pending.get(session_id)
+        if session is None or (pending is not None and pending.reset):
+            # 之后的替换或删除会覆盖数据库中的结果
+            return
+        if session.messages[: len(prefix)] == prefix:
+            session.messages = [message] + session.messages[len(prefix) :]
+            session.token_counts = [tokens] + session.token_counts[len(prefix) :]
+        elif not self._pinned(session_id):
+            # 缓存中的会话已过时，下次从数据库读取
+            del self._cache[session_id]
+
+    async def delete(self, session_id: str) -> bool:
+        """删除会话，由后台线程从数据库中删除"""
+        existed = await self.get(session_id) is not None
+        with self._lock:
+            self._cache.pop(session_id, None)
+            self._pending[session_id] = _Pending(reset=True)
+            self._dirty_gauge.set(len(self._pending))
+        return existed
+
+    def _take_pending(self) -> List[Tuple[str, bool, List[Tuple[bytes, int]]]]:
+        """取出所有待写入的操作并编码消息（锁内只交换字典，编码在锁外进行）"""
+        with self._lock:
+            pending = self._pending
+            self._pending = {}
+            self._flushing = pending
+            self._dirty_gauge.set(0)
+        return [
+            (
+                session_id,
+                operation.reset,
+                [
+                    (encode_message(message), tokens)
+                    for message, tokens in operation.entries
+                ],
+            )
+            for session_id, operation in pending.items()
+        ]
+
+    def _write(
+        self,
+        conn: sqlite3.Connection,
+        session_id: str,
+        reset: bool,
+        entries: List[Tuple[bytes, int]],
+    ) -> None:
+        """在事务中写入一个会话的操作：追加的消息接在数据库中已有消息之后"""
+        if reset:
+            conn.execute(
+                "DELETE FROM session_messages WHERE session_id = ?", (session_id,)
+            )
+        if not entries:
+            return
+        (last,) = conn.execute(
+            "SELECT COALESCE(MAX(seq), 0) FROM session_messages WHERE session_id = ?",
+            (session_id,),
+        ).fetchone()
+        conn.executemany(
+            _INSERT,
+            [
+                (session_id, last + offset, raw, tokens)
+                for offset, (raw, tokens) in enumerate(entries, 1)
+            ],
+        )
+        conn.execute(_TRIM, (session_id, session_id, self.max_messages))
+
+    def flush(self) -> None:
+        """在一个事务中写入所有待写入的操作"""
+        with self._flush_lock:
+            self._flush_pending()
+
+    def _flush_pending(self) -> None:
+        """写入所有待写入的操作（持有写入锁时调用）"""
+        pending = self._take_pending()
+        if not pending:
+            return
+        started = time.monotonic()
+        try:
+            with self._transaction() as conn:
+                for session_id, reset, entries in pending:
+                    self._write(conn, session_id, reset, entries)
+        except sqlite3.Error as e:
+            self._flush_errors.inc()
+            print(f"写入会话历史失败: {e}")
+            with self._lock:
+                # 写入失败时放回，排在期间的新写入之前，下次继续写入
+                for session_id, failed in self._flushing.items():
+                    later = self._pending.get(session_id)
+                    if later is None:
+                        self._pending[session_id] = failed
+                    elif not later.reset:
+                        failed.entries.extend(later.entries)
+                        self._trim_entries(failed)
+                        self._pending[session_id] = failed
+                self._dirty_gauge.set(len(self._pending))
+            return
+        finally:
+            with self._lock:
+                self._flushing = {}
+            self._flush_time.observe(time.monotonic() - started)
+        self._flushed_rows.inc(sum(len(entries) for _, _, entries in pending))
+
+    def _run(self) -> None:
+        """后台写入线程：按时间间隔或被脏会话数阈值唤醒后写入"""
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    async def close(self) -> None:
+        """停止后台写入线程，写入剩余数据并关闭数据库连接（在线程中执行）"""
+        await asyncio.to_thread(self.shutdown)
+
+    def shutdown(self) -> None:
+        """停止后台写入线程，写入剩余数据并关闭数据库连接"""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        self._read_conn.close()
+        self._write_conn.close()
@@ -0,0 +1,263 @@
+"""有界的会话存储：空闲过期、会话数上限和内存上限"""
+
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from app.api.session_backend import SessionBackend
+from app.api.session_records import (
+    RECORD_BYTES,
+    SESSION_OVERHEAD_BYTES,
+    CompactSession,
+    ContentPool,
+    MessageRecord,
+    estimate_content_bytes,
+)
+from app.metrics import metrics
+from app.models.encoding import encode_message
+
+# 内容去重的消息角色：提示词和用户消息经常重复（相同的 system 提示词、
+# 「继续」「谢谢」等简短回复），模型回复几乎都是唯一的，去重只会增加池的开销
+DEDUP_ROLES = frozenset({"system", "user"})
+
+
+class SessionStore(SessionBackend):
+    """
+    内存会话存储（默认后端）
+
+    会话按最近访问时间排序：空闲超过 ttl 的会话过期删除；会话数或估算内存
+    超过上限时淘汰最久未访问的会话。
+
+    为支撑大量同时在线的会话，每条消息保存为 __slots__ 记录而不是字典，角色字符串
+    驻留，内容相同的提示词和用户消息通过去重池共享同一个对象，每个会话的消息
+    保存在定长环形缓冲区中。内存占用 = 各会话的记录和模型回复 + 去重池中的内容
+    （近似估算）。
+    """
+
+    def __init__(
+        self,
+        max_messages: int = 100,
+        ttl: float = 3600.0,
+        max_sessions: int = 10000,
+        max_bytes: int = 256 * 1024 * 1024,
+        cache_json: bool = True,
+    ):
+        """
+        初始化会话存储
+
+        Args:
+            max_messages: 每个会话最多保存的消息数，超过后丢弃最早的消息
+            ttl: 会话空闲过期时间（秒），小于等于 0 表示不过期
+            max_sessions: 最大会话数，小于等于 0 表示不限制
+            max_bytes: 估算内存上限（字节），小于等于 0 表示不限制
+            cache_json: 是否为每条消息缓存 JSON 编码（用更多内存换取更少的序列化开销）
+        """
+        self.max_messages = max_messages
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.cache_json = cache_json
+        self._sessions: "OrderedDict[str, CompactSession]" = OrderedDict()
+        self._pool = ContentPool()
+        # 各会话结构开销（会话对象和消息记录）之和，不含去重池中的内容
+        self._session_bytes = 0
+
+        self._size = metrics.gauge("session_store_sessions")
+        self._bytes = metrics.gauge("session_store_bytes")
+        self._pool_size = metrics.gauge("session_store_content_pool_entries")
+        self._evictions = {
+            reason: metrics.counter("session_store_evictions_total", {"reason": reason})
+            for reason in ("ttl", "max_sessions", "max_bytes")
+        }
+        self.evictions = {reason: 0 for reason in self._evictions}
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __contains__(self, session_id: str) -> bool:
+        return self._touch(session_id) is not None
+
+    @property
+    def nbytes(self) -> int:
+        """估算的内存占用（字节）"""
+        return self._session_bytes + self._pool.nbytes
+
+    async def get(self, session_id: str) -> Optional[CompactSession]:
+        """读取会话并刷新访问时间；不存在或已过期时返回 None"""
+        return self._touch(session_id)
+
+    def _touch(self, session_id: str) -> Optional[CompactSession]:
+        now = time.monotonic()
+        self._expire(now)
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        session.last_access = now
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def get_or_create(self, session_id: str) -> CompactSession:
+        """读取会话，不存在时创建"""
+        session = self._touch(session_id)
+        if session is None:
+            session = CompactSession(time.monotonic())
+            self._sessions[session_id] = session
+            self._resize(session, SESSION_OVERHEAD_BYTES)
+            self._enforce_limits(keep=session_id)
+        return session
+
+    async def append(
+        self, session_id: str, message: Dict[str, Any], tokens: int
+    ) -> None:
+        """
+        追加一条消息，超过每会话消息数上限时丢弃最早的消息
+
+        Args:
+            session_id: 会话 ID
+            message: 消息
+            tokens: 消息的估算 token 数
+        """
+        session = self.get_or_create(session_id)
+        # 缓冲区已满时覆盖最早的消息，只保留最近的 N 条
+        record = self._record(message, tokens)
+        delta = self._record_bytes(record)
+        dropped = session.push(record, self.max_messages)
+        if dropped is not None:
+            self._release(dropped)
+            delta -= self._record_bytes(dropped)
+        self._resize(session, delta)
+        self._enforce_limits(keep=session_id)
+
+    async def replace(
+        self,
+        session_id: str,
+        messages: List[Dict[str, Any]],
+        token_counts: List[int],
+    ) -> None:
+        """整体替换会话的历史消息（会话不存在时创建）"""
+        session = self.get_or_create(session_id)
+        # 先裁剪再创建记录：丢弃的消息不占用去重池的引用
+        records = [
+            self._record(message, tokens)
+            for message, tokens in zip(
+                messages[-self.max_messages :], token_counts[-self.max_messages :]
+            )
+        ]
+        self._release_all(session)
+        session.reset(records)
+        self._resize(
+            session,
+            SESSION_OVERHEAD_BYTES
+            + sum(self._record_bytes(record) for record in records)
+            - session.nbytes,
+        )
+        self._enforce_limits(keep=session_id)
+
+    async def delete(self, session_id: str) -> bool:
+        """删除会话，返回会话是否存在"""
+        return self._remove(session_id)
+
+    def _remove(self, session_id: str) -> bool:
+        session = self._sessions.pop(session_id, None)
+        if session is None:
+            return False
+        self._release_all(session)
+        self._session_bytes -= session.nbytes
+        self._update_gauges()
+        return True
+
+    def clear(self) -> None:
+        """清空所有会话"""
+        self._sessions.clear()
+        self._pool = ContentPool()
+        self._session_bytes = 0
+        self._update_gauges()
+
+    def stats(self) -> Dict[str, Any]:
+        """会话数、估算内存占用、去重情况和各原因的淘汰次数"""
+        return {
+            "sessions": len(self._sessions),
+            "bytes": self.nbytes,
+            "content_pool_entries": len(self._pool),
+            "content_pool_bytes": self._pool.nbytes,
+            "content_pool_hits": self._pool.hits,
+            "evictions": dict(self.evictions),
+        }
+
+    def _record(self, message: Dict[str, Any], tokens: int) -> MessageRecord:
+        """创建消息记录：角色驻留，内容从去重池获取"""
+        role = sys.intern(message["role"])
+        content = message.get("content")
+        # 写入时编码一次，之后每次请求直接拼接
+        encoded = (
+            encode_message({"role": role, "content": content})
+            if self.cache_json
+            else None
+        )
+        if role in DEDUP_ROLES:
+            content = self._pool.acquire(content)
+            if encoded is not None:
+                encoded = self._pool.acquire(encoded)
+        return MessageRecord(role, content, tokens, encoded)
+
+    @staticmethod
+    def _record_bytes(record: MessageRecord) -> int:
+        """记录计入会话的内存（去重池中的内容单独计算）"""
+        if record.role in DEDUP_ROLES:
+            return RECORD_BYTES
+        nbytes = RECORD_BYTES + estimate_content_bytes(record.content)
+        if record.encoded is not None:
+            nbytes += sys.getsizeof(record.encoded)
+        return nbytes
+
+    def _release(self, record: MessageRecord) -> None:
+        if record.role in DEDUP_ROLES:
+            self._pool.release(record.content)
+            if record.encoded is not None:
+                self._pool.release(record.encoded)
+
+    def _release_all(self, session: CompactSession) -> None:
+        for record in session.records():
+            self._release(record)
+
+    def _resize(self, session: CompactSession, delta: int) -> None:
+        session.nbytes += delta
+        self._session_bytes += delta
+        self._update_gauges()
+
+    def _update_gauges(self) -> None:
+        self._size.set(len(self._sessions))
+        self._bytes.set(self.nbytes)
+        self._pool_size.set(len(self._pool))
+
+    def _expire(self, now: float) -> None:
+        """删除空闲过期的会话（按访问顺序排列，只需检查最旧的一端）"""
+        if self.ttl <= 0:
+            return
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.last_access < self.ttl:
+                break
+            self._evict(session_id, "ttl")
+
+    def _enforce_limits(self, keep: str) -> None:
+        """淘汰最久未访问的会话，直到满足会话数和内存上限（keep 不会被淘汰）"""
+        while 0 < self.max_sessions < len(self._sessions):
+            if not self._evict_oldest(keep, "max_sessions"):
+                break
+        while 0 < self.max_bytes < self.nbytes:
+            if not self._evict_oldest(keep, "max_bytes"):
+                break
+
+    def _evict_oldest(self, keep: str, reason: str) -> bool:
+        for session_id in self._sessions:
+            if session_id != keep:
+                self._evict(session_id, reason)
+                return True
+        return False
+
+    def _evict(self, session_id: str, reason: str) -> None:
+        self._remove(session_id)
+        self.evictions[reason] += 1
+        self._evictions[reason].inc()
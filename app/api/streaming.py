@@ -0,0 +1,204 @@
+"""SSE 流式响应工具"""
+
+import asyncio
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+import anyio
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+from app import codec
+from app.api.chat_history import TRUNCATED_MARKER, save_turn
+from app.models.llm_client import BaseLLMClient
+from app.models.stream_result import (
+    StreamAccumulator,
+    collect_stream_metadata,
+    observe_stream_result,
+)
+
+# SSE 响应的媒体类型
+SSE_MEDIA_TYPE = "text/event-stream"
+
+# 禁止代理缓冲，保证每个增量立即送达客户端
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+# 上游流正常结束 / 客户端已断开的队列哨兵
+_END = object()
+_DISCONNECTED = object()
+
+
+def sse_event(data: Dict[str, Any], event: Optional[str] = None) -> str:
+    """
+    编码一条 SSE 事件
+
+    Args:
+        data: 事件数据，会被序列化为 JSON
+        event: 事件类型，不提供时为默认的 message 事件
+
+    Returns:
+        SSE 格式的事件文本
+    """
+    payload = codec.dumps(data).decode("utf-8")
+    if event:
+        return f"event: {event}\ndata: {payload}\n\n"
+    return f"data: {payload}\n\n"
+
+
+class CleanupStreamingResponse(StreamingResponse):
+    """
+    发送结束后总会执行清理回调的流式响应
+
+    响应体生成器的 finally 只有在生成器开始执行后才会运行；客户端在第一次读取响应体之前断开、
+    或发送响应被取消时，生成器不会开始，依赖它归还的资源（准入名额、会话锁）就会泄漏。
+    这里在发送结束（完成、出错、断开或取消）后先关闭响应体生成器（保存部分回复），再执行回调。
+    """
+
+    def __init__(
+        self, content: AsyncIterator[str], on_finish: Callable[[], None], **kwargs: Any
+    ):
+        """
+        初始化流式响应
+
+        Args:
+            content: 响应体生成器
+            on_finish: 发送结束后的回调，如归还准入名额、释放会话锁；只执行一次
+            **kwargs: 透传给 StreamingResponse 的参数
+        """
+        super().__init__(content, **kwargs)
+        self._on_finish: Optional[Callable[[], None]] = on_finish
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            try:
+                aclose = getattr(self.body_iterator, "aclose", None)
+                if aclose is not None:
+                    await aclose()
+            finally:
+                self.finish()
+
+    def finish(self) -> None:
+        """执行清理回调（重复调用无效）"""
+        on_finish, self._on_finish = self._on_finish, None
+        if on_finish is not None:
+            on_finish()
+
+
+async def wait_for_disconnect(request: Request) -> None:
+    """等待直到 HTTP 客户端断开连接"""
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def _pump(stream: AsyncIterator[str], queue: asyncio.Queue) -> None:
+    """把上游增量搬运到队列；被取消时上游流随之关闭"""
+    try:
+        async for chunk in stream:
+            queue.put_nowait(chunk)
+        queue.put_nowait(_END)
+    except Exception as e:
+        queue.put_nowait(e)
+
+
+async def _watch(
+    request: Request, queue: asyncio.Queue, producer: "asyncio.Task[None]"
+) -> None:
+    """客户端断开时立即取消上游生成，并通知消费方"""
+    await wait_for_disconnect(request)
+    producer.cancel()
+    queue.put_nowait(_DISCONNECTED)
+
+
+async def stream_chat_completion(
+    client: BaseLLMClient,
+    session_id: str,
+    all_messages: List[Dict[str, Any]],
+    current_messages: List[Dict[str, Any]],
+    request: Optional[Request] = None,
+    provider: Optional[str] = None,
+    **params: Any,
+) -> AsyncIterator[str]:
+    """
+    以 SSE 事件的形式逐个转发模型输出的增量
+
+    每个增量到达后立即作为 data 事件发送；流结束后保存完整对话历史，
+    并发送 done 事件（包含模型名称、会话 ID、首 token 延迟、增量间隔、用量和结束原因）。
+    出错时发送 error 事件。
+
+    上游流在独立任务中读取。客户端断开（或响应被中止）时立即取消该任务，
+    从而关闭上游 HTTP 流、停止继续生成；已生成的部分回复带上截断标记保存到历史。
+
+    Args:
+        client: LLM 客户端
+        session_id: 会话 ID
+        all_messages: 合并历史后的完整消息列表
+        current_messages: 当前请求的消息列表（用于保存用户消息）
+        request: 当前 HTTP 请求，用于监听客户端断开；不提供时不监听
+        provider: 提供者名称，提供时把耗时写入指标
+        **params: 透传给 chat_stream 的生成参数
+
+    Yields:
+        SSE 格式的事件文本
+    """
+    accumulator = StreamAccumulator()
+    finished = False
+    queue: asyncio.Queue = asyncio.Queue()
+    # 读取上游的任务复制当前上下文，客户端写入的用量和结束原因进入同一个收集器
+    with collect_stream_metadata(accumulator):
+        producer = asyncio.create_task(
+            _pump(client.chat_stream(all_messages, **params), queue)
+        )
+    watcher = (
+        asyncio.create_task(_watch(request, queue, producer))
+        if request is not None
+        else None
+    )
+
+    try:
+        while True:
+            item = await queue.get()
+            if item is _END or item is _DISCONNECTED:
+                break
+            if isinstance(item, Exception):
+                finished = True
+                error_detail = str(item) if str(item) else repr(item)
+                print(f"Error in chat stream: {error_detail}")
+                yield sse_event(
+                    {"detail": f"Error generating response: {error_detail}"},
+                    event="error",
+                )
+                return
+            accumulator.add(item)
+            yield sse_event({"content": item})
+
+        if item is _END:
+            finished = True
+            result = accumulator.result()
+            if provider is not None:
+                observe_stream_result(result, provider)
+            await save_turn(session_id, current_messages, result.content)
+            yield sse_event(
+                {
+                    "model": client.model_name,
+                    "session_id": session_id,
+                    **result.stats(),
+                },
+                event="done",
+            )
+    finally:
+        producer.cancel()
+        if watcher is not None:
+            watcher.cancel()
+        if not finished:
+            # 客户端中途断开：记录已生成的部分回复，并标记为截断。
+            # 此时发送响应的任务可能正被取消，屏蔽取消，存储后端挂起时也能写完
+            with anyio.CancelScope(shield=True):
+                await save_turn(
+                    session_id,
+                    current_messages,
+                    accumulator.content + TRUNCATED_MARKER,
+                )
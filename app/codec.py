@@ -0,0 +1,149 @@
+"""JSON 编解码：优先使用 orjson 或 msgspec，都未安装时使用标准库 json"""
+
+import json
+from typing import Any, Dict, Optional, Union
+
+from app.config import settings
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - 取决于运行环境
+    orjson = None  # type: ignore[assignment]
+
+try:
+    import msgspec
+except ImportError:  # pragma: no cover - 取决于运行环境
+    msgspec = None  # type: ignore[assignment]
+
+# 快速编码器不支持的值（超出 64 位的整数等）退回标准库编码
+_FALLBACK_ERRORS = (TypeError, ValueError, OverflowError)
+
+
+class JSONCodec:
+    """
+    标准库 json 编解码器，也是其他编解码器的基类
+
+    所有编解码器的输出一致：UTF-8 字节、紧凑分隔符、不转义非 ASCII 字符，
+    无法序列化的对象转成字符串。解码失败统一抛出 json.JSONDecodeError。
+    """
+
+    name = "json"
+
+    def dumps(self, obj: Any, sort_keys: bool = False) -> bytes:
+        """
+        编码为 JSON
+
+        Args:
+            obj: 要编码的对象
+            sort_keys: 是否按键排序（用于需要确定性输出的场景）
+
+        Returns:
+            UTF-8 编码的 JSON 字节
+        """
+        return json.dumps(
+            obj,
+            sort_keys=sort_keys,
+            ensure_ascii=False,
+            separators=(",", ":"),
+            default=str,
+        ).encode("utf-8")
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        """解码 JSON（接受字节或字符串）"""
+        return json.loads(data)
+
+
+class OrjsonCodec(JSONCodec):
+    """orjson 编解码器"""
+
+    name = "orjson"
+
+    def dumps(self, obj: Any, sort_keys: bool = False) -> bytes:
+        option = orjson.OPT_NON_STR_KEYS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            return orjson.dumps(obj, default=str, option=option)
+        except _FALLBACK_ERRORS:
+            return super().dumps(obj, sort_keys)
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        # orjson.JSONDecodeError 是 json.JSONDecodeError 的子类
+        return orjson.loads(data)
+
+
+class MsgspecCodec(JSONCodec):
+    """msgspec 编解码器"""
+
+    name = "msgspec"
+
+    def __init__(self):
+        self._encoder = msgspec.json.Encoder(enc_hook=str)
+        self._sorted_encoder = msgspec.json.Encoder(enc_hook=str, order="sorted")
+        self._decoder = msgspec.json.Decoder()
+
+    def dumps(self, obj: Any, sort_keys: bool = False) -> bytes:
+        encoder = self._sorted_encoder if sort_keys else self._encoder
+        try:
+            return encoder.encode(obj)
+        except _FALLBACK_ERRORS:
+            return super().dumps(obj, sort_keys)
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        try:
+            return self._decoder.decode(data)
+        except msgspec.DecodeError as e:
+            doc = data.decode("utf-8", "replace") if isinstance(data, bytes) else data
+            raise json.JSONDecodeError(str(e), doc, 0) from e
+
+
+# 可用的编解码器，auto 时按顺序选择第一个已安装的
+CODECS: Dict[str, Any] = {
+    "orjson": OrjsonCodec if orjson is not None else None,
+    "msgspec": MsgspecCodec if msgspec is not None else None,
+    "json": JSONCodec,
+}
+
+
+def _build_codec(name: str) -> JSONCodec:
+    """
+    按名称创建编解码器
+
+    Args:
+        name: auto、orjson、msgspec 或 json；指定的库未安装时退回 auto
+
+    Returns:
+        编解码器实例
+    """
+    if name != "auto":
+        if name not in CODECS:
+            raise ValueError(f"Unknown JSON codec: {name}")
+        if CODECS[name] is not None:
+            return CODECS[name]()
+        print(f"JSON codec {name} is not installed, falling back to auto")
+    for factory in CODECS.values():
+        if factory is not None:
+            return factory()
+    return JSONCodec()
+
+
+# 全局编解码器实例
+codec: Optional[JSONCodec] = None
+
+
+def get_codec() -> JSONCodec:
+    """获取编解码器实例（单例模式）"""
+    global codec
+    if codec is None:
+        codec = _build_codec(settings.json_codec)
+    return codec
+
+
+def dumps(obj: Any, sort_keys: bool = False) -> bytes:
+    """使用全局编解码器编码为 JSON 字节"""
+    return get_codec().dumps(obj, sort_keys)
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    """使用全局编解码器解码 JSON"""
+    return get_codec().loads(data)
@@ -1,6 +1,6 @@
 """配置管理模块"""
 
-from typing import Optional
+from typing import Any, Dict, List, Optional
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -17,8 +17,139 @@ class Settings(BaseSettings):
     # 如果配置，OpenAI SDK 将使用此 base_url；否则使用默认 OpenAI API
     llm_base_url: Optional[str] = None
 
+    # 多个上游（可选）：配置后 /chat 和 /chat/openai 都在这些上游之间负载均衡，
+    # 出错时自动换到其他上游。JSON 列表，每项包含 type（doubao 或 openai），
+    # 以及可选的 name、api_key、api_endpoint（doubao）、base_url（openai）、model，
+    # 未设置的字段使用上面的配置，例如
+    # [{"type": "doubao", "name": "beijing"}, {"type": "openai", "base_url": "https://..."}]
+    llm_backends: List[Dict[str, Any]] = []
+
     # LLM 请求超时配置
     llm_timeout: int = 60
+    # 分阶段超时（秒）：建立连接、读取（未设置时使用 llm_timeout）、写入、等待连接池
+    llm_connect_timeout: float = 5.0
+    llm_read_timeout: Optional[float] = None
+    llm_write_timeout: float = 10.0
+    llm_pool_timeout: float = 10.0
+
+    # 上游 HTTP 连接池：指向同一主机的客户端共享一个连接池。
+    # 最大连接数（小于等于 0 表示不限制）、最大空闲长连接数、空闲连接保持时间（秒），
+    # 以及是否启用 HTTP/2 多路复用（需要安装 h2）
+    llm_http_max_connections: int = 100
+    llm_http_max_keepalive_connections: int = 20
+    llm_http_keepalive_expiry: float = 30.0
+    llm_http2: bool = False
+
+    # 连接预热：应用启动时向每个上游主机预先建立的长连接数（0 表示不预热），
+    # 以及空闲多久（秒）后重新预热，应小于 llm_http_keepalive_expiry（0 表示不保持）
+    llm_prewarm_connections: int = 2
+    llm_prewarm_interval: float = 20.0
+
+    # 按上游的熔断器：最近 llm_breaker_window 秒内至少 llm_breaker_min_requests 次调用，
+    # 且失败比例达到 llm_breaker_error_rate，或耗时超过 llm_breaker_slow_call_duration 秒的
+    # 慢调用比例达到 llm_breaker_slow_call_rate 时打开，打开期间直接拒绝请求；
+    # llm_breaker_open_duration 秒后放行 llm_breaker_half_open_probes 个探测请求，全部成功则恢复
+    llm_breaker_enabled: bool = True
+    llm_breaker_window: float = 30.0
+    llm_breaker_min_requests: int = 10
+    llm_breaker_error_rate: float = 0.5
+    llm_breaker_slow_call_duration: Optional[float] = 30.0
+    llm_breaker_slow_call_rate: float = 0.8
+    llm_breaker_open_duration: float = 30.0
+    llm_breaker_half_open_probes: int = 2
+
+    # 客户端限流：同一 API Key 下每个模型的每分钟请求数和每分钟 token 数上限（0 表示不限制），
+    # 额度不足时调用方排队等待；llm_rate_limits 按模型单独配置，如 {"model": {"rpm": 60, "tpm": 100000}}。
+    # 请求的 token 数按提示加最大输出预估，未指定最大输出时按 llm_rate_limit_default_output_tokens 计算，
+    # 调用结束后按上游返回的实际用量多退少补
+    llm_rate_limit_rpm: int = 0
+    llm_rate_limit_tpm: int = 0
+    llm_rate_limits: Dict[str, Dict[str, int]] = {}
+    llm_rate_limit_default_output_tokens: int = 1024
+
+    # 上游调用重试：最多尝试次数（包括第一次，1 表示不重试）、
+    # 退避的最短和最长等待时间（秒），以及从第一次尝试开始的总时间预算（秒）
+    llm_retry_max_attempts: int = 3
+    llm_retry_base_delay: float = 0.2
+    llm_retry_max_delay: float = 5.0
+    llm_retry_budget: float = 15.0
+
+    # 对冲非流式请求：超过最近耗时的分位数仍未返回时再发送一次，取先完成的结果。
+    # 对冲请求不超过请求数的 llm_hedge_max_ratio；
+    # 豆包配置 llm_hedge_api_endpoint 时对冲请求发往该接入点，否则发往同一接入点
+    llm_hedge_enabled: bool = False
+    llm_hedge_percentile: float = 0.95
+    llm_hedge_min_delay: float = 0.5
+    llm_hedge_max_ratio: float = 0.05
+    llm_hedge_api_endpoint: Optional[str] = None
+
+    # 合并相同的并发请求（single-flight），共享一次上游调用
+    llm_coalesce_requests: bool = True
+
+    # 响应缓存配置：默认只缓存 temperature 为 0 的请求
+    llm_cache_enabled: bool = True
+    llm_cache_max_entries: int = 1024
+    llm_cache_ttl: int = 600  # 秒
+
+    # 语义缓存配置（可选）：最后一条用户消息近似重复（Jaccard 相似度不低于阈值）时复用回复
+    semantic_cache_enabled: bool = False
+    semantic_cache_threshold: float = 0.8
+    semantic_cache_num_perm: int = 128
+    semantic_cache_bands: int = 32
+    semantic_cache_max_entries: int = 1024
+    semantic_cache_ttl: int = 600  # 秒
+
+    # 准入控制：全局和每个提供者的最大并发请求数（小于等于 0 表示不限制），
+    # 超过上限的请求进入有界队列，队列已满返回 429，排队超时返回 503
+    admission_max_concurrency: int = 64
+    admission_provider_max_concurrency: int = 32
+    admission_max_queue: int = 128
+    admission_queue_timeout: float = 10.0  # 秒
+
+    # 对话历史：每个会话最多保存的消息数，以及合并历史时的 token 预算
+    # history_token_budgets 可按模型单独配置，例如 {"doubao-seed-1-6-lite-251015": 32000}
+    history_max_messages: int = 100
+    history_token_budget: int = 8000
+    history_token_budgets: Dict[str, int] = {}
+
+    # JSON 编解码器：auto（优先 orjson，其次 msgspec，都未安装时使用标准库）、
+    # orjson、msgspec 或 json，用于请求解析、上游调用和响应编码
+    json_codec: str = "auto"
+
+    # 会话存储后端：memory（默认，进程内）、sqlite（持久化，同一台机器上的进程共享）
+    # 或 redis（多个 worker 进程 / 多台机器共享）
+    session_backend: str = "memory"
+    session_redis_url: str = "redis://localhost:6379/0"
+    # SQLite 后端：数据库路径、后台批量写入的间隔（秒）和脏会话数阈值、读缓存大小和有效期（秒）
+    session_sqlite_path: str = "data/sessions.db"
+    session_flush_interval: float = 1.0
+    session_flush_batch_size: int = 64
+    session_cache_size: int = 1024
+    session_cache_ttl: float = 5.0
+
+    # 内存会话存储上限：空闲过期时间、最大会话数和估算内存上限（字节），
+    # 超过上限时按最近访问时间淘汰会话；小于等于 0 表示不限制。
+    # redis 后端同样使用 session_store_ttl 作为会话过期时间
+    session_store_ttl: float = 3600.0  # 秒
+    session_store_max_sessions: int = 10000
+    session_store_max_bytes: int = 256 * 1024 * 1024
+    # 为每条历史消息缓存 JSON 编码，请求体直接拼接而不是重新序列化整个历史
+    session_store_cache_json: bool = True
+
+    # 对话历史压缩（可选）：历史超过 token 阈值时，在后台用便宜的模型把最早的消息
+    # 总结成一条 system 消息，最近 keep_recent 条消息保留原文
+    history_compaction_enabled: bool = False
+    history_compaction_threshold: int = 6000
+    history_compaction_keep_recent: int = 6
+    history_compaction_model: Optional[str] = None  # 默认使用 llm_model_id
+    history_compaction_max_concurrency: int = 2
+
+    # 会话锁表分片数：同一会话的请求串行执行，不同会话并行
+    session_lock_shards: int = 64
+
+    # 批量对话接口：单次请求的最大对话数和最大并发数
+    batch_max_conversations: int = 1000
+    batch_max_concurrency: int = 8
 
     # FastAPI 配置
     api_host: str = "0.0.0.0"
@@ -1,16 +1,43 @@
 """FastAPI 应用入口"""
 
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from app.api import chat, chat_openai
+from app.api import chat, chat_history, chat_openai, compaction
+from app.api.codec_routing import CodecJSONResponse
 from app.config import settings
+from app.metrics import metrics
+from app.models.circuit_breaker import OPEN, circuit_breaker_states
+from app.models.registry import get_provider_registry
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    应用生命周期
+
+    启动时创建 LLM 客户端并预热上游连接；关闭时等待进行中的历史压缩结束，
+    再关闭客户端和上游连接池，并写入会话存储中缓冲的数据。
+    """
+    registry = get_provider_registry()
+    await registry.start()
+    try:
+        yield
+    finally:
+        if compaction.compactor is not None:
+            await compaction.compactor.drain()
+        await registry.close()
+        await chat_history.session_store.close()
+
 
 # 创建 FastAPI 应用
 app = FastAPI(
     title="AI Agent Learning",
     description="基于 FastAPI 的 AI Agent 学习项目，集成火山引擎豆包模型",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # 配置 CORS
@@ -27,16 +54,27 @@ app.include_router(chat.router)
 app.include_router(chat_openai.router)
 
 
-@app.get("/")
+@app.get("/", response_class=CodecJSONResponse)
 async def root():
     """根路径"""
     return {"message": "AI Agent Learning API", "version": "1.0.0", "docs": "/docs"}
 
 
-@app.get("/health")
+@app.get("/health", response_class=CodecJSONResponse)
 async def health():
-    """健康检查"""
-    return {"status": "healthy"}
+    """健康检查（包含各上游熔断器的状态）"""
+    breakers = circuit_breaker_states()
+    if breakers and all(b["state"] == OPEN for b in breakers.values()):
+        status = "degraded"
+    else:
+        status = "healthy"
+    return {"status": status, "circuit_breakers": breakers}
+
+
+@app.get("/metrics", response_class=CodecJSONResponse)
+async def get_metrics():
+    """运行指标（缓存命中率、队列长度、延迟等）"""
+    return metrics.snapshot()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,137 @@
+"""进程内指标收集"""
+
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple, Union
+
+# 直方图保留最近的观测值个数（用于估算分位数）
+HISTOGRAM_WINDOW = 1024
+
+
+def _metric_key(name: str, labels: Optional[Dict[str, str]]) -> str:
+    """把指标名称和标签组合成唯一键，例如 name{provider="doubao"}"""
+    if not labels:
+        return name
+    label_str = ",".join(f'{k}="{v}"' for k, v in sorted(labels.items()))
+    return f"{name}{{{label_str}}}"
+
+
+class Counter:
+    """单调递增计数器"""
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        """增加计数"""
+        self.value += amount
+
+    def snapshot(self) -> float:
+        """当前值"""
+        return self.value
+
+
+class Gauge:
+    """可增可减的瞬时值"""
+
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value: float) -> None:
+        """设置当前值"""
+        self.value = value
+
+    def inc(self, amount: float = 1.0) -> None:
+        """增加"""
+        self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        """减少"""
+        self.value -= amount
+
+    def snapshot(self) -> float:
+        """当前值"""
+        return self.value
+
+
+class Histogram:
+    """观测值分布：累计次数、总和、最大值，以及最近观测值的分位数"""
+
+    def __init__(self, window: int = HISTOGRAM_WINDOW):
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.recent: Deque[float] = deque(maxlen=window)
+
+    def observe(self, value: float) -> None:
+        """记录一次观测"""
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+        self.recent.append(value)
+
+    def quantile(self, q: float) -> float:
+        """最近观测值的 q 分位数（0 <= q <= 1），无观测时为 0"""
+        if not self.recent:
+            return 0.0
+        ordered = sorted(self.recent)
+        index = min(len(ordered) - 1, int(q * len(ordered)))
+        return ordered[index]
+
+    def snapshot(self) -> Dict[str, float]:
+        """统计摘要"""
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "avg": self.sum / self.count if self.count else 0.0,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+        }
+
+
+Metric = Union[Counter, Gauge, Histogram]
+
+
+class MetricsRegistry:
+    """指标注册表，按名称和标签获取或创建指标"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Tuple[str, Metric]] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(
+        self, kind: str, factory: Any, name: str, labels: Optional[Dict[str, str]]
+    ) -> Any:
+        key = _metric_key(name, labels)
+        entry = self._metrics.get(key)
+        if entry is None:
+            with self._lock:
+                entry = self._metrics.setdefault(key, (kind, factory()))
+        if entry[0] != kind:
+            raise ValueError(f"Metric {key} already registered as {entry[0]}")
+        return entry[1]
+
+    def counter(self, name: str, labels: Optional[Dict[str, str]] = None) -> Counter:
+        """获取或创建计数器"""
+        return self._get_or_create("counter", Counter, name, labels)
+
+    def gauge(self, name: str, labels: Optional[Dict[str, str]] = None) -> Gauge:
+        """获取或创建瞬时值"""
+        return self._get_or_create("gauge", Gauge, name, labels)
+
+    def histogram(
+        self, name: str, labels: Optional[Dict[str, str]] = None
+    ) -> Histogram:
+        """获取或创建直方图"""
+        return self._get_or_create("histogram", Histogram, name, labels)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """导出所有指标的当前值"""
+        return {key: metric.snapshot() for key, (_, metric) in self._metrics.items()}
+
+
+# 全局指标注册表
+metrics = MetricsRegistry()
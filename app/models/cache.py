@@ -0,0 +1,191 @@
+"""精确匹配的响应缓存"""
+
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Any, AsyncGenerator, Dict, List, Optional, Tuple
+
+from app.metrics import metrics
+from app.models.llm_client import BaseLLMClient, LLMClientWrapper, request_fingerprint
+
+# 缓存模式：auto 仅缓存确定性请求（temperature 为 0），
+# force 由调用方主动开启缓存，bypass 跳过缓存（既不读取也不写入）
+CACHE_AUTO = "auto"
+CACHE_FORCE = "force"
+CACHE_BYPASS = "bypass"
+
+# 当前请求的缓存模式，由路由层按请求设置
+cache_mode: ContextVar[str] = ContextVar("llm_cache_mode", default=CACHE_AUTO)
+
+
+def resolve_cache_mode(cache_control: Optional[str], opt_in: bool = False) -> str:
+    """
+    根据请求头和请求参数确定缓存模式
+
+    Args:
+        cache_control: Cache-Control 请求头，包含 no-cache 或 no-store 时跳过缓存
+        opt_in: 调用方是否主动开启缓存（适用于 temperature 不为 0 的请求）
+
+    Returns:
+        缓存模式
+    """
+    if cache_control:
+        directives = {d.strip().lower() for d in cache_control.split(",")}
+        if directives & {"no-cache", "no-store"}:
+            return CACHE_BYPASS
+    return CACHE_FORCE if opt_in else CACHE_AUTO
+
+
+class ResponseCache:
+    """按条目数做 LRU 淘汰、按 TTL 过期的响应缓存"""
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 600.0, name: str = ""):
+        """
+        初始化缓存
+
+        Args:
+            max_entries: 最大缓存条目数，超过后淘汰最久未使用的条目
+            ttl: 条目存活时间（秒）
+            name: 缓存名称，用作指标标签
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        labels = {"cache": name} if name else None
+        self._hits = metrics.counter("llm_cache_hits_total", labels)
+        self._misses = metrics.counter("llm_cache_misses_total", labels)
+        self._evictions = metrics.counter("llm_cache_evictions_total", labels)
+        self._size = metrics.gauge("llm_cache_entries", labels)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[str]:
+        """读取缓存，命中时刷新 LRU 顺序；过期条目视为未命中并删除"""
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] <= time.monotonic():
+            del self._entries[key]
+            self._record_eviction()
+            entry = None
+
+        if entry is None:
+            self.misses += 1
+            self._misses.inc()
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        self._hits.inc()
+        return entry[1]
+
+    def set(self, key: str, value: str) -> None:
+        """写入缓存，超过容量时淘汰最久未使用的条目"""
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._record_eviction()
+        self._size.set(len(self._entries))
+
+    def clear(self) -> None:
+        """清空缓存"""
+        self._entries.clear()
+        self._size.set(0)
+
+    def _record_eviction(self) -> None:
+        self.evictions += 1
+        self._evictions.inc()
+        self._size.set(len(self._entries))
+
+
+class CachingLLMClient(LLMClientWrapper):
+    """
+    在客户端前增加精确匹配缓存
+
+    以模型名称、完整消息列表和生成参数的规范化哈希为键。默认只缓存
+    temperature 为 0 的确定性请求；调用方可通过 cache_mode 主动开启或跳过缓存。
+    流式请求命中时一次性返回缓存内容，未命中时在流正常结束后写入缓存。
+    """
+
+    def __init__(self, inner: BaseLLMClient, cache: ResponseCache):
+        """
+        初始化缓存客户端
+
+        Args:
+            inner: 被包装的 LLM 客户端
+            cache: 响应缓存
+        """
+        super().__init__(inner)
+        self.cache = cache
+
+    def _cache_key(
+        self, messages: List[Dict[str, Any]], params: Dict[str, Any]
+    ) -> Optional[str]:
+        """返回请求的缓存键；不应使用缓存时返回 None"""
+        mode = cache_mode.get()
+        if mode == CACHE_BYPASS:
+            return None
+        if mode != CACHE_FORCE and params["temperature"] != 0:
+            return None
+        return request_fingerprint(self.model_name, messages, **params)
+
+    async def chat(
+        self,
+        messages: List[Dict[str, Any]],
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        max_completion_tokens: Optional[int] = None,
+        reasoning_effort: Optional[str] = None,
+        stream: bool = False,
+    ) -> str:
+        """发送聊天请求，可缓存时优先返回缓存结果"""
+        params: Dict[str, Any] = {
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "max_completion_tokens": max_completion_tokens,
+            "reasoning_effort": reasoning_effort,
+        }
+        key = self._cache_key(messages, params)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        content = await self.inner.chat(messages, stream=stream, **params)
+        if key is not None:
+            self.cache.set(key, content)
+        return content
+
+    async def chat_stream(
+        self,
+        messages: List[Dict[str, Any]],
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        max_completion_tokens: Optional[int] = None,
+        reasoning_effort: Optional[str] = None,
+    ) -> AsyncGenerator[str, None]:
+        """流式发送聊天请求，命中缓存时一次性返回缓存内容"""
+        params: Dict[str, Any] = {
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "max_completion_tokens": max_completion_tokens,
+            "reasoning_effort": reasoning_effort,
+        }
+        key = self._cache_key(messages, params)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                yield cached
+                return
+
+        parts = []
+        async for chunk in self.inner.chat_stream(messages, **params):
+            parts.append(chunk)
+            yield chunk
+
+        # 只缓存完整结束的流，中途断开或出错的部分结果不写入
+        if key is not None:
+            self.cache.set(key, "".join(parts))
@@ -0,0 +1,371 @@
+"""按上游的熔断器：错误率或慢调用比例过高时快速失败，半开状态下少量探测后恢复"""
+
+import time
+from collections import deque
+from typing import Any, AsyncGenerator, Callable, Deque, Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.metrics import metrics
+from app.models.errors import LLMError, classify_error
+from app.models.llm_client import BaseLLMClient, LLMClientWrapper
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(LLMError):
+    """熔断器打开，请求没有发往上游"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(
+            f"Circuit breaker for {name} is open, retry after {retry_after:.1f}s",
+            retry_after=retry_after,
+            retryable=True,
+        )
+
+
+def is_upstream_failure(error: BaseException) -> bool:
+    """
+    判断错误是否说明上游不健康
+
+    可重试的错误（限流、5xx、连接失败、超时）和没有状态码的错误算作上游故障；
+    400、401 等请求本身的问题说明上游能正常响应，不算。
+    """
+    if isinstance(error, CircuitOpenError):
+        return False
+    llm_error = classify_error(error)
+    return llm_error.retryable or llm_error.status_code is None
+
+
+class CircuitBreaker:
+    """
+    熔断器
+
+    关闭状态下统计最近 window 秒内的调用：调用数不少于 min_requests，
+    且失败比例达到 error_rate 或慢调用（超过 slow_call_duration 秒）比例达到
+    slow_call_rate 时打开。打开状态下直接拒绝请求，open_duration 秒后进入半开状态，
+    最多同时放行 half_open_probes 个探测请求：全部成功则关闭，任何一个失败则重新打开。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        window: float = 30.0,
+        min_requests: int = 10,
+        error_rate: float = 0.5,
+        slow_call_duration: Optional[float] = 30.0,
+        slow_call_rate: float = 0.8,
+        open_duration: float = 30.0,
+        half_open_probes: int = 2,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        初始化熔断器
+
+        Args:
+            name: 上游名称，用作指标标签
+            window: 统计窗口（秒）
+            min_requests: 窗口内至少多少次调用才判断是否打开
+            error_rate: 打开熔断器的失败比例
+            slow_call_duration: 超过该耗时（秒）算作慢调用，None 表示不统计慢调用
+            slow_call_rate: 打开熔断器的慢调用比例
+            open_duration: 打开后多久（秒）进入半开状态
+            half_open_probes: 半开状态下放行的探测请求数
+            clock: 计时函数（测试时可替换）
+        """
+        self.name = name
+        self.window = window
+        self.min_requests = min_requests
+        self.error_rate = error_rate
+        self.slow_call_duration = slow_call_duration
+        self.slow_call_rate = slow_call_rate
+        self.open_duration = open_duration
+        self.half_open_probes = half_open_probes
+        self._clock = clock
+        self.state = CLOSED
+        self.opened_at = 0.0
+        # 每次状态变化加一；请求结束时只统计在当前状态下放行的请求
+        self.generation = 0
+        # 窗口内的调用：(结束时间, 是否失败, 是否慢调用)
+        self._calls: Deque[Tuple[float, bool, bool]] = deque()
+        self._failures = 0
+        self._slow = 0
+        self._probes_in_flight = 0
+        self._probes_succeeded = 0
+        labels = {"upstream": name}
+        self._state_gauge = metrics.gauge("llm_circuit_state", labels)
+        self._rejected = metrics.counter("llm_circuit_rejected_total", labels)
+        self._transitions = {
+            state: metrics.counter(
+                "llm_circuit_transitions_total", {"upstream": name, "to": state}
+            )
+            for state in (CLOSED, OPEN, HALF_OPEN)
+        }
+
+    def _set_state(self, state: str) -> None:
+        self.state = state
+        self.generation += 1
+        self._state_gauge.set(_STATE_VALUES[state])
+        self._transitions[state].inc()
+        self._probes_in_flight = 0
+        self._probes_succeeded = 0
+        if state == OPEN:
+            self.opened_at = self._clock()
+        else:
+            self._calls.clear()
+            self._failures = 0
+            self._slow = 0
+
+    def _evict(self, now: float) -> None:
+        calls = self._calls
+        while calls and calls[0][0] < now - self.window:
+            _, failed, slow = calls.popleft()
+            self._failures -= failed
+            self._slow -= slow
+
+    def retry_after(self) -> float:
+        """打开状态下距离进入半开状态的秒数"""
+        return max(0.0, self.opened_at + self.open_duration - self._clock())
+
+    @property
+    def available(self) -> bool:
+        """当前是否会放行请求（不改变状态）"""
+        if self.state == OPEN:
+            return self.retry_after() <= 0
+        if self.state == HALF_OPEN:
+            return (
+                self._probes_in_flight + self._probes_succeeded < self.half_open_probes
+            )
+        return True
+
+    def acquire(self) -> Optional[int]:
+        """
+        判断是否放行一个请求
+
+        放行后必须用返回的令牌调用 record_success、record_failure 或 record_ignored。
+
+        Returns:
+            放行时返回令牌，拒绝时返回 None
+        """
+        if self.state == OPEN:
+            if self.retry_after() > 0:
+                self._rejected.inc()
+                return None
+            self._set_state(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            if self._probes_in_flight + self._probes_succeeded >= self.half_open_probes:
+                self._rejected.inc()
+                return None
+            self._probes_in_flight += 1
+        return self.generation
+
+    def record_success(self, token: int, latency: float) -> None:
+        """记录一次成功的调用"""
+        if token != self.generation:
+            return
+        if self.state == HALF_OPEN:
+            self._probes_in_flight -= 1
+            self._probes_succeeded += 1
+            if self._probes_succeeded >= self.half_open_probes:
+                self._set_state(CLOSED)
+            return
+        slow = self.slow_call_duration is not None and latency > self.slow_call_duration
+        self._record(False, slow)
+
+    def record_failure(self, token: int) -> None:
+        """记录一次上游故障"""
+        if token != self.generation:
+            return
+        if self.state == HALF_OPEN:
+            self._set_state(OPEN)
+            return
+        self._record(True, False)
+
+    def record_ignored(self, token: int) -> None:
+        """结束一个放行的请求，但不计入统计（如请求本身有问题或被取消）"""
+        if token == self.generation and self.state == HALF_OPEN:
+            self._probes_in_flight -= 1
+
+    def _record(self, failed: bool, slow: bool) -> None:
+        now = self._clock()
+        self._calls.append((now, failed, slow))
+        self._failures += failed
+        self._slow += slow
+        self._evict(now)
+        total = len(self._calls)
+        if total < self.min_requests:
+            return
+        if (
+            self._failures / total >= self.error_rate
+            or self._slow / total >= self.slow_call_rate
+        ):
+            self._set_state(OPEN)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """当前状态，用于健康检查"""
+        self._evict(self._clock())
+        total = len(self._calls)
+        info: Dict[str, Any] = {
+            "state": self.state,
+            "requests": total,
+            "error_rate": round(self._failures / total, 4) if total else 0.0,
+            "slow_call_rate": round(self._slow / total, 4) if total else 0.0,
+        }
+        if self.state == OPEN:
+            info["retry_after"] = round(self.retry_after(), 3)
+        return info
+
+
+class CircuitBreakerLLMClient(LLMClientWrapper):
+    """
+    通过熔断器访问上游的客户端
+
+    熔断器打开时立即抛出 CircuitOpenError（多个上游时由路由客户端换到其他上游），
+    不再等待注定失败的请求超时。非流式调用按完整耗时统计慢调用，
+    流式调用按收到第一个增量的耗时统计。
+    """
+
+    def __init__(self, inner: BaseLLMClient, breaker: CircuitBreaker):
+        """
+        初始化熔断客户端
+
+        Args:
+            inner: 被包装的 LLM 客户端
+            breaker: 该上游的熔断器
+        """
+        super().__init__(inner)
+        self.breaker = breaker
+
+    def _acquire(self) -> Tuple[int, float]:
+        token = self.breaker.acquire()
+        if token is None:
+            raise CircuitOpenError(self.breaker.name, self.breaker.retry_after())
+        return token, time.monotonic()
+
+    def _on_error(self, token: int, error: BaseException) -> None:
+        if is_upstream_failure(error):
+            self.breaker.record_failure(token)
+        else:
+            self.breaker.record_ignored(token)
+
+    async def chat(
+        self,
+        messages: List[Dict[str, Any]],
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        max_completion_tokens: Optional[int] = None,
+        reasoning_effort: Optional[str] = None,
+        stream: bool = False,
+    ) -> str:
+        """熔断器放行时发送聊天请求"""
+        token, started = self._acquire()
+        try:
+            result = await self.inner.chat(
+                messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                max_completion_tokens=max_completion_tokens,
+                reasoning_effort=reasoning_effort,
+                stream=stream,
+            )
+        except Exception as e:
+            self._on_error(token, e)
+            raise
+        except BaseException:
+            # 被取消（如对冲请求中较慢的一个），不说明上游的状态
+            self.breaker.record_ignored(token)
+            raise
+        self.breaker.record_success(token, time.monotonic() - started)
+        return result
+
+    async def chat_stream(
+        self,
+        messages: List[Dict[str, Any]],
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        max_completion_tokens: Optional[int] = None,
+        reasoning_effort: Optional[str] = None,
+    ) -> AsyncGenerator[str, None]:
+        """熔断器放行时流式发送聊天请求，流结束时按首个增量的耗时记录"""
+        token, started = self._acquire()
+        stream = self.inner.chat_stream(
+            messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            max_completion_tokens=max_completion_tokens,
+            reasoning_effort=reasoning_effort,
+        )
+        ttft: Optional[float] = None
+        try:
+            async for chunk in stream:
+                if ttft is None:
+                    ttft = time.monotonic() - started
+                yield chunk
+        except Exception as e:
+            self._on_error(token, e)
+            raise
+        except BaseException:
+            # 调用方提前离开：已经收到增量说明上游正常，否则不计入统计
+            if ttft is None:
+                self.breaker.record_ignored(token)
+            else:
+                self.breaker.record_success(token, ttft)
+            raise
+        finally:
+            await stream.aclose()
+        self.breaker.record_success(
+            token, ttft if ttft is not None else time.monotonic() - started
+        )
+
+
+# 按上游名称共享的熔断器
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_circuit_breaker(name: str) -> CircuitBreaker:
+    """
+    获取某个上游的熔断器（按配置创建）
+
+    Args:
+        name: 上游名称
+
+    Returns:
+        该上游的熔断器
+    """
+    breaker = _breakers.get(name)
+    if breaker is None:
+        breaker = _breakers[name] = CircuitBreaker(
+            name,
+            window=settings.llm_breaker_window,
+            min_requests=settings.llm_breaker_min_requests,
+            error_rate=settings.llm_breaker_error_rate,
+            slow_call_duration=settings.llm_breaker_slow_call_duration,
+            slow_call_rate=settings.llm_breaker_slow_call_rate,
+            open_duration=settings.llm_breaker_open_duration,
+            half_open_probes=settings.llm_breaker_half_open_probes,
+        )
+    return breaker
+
+
+def with_circuit_breaker(client: BaseLLMClient, name: str) -> BaseLLMClient:
+    """
+    按配置为直接访问上游的客户端加上熔断器
+
+    Args:
+        client: 直接访问上游的客户端
+        name: 上游名称
+
+    Returns:
+        启用熔断时为 CircuitBreakerLLMClient，否则原样返回
+    """
+    if not settings.llm_breaker_enabled:
+        return client
+    return CircuitBreakerLLMClient(client, get_circuit_breaker(name))
+
+
+def circuit_breaker_states() -> Dict[str, Dict[str, Any]]:
+    """所有熔断器的当前状态，用于健康检查"""
+    return {name: breaker.snapshot() for name, breaker in _breakers.items()}
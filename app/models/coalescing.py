@@ -0,0 +1,193 @@
+"""相同请求合并（single-flight）"""
+
+import asyncio
+from typing import Any, AsyncGenerator, AsyncIterator, Dict, List, Optional, Tuple
+
+from app.models.llm_client import BaseLLMClient, LLMClientWrapper, request_fingerprint
+from app.models.stream_result import (
+    StreamAccumulator,
+    collect_stream_metadata,
+    record_finish_reason,
+    record_usage,
+)
+
+
+def _replay_metadata(metadata: StreamAccumulator) -> None:
+    """把共享调用的用量和结束原因写入当前调用方的收集器"""
+    record_usage(metadata.usage)
+    record_finish_reason(metadata.finish_reason)
+
+
+class _StreamFlight:
+    """
+    一次共享的上游流式调用，把增量分发给所有订阅者
+
+    上游的用量和结束原因收集在共享调用自己的收集器中，流结束时写入每个订阅者的收集器，
+    而不是只写入发起调用的第一个订阅者。
+    """
+
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.metadata = StreamAccumulator()
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.task: Optional["asyncio.Task[None]"] = None
+        self._changed = asyncio.Event()
+
+    async def run(self, stream: AsyncIterator[str]) -> None:
+        """读取上游流，每个增量到达后唤醒所有订阅者"""
+        try:
+            with collect_stream_metadata(self.metadata):
+                async for chunk in stream:
+                    self.chunks.append(chunk)
+                    self._notify()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._notify()
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def subscribe(self) -> AsyncIterator[str]:
+        """从头回放已收到的增量，然后跟随上游继续输出"""
+        index = 0
+        while True:
+            if index < len(self.chunks):
+                yield self.chunks[index]
+                index += 1
+            elif self.done:
+                _replay_metadata(self.metadata)
+                if self.error is not None:
+                    raise self.error
+                return
+            else:
+                await self._changed.wait()
+
+
+class CoalescingLLMClient(LLMClientWrapper):
+    """
+    合并相同的并发请求
+
+    模型、消息列表和生成参数完全相同的请求在上游调用进行中时共享同一次调用，
+    结果（包括流式增量）分发给所有等待者。调用完成后立即移除，不做缓存。
+    """
+
+    def __init__(self, inner: BaseLLMClient):
+        """
+        初始化合并客户端
+
+        Args:
+            inner: 被包装的 LLM 客户端
+        """
+        super().__init__(inner)
+        self._calls: Dict[str, "asyncio.Task[Tuple[str, StreamAccumulator]]"] = {}
+        self._streams: Dict[str, _StreamFlight] = {}
+        # 实际发往上游的调用数 / 被合并的调用数
+        self.upstream_calls = 0
+        self.coalesced_calls = 0
+
+    async def _call(
+        self, messages: List[Dict[str, Any]], params: Dict[str, Any]
+    ) -> Tuple[str, StreamAccumulator]:
+        """执行一次共享的上游调用，用量和结束原因收集在调用自己的收集器中"""
+        with collect_stream_metadata(StreamAccumulator()) as metadata:
+            result = await self.inner.chat(messages, **params)
+        return result, metadata
+
+    def _key(self, mode: str, messages: List[Dict[str, Any]], **params: Any) -> str:
+        return request_fingerprint(self.model_name, messages, mode=mode, **params)
+
+    async def chat(
+        self,
+        messages: List[Dict[str, Any]],
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        max_completion_tokens: Optional[int] = None,
+        reasoning_effort: Optional[str] = None,
+        stream: bool = False,
+    ) -> str:
+        """发送聊天请求，相同的进行中请求共享一次上游调用"""
+        if stream:
+            # 复用流式合并，使其与流式订阅者共享同一次上游调用
+            parts = []
+            async for chunk in self.chat_stream(
+                messages,
+                temperature,
+                max_tokens,
+                max_completion_tokens,
+                reasoning_effort,
+            ):
+                parts.append(chunk)
+            return "".join(parts)
+
+        params: Dict[str, Any] = {
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "max_completion_tokens": max_completion_tokens,
+            "reasoning_effort": reasoning_effort,
+        }
+        key = self._key("chat", messages, **params)
+        task = self._calls.get(key)
+        if task is None:
+            self.upstream_calls += 1
+            task = asyncio.create_task(self._call(messages, params))
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        else:
+            self.coalesced_calls += 1
+
+        # shield：某个等待者被取消时不影响其他等待者
+        result, metadata = await asyncio.shield(task)
+        _replay_metadata(metadata)
+        return result
+
+    async def chat_stream(
+        self,
+        messages: List[Dict[str, Any]],
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        max_completion_tokens: Optional[int] = None,
+        reasoning_effort: Optional[str] = None,
+    ) -> AsyncGenerator[str, None]:
+        """流式发送聊天请求，相同的进行中请求共享一条上游流"""
+        params: Dict[str, Any] = {
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "max_completion_tokens": max_completion_tokens,
+            "reasoning_effort": reasoning_effort,
+        }
+        key = self._key("stream", messages, **params)
+        flight = self._streams.get(key)
+        if flight is None:
+            self.upstream_calls += 1
+            flight = _StreamFlight()
+            self._streams[key] = flight
+            flight.task = asyncio.create_task(
+                flight.run(self.inner.chat_stream(messages, **params))
+            )
+            flight.task.add_done_callback(
+                lambda _: (
+                    self._streams.pop(key, None)
+                    if self._streams.get(key) is flight
+                    else None
+                )
+            )
+        else:
+            self.coalesced_calls += 1
+
+        flight.subscribers += 1
+        try:
+            async for chunk in flight.subscribe():
+                yield chunk
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done:
+                # 所有订阅者都已离开（如客户端断开），取消上游生成
+                if self._streams.get(key) is flight:
+                    del self._streams[key]
+                if flight.task is not None:
+                    flight.task.cancel()
@@ -0,0 +1,65 @@
+"""消息的 JSON 预编码：历史消息缓存编码结果，拼接请求体时不再重复序列化"""
+
+from typing import Any, Dict, Iterable, Optional
+
+from app import codec
+
+
+def encode_json(obj: Any) -> bytes:
+    """
+    规范化 JSON 编码（键排序、紧凑分隔符、不转义非 ASCII 字符）
+
+    同一个对象总是得到相同的字节，可以直接拼接，也可以用来计算指纹。
+    """
+    return codec.dumps(obj, sort_keys=True)
+
+
+class EncodedMessage(dict):
+    """
+    带有缓存 JSON 编码的消息字典
+
+    行为与普通消息字典相同，同时携带 encode_json 的编码结果，序列化请求时直接复用。
+    缓存的编码不会随字典修改而更新，应当只读使用。
+    """
+
+    __slots__ = ("encoded",)
+
+    def __init__(self, message: Dict[str, Any], encoded: Optional[bytes] = None):
+        super().__init__(message)
+        self.encoded = encoded if encoded is not None else encode_json(message)
+
+
+def encode_message(message: Dict[str, Any]) -> bytes:
+    """编码单条消息，优先使用缓存的编码"""
+    if isinstance(message, EncodedMessage):
+        return message.encoded
+    return encode_json(message)
+
+
+def encode_messages(messages: Iterable[Dict[str, Any]]) -> bytes:
+    """把消息列表编码为 JSON 数组，拼接每条消息的编码"""
+    return b"[" + b",".join(encode_message(message) for message in messages) + b"]"
+
+
+def encode_request_body(
+    payload: Dict[str, Any], messages: Iterable[Dict[str, Any]]
+) -> bytes:
+    """
+    编码聊天请求体
+
+    Args:
+        payload: 除消息列表外的请求参数（model、temperature 等）
+        messages: 消息列表，历史消息的编码直接复用
+
+    Returns:
+        JSON 请求体，等价于 payload 加上 "messages" 字段
+    """
+    head = encode_json(payload)[:-1]  # 去掉结尾的 }
+    parts = [head, b',"messages":[' if len(head) > 1 else b'"messages":[']
+    for i, message in enumerate(messages):
+        if i:
+            parts.append(b",")
+        parts.append(encode_message(message))
+    parts.append(b"]}")
+    # 只在最后拼接一次，避免大请求体被多次复制
+    return b"".join(parts)
@@ -0,0 +1,116 @@
+"""LLM 调用错误：区分可重试与不可重试的失败，并解析上游的 Retry-After"""
+
+import time
+from email.utils import parsedate_to_datetime
+from typing import Mapping, Optional
+
+import httpx
+import openai
+
+# 可重试的 HTTP 状态码：请求超时、限流，以及网关和上游的临时故障
+RETRYABLE_STATUS_CODES = frozenset({408, 409, 425, 429, 500, 502, 503, 504})
+
+
+class LLMError(Exception):
+    """
+    调用上游 LLM 失败
+
+    status_code 为上游返回的 HTTP 状态码（连接失败等情况下为 None），
+    retry_after 为上游要求的最短等待时间（秒），retryable 表示重试是否可能成功。
+    """
+
+    def __init__(
+        self,
+        message: str,
+        status_code: Optional[int] = None,
+        retry_after: Optional[float] = None,
+        retryable: bool = False,
+    ):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.retryable = retryable
+
+
+def parse_retry_after(headers: Optional[Mapping[str, str]]) -> Optional[float]:
+    """
+    解析 Retry-After 响应头
+
+    Args:
+        headers: 响应头
+
+    Returns:
+        需要等待的秒数；没有该响应头或无法解析时返回 None
+    """
+    if not headers:
+        return None
+    value = headers.get("retry-after")
+    if value is None:
+        # 部分 OpenAI 兼容服务返回毫秒
+        value_ms = headers.get("retry-after-ms")
+        try:
+            return max(float(value_ms), 0.0) / 1000 if value_ms else None
+        except (TypeError, ValueError):
+            return None
+    value = value.strip()
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        pass
+    try:
+        # HTTP 日期格式
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable_status(status_code: int) -> bool:
+    """判断 HTTP 状态码是否可重试"""
+    return status_code in RETRYABLE_STATUS_CODES
+
+
+def classify_error(error: BaseException, message: Optional[str] = None) -> LLMError:
+    """
+    把调用上游时的异常归类为 LLMError
+
+    httpx 和 OpenAI SDK 的状态码错误按状态码判断；连接失败、超时和连接被重置可重试；
+    其他异常（如响应格式错误）不可重试。
+
+    Args:
+        error: 捕获到的异常
+        message: 错误消息，默认使用原异常的消息
+
+    Returns:
+        LLMError（error 已经是 LLMError 且未指定消息时原样返回）
+    """
+    if message is None:
+        if isinstance(error, LLMError):
+            return error
+        message = str(error) if str(error) else repr(error)
+    if isinstance(error, LLMError):
+        return LLMError(message, error.status_code, error.retry_after, error.retryable)
+    if isinstance(error, (httpx.HTTPStatusError, openai.APIStatusError)):
+        response = error.response
+        return LLMError(
+            message,
+            status_code=response.status_code,
+            retry_after=parse_retry_after(response.headers),
+            retryable=is_retryable_status(response.status_code),
+        )
+    return LLMError(message, retryable=_is_transient(error))
+
+
+def _is_transient(error: BaseException) -> bool:
+    """连接失败、超时、连接被重置等临时故障"""
+    return isinstance(
+        error,
+        (
+            httpx.TimeoutException,
+            httpx.NetworkError,
+            httpx.RemoteProtocolError,
+            # APITimeoutError 是 APIConnectionError 的子类
+            openai.APIConnectionError,
+            ConnectionError,
+            TimeoutError,
+        ),
+    )
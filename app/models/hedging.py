@@ -0,0 +1,182 @@
+"""对冲请求（hedged requests）：非流式调用迟迟没有返回时再发一次，取先完成的结果"""
+
+import asyncio
+import time
+from typing import Any, Dict, List, Optional, Set
+
+from app.metrics import Histogram, metrics
+from app.models.llm_client import BaseLLMClient, LLMClientWrapper
+
+
+class HedgeBudget:
+    """
+    对冲请求的额度
+
+    每个请求积累 ratio 个额度，每次对冲消耗 1 个，因此对冲请求不超过请求数的 ratio。
+    额度最多积累 burst 个：上游故障导致大量请求变慢时，对冲请求不会成倍放大流量。
+    """
+
+    def __init__(self, ratio: float = 0.05, burst: float = 10.0):
+        """
+        初始化额度
+
+        Args:
+            ratio: 对冲请求占请求数的最大比例
+            burst: 最多积累的额度
+        """
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = 0.0
+
+    def on_request(self) -> None:
+        """记录一个请求，积累额度"""
+        self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def try_acquire(self) -> bool:
+        """尝试消耗一个额度"""
+        if self.tokens < 1.0:
+            return False
+        self.tokens -= 1.0
+        return True
+
+
+class HedgingLLMClient(LLMClientWrapper):
+    """
+    对冲非流式请求以降低长尾延迟
+
+    按模型记录最近请求的耗时，请求超过 percentile 分位数仍未返回时，
+    向备用客户端（未指定时为同一客户端）发送相同的请求，取先成功的结果并取消另一个。
+    样本不足 min_samples 个或额度不足时不对冲。流式调用直接委托。
+    """
+
+    def __init__(
+        self,
+        inner: BaseLLMClient,
+        alternate: Optional[BaseLLMClient] = None,
+        percentile: float = 0.95,
+        min_delay: float = 0.5,
+        min_samples: int = 20,
+        budget: Optional[HedgeBudget] = None,
+        provider: str = "default",
+    ):
+        """
+        初始化对冲客户端
+
+        Args:
+            inner: 被包装的 LLM 客户端
+            alternate: 发送对冲请求的客户端（如另一个接入点），默认使用 inner
+            percentile: 触发对冲的耗时分位数
+            min_delay: 最短对冲等待时间（秒）
+            min_samples: 开始对冲前需要的耗时样本数
+            budget: 对冲额度，默认不超过请求数的 5%
+            provider: 提供者名称，用作指标标签
+        """
+        super().__init__(inner)
+        self.alternate = alternate or inner
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.budget = budget or HedgeBudget()
+        self.provider = provider
+        self._results = {
+            outcome: metrics.counter(
+                "llm_hedges_total", {"provider": provider, "outcome": outcome}
+            )
+            for outcome in ("primary_won", "hedge_won", "budget_exhausted")
+        }
+
+    def _latency(self, model: str) -> Histogram:
+        return metrics.histogram(
+            "llm_hedge_latency_seconds", {"provider": self.provider, "model": model}
+        )
+
+    def hedge_delay(self, model: str) -> Optional[float]:
+        """
+        当前的对冲等待时间
+
+        Args:
+            model: 模型名称
+
+        Returns:
+            等待秒数；样本不足时返回 None
+        """
+        latency = self._latency(model)
+        if len(latency.recent) < self.min_samples:
+            return None
+        return max(self.min_delay, latency.quantile(self.percentile))
+
+    async def chat(
+        self,
+        messages: List[Dict[str, Any]],
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        max_completion_tokens: Optional[int] = None,
+        reasoning_effort: Optional[str] = None,
+        stream: bool = False,
+    ) -> str:
+        """发送聊天请求，超过对冲等待时间仍未返回时发送对冲请求"""
+        params: Dict[str, Any] = {
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "max_completion_tokens": max_completion_tokens,
+            "reasoning_effort": reasoning_effort,
+        }
+        if stream:
+            return await self.inner.chat(messages, stream=True, **params)
+
+        model = self.model_name
+        latency = self._latency(model)
+        delay = self.hedge_delay(model)
+        self.budget.on_request()
+        started = time.monotonic()
+        primary = asyncio.ensure_future(self.inner.chat(messages, **params))
+        tasks: Set["asyncio.Future[str]"] = {primary}
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait({primary}, timeout=delay)
+                if not done:
+                    if self.budget.try_acquire():
+                        hedge_started = time.monotonic()
+                        hedge = asyncio.ensure_future(
+                            self.alternate.chat(messages, **params)
+                        )
+                        tasks.add(hedge)
+                        return await self._first_success(
+                            primary, hedge, started, hedge_started, latency
+                        )
+                    self._results["budget_exhausted"].inc()
+            result = await primary
+            latency.observe(time.monotonic() - started)
+            return result
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def _first_success(
+        self,
+        primary: "asyncio.Future[str]",
+        hedge: "asyncio.Future[str]",
+        started: float,
+        hedge_started: float,
+        latency: Histogram,
+    ) -> str:
+        """等待两个请求中先成功的一个；都失败时抛出原请求的错误"""
+        pending = {primary, hedge}
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in (primary, hedge):
+                if task not in done or task.cancelled() or task.exception():
+                    continue
+                if task is primary:
+                    self._results["primary_won"].inc()
+                    latency.observe(time.monotonic() - started)
+                else:
+                    self._results["hedge_won"].inc()
+                    latency.observe(time.monotonic() - hedge_started)
+                return task.result()
+        if not hedge.cancelled():
+            hedge.exception()  # 标记为已读取，避免未读取异常的警告
+        return primary.result()
@@ -0,0 +1,219 @@
+"""上游 HTTP 连接池：按主机共享 httpx.AsyncClient，并导出连接池指标"""
+
+import time
+from functools import lru_cache
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from app.config import settings
+from app.metrics import metrics
+
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+@lru_cache(maxsize=256)
+def pool_key(url: str) -> str:
+    """
+    连接池的键：协议、主机和端口
+
+    Args:
+        url: 请求 URL 或 base_url
+
+    Returns:
+        形如 https://ark.cn-beijing.volces.com:443 的字符串
+    """
+    parts = urlsplit(url)
+    scheme = parts.scheme or "https"
+    port = parts.port or _DEFAULT_PORTS.get(scheme, 443)
+    return f"{scheme}://{parts.hostname}:{port}"
+
+
+def build_timeout(total: Optional[float] = None) -> httpx.Timeout:
+    """
+    按配置生成分阶段超时
+
+    Args:
+        total: 读取超时（秒），默认使用 llm_read_timeout，未配置时使用 llm_timeout
+
+    Returns:
+        建立连接、读取、写入、等待连接池各自独立的超时
+    """
+    if total is None:
+        total = (
+            settings.llm_read_timeout
+            if settings.llm_read_timeout is not None
+            else float(settings.llm_timeout)
+        )
+    return httpx.Timeout(
+        connect=settings.llm_connect_timeout,
+        read=total,
+        write=settings.llm_write_timeout,
+        pool=settings.llm_pool_timeout,
+    )
+
+
+class _RequestState:
+    __slots__ = ("started", "acquired", "closed")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.acquired = False
+        self.closed = False
+
+
+class InstrumentedTransport(httpx.AsyncHTTPTransport):
+    """
+    记录连接池使用情况的传输层
+
+    通过 httpcore 的 trace 事件判断请求何时拿到连接（开始建立新连接或开始发送请求头），
+    由此得到等待连接池的时间；响应关闭时归还连接。
+    """
+
+    def __init__(self, host: str, max_connections: Optional[int], **kwargs: Any):
+        """
+        初始化传输层
+
+        Args:
+            host: 连接池的键，用作指标标签
+            max_connections: 最大连接数，用于计算利用率
+            **kwargs: 透传给 httpx.AsyncHTTPTransport 的参数（limits、http2 等）
+        """
+        super().__init__(**kwargs)
+        self.max_connections = max_connections
+        self.active = 0
+        self.waiting = 0
+        # 最近一次请求开始或结束的时间，用于判断连接池是否空闲
+        self.last_activity = time.monotonic()
+        labels = {"host": host}
+        self._acquire_wait = metrics.histogram("http_pool_acquire_wait_seconds", labels)
+        self._active_gauge = metrics.gauge("http_pool_active_requests", labels)
+        self._waiting_gauge = metrics.gauge("http_pool_waiting_requests", labels)
+        self._utilization = metrics.gauge("http_pool_utilization", labels)
+        self._opened = metrics.counter("http_pool_connections_opened_total", labels)
+
+    def _update_gauges(self) -> None:
+        self._active_gauge.set(self.active)
+        self._waiting_gauge.set(self.waiting)
+        if self.max_connections:
+            self._utilization.set(self.active / self.max_connections)
+
+    def _on_acquired(self, state: _RequestState) -> None:
+        if state.acquired or state.closed:
+            return
+        state.acquired = True
+        self._acquire_wait.observe(time.perf_counter() - state.started)
+        self.waiting -= 1
+        self.active += 1
+        self._update_gauges()
+
+    def _on_closed(self, state: _RequestState) -> None:
+        if state.closed:
+            return
+        state.closed = True
+        self.last_activity = time.monotonic()
+        if state.acquired:
+            self.active -= 1
+        else:
+            self.waiting -= 1
+        self._update_gauges()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        state = _RequestState()
+        outer_trace = request.extensions.get("trace")
+
+        async def trace(event_name: str, info: Dict[str, Any]) -> None:
+            if event_name == "connection.connect_tcp.started" or event_name.endswith(
+                ".send_request_headers.started"
+            ):
+                self._on_acquired(state)
+            elif event_name == "connection.connect_tcp.complete":
+                self._opened.inc()
+            elif event_name.endswith(".response_closed.complete"):
+                self._on_closed(state)
+            if outer_trace is not None:
+                await outer_trace(event_name, info)
+
+        request.extensions["trace"] = trace
+        self.last_activity = time.monotonic()
+        self.waiting += 1
+        self._update_gauges()
+        try:
+            return await super().handle_async_request(request)
+        except BaseException:
+            self._on_closed(state)
+            raise
+
+
+def _build_transport(host: str) -> InstrumentedTransport:
+    """按配置创建某个主机的连接池传输层"""
+    http2 = settings.llm_http2
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            print("LLM_HTTP2 requires the h2 package, falling back to HTTP/1.1")
+            http2 = False
+    max_connections = settings.llm_http_max_connections or None
+    return InstrumentedTransport(
+        host,
+        max_connections,
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=settings.llm_http_max_keepalive_connections,
+            keepalive_expiry=settings.llm_http_keepalive_expiry,
+        ),
+    )
+
+
+# 按主机共享的 HTTP 客户端，以及它们使用的传输层
+_clients: Dict[str, httpx.AsyncClient] = {}
+_transports: Dict[str, InstrumentedTransport] = {}
+
+
+def get_http_client(url: str) -> httpx.AsyncClient:
+    """
+    获取指向该 URL 所在主机的共享 HTTP 客户端
+
+    豆包客户端、OpenAI SDK 客户端和历史压缩使用的客户端只要指向同一主机，
+    就复用同一组长连接（和 HTTP/2 连接），避免重复的 TCP / TLS 握手。
+
+    Args:
+        url: 请求 URL 或 base_url
+
+    Returns:
+        共享的 httpx.AsyncClient
+    """
+    key = pool_key(url)
+    client = _clients.get(key)
+    if client is None or client.is_closed:
+        transport = _transports[key] = _build_transport(key)
+        client = _clients[key] = httpx.AsyncClient(
+            transport=transport, timeout=build_timeout()
+        )
+    return client
+
+
+def get_http_transport(url: str) -> InstrumentedTransport:
+    """
+    获取该 URL 所在主机的共享 HTTP 客户端使用的传输层
+
+    Args:
+        url: 请求 URL 或 base_url
+
+    Returns:
+        该主机的 InstrumentedTransport（可查看最近一次活动时间等）
+    """
+    get_http_client(url)
+    return _transports[pool_key(url)]
+
+
+async def close_http_clients() -> None:
+    """关闭所有共享的 HTTP 客户端（应用关闭时调用）"""
+    clients = list(_clients.values())
+    _clients.clear()
+    _transports.clear()
+    for client in clients:
+        await client.aclose()
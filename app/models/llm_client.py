@@ -1,16 +1,40 @@
 """LLM 客户端抽象层"""
 
+import hashlib
 from abc import ABC, abstractmethod
-from typing import Any, AsyncIterator, Dict, List, Optional
+from typing import Any, AsyncGenerator, AsyncIterator, Dict, List, Optional
 
 import httpx
 
+from app import codec
 from app.config import settings
+from app.models.encoding import encode_json, encode_messages, encode_request_body
+from app.models.errors import LLMError, classify_error
+from app.models.http_pool import get_http_client
+from app.models.sse import (
+    DELTA,
+    DONE,
+    ERROR,
+    FINISH,
+    USAGE,
+    ChatStreamEvent,
+    ChatStreamParser,
+)
+from app.models.stream_result import (
+    StreamAccumulator,
+    StreamResult,
+    collect_stream_metadata,
+    record_finish_reason,
+    record_usage,
+)
 
 
 class BaseLLMClient(ABC):
     """LLM 客户端抽象基类"""
 
+    # 使用的模型名称，由具体实现初始化
+    model_name: str
+
     @abstractmethod
     async def chat(
         self,
@@ -36,16 +60,16 @@ class BaseLLMClient(ABC):
         pass
 
     @abstractmethod
-    async def chat_stream(
+    def chat_stream(
         self,
         messages: List[Dict[str, Any]],
         temperature: float = 0.7,
         max_tokens: Optional[int] = None,
         max_completion_tokens: Optional[int] = None,
         reasoning_effort: Optional[str] = None,
-    ) -> AsyncIterator[str]:
+    ) -> AsyncGenerator[str, None]:
         """
-        流式发送聊天请求
+        流式发送聊天请求（子类用 async def 加 yield 实现为异步生成器）
 
         Args:
             messages: 消息列表
@@ -57,6 +81,125 @@ class BaseLLMClient(ABC):
         """
         pass
 
+    async def chat_stream_result(
+        self,
+        messages: List[Dict[str, Any]],
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        max_completion_tokens: Optional[int] = None,
+        reasoning_effort: Optional[str] = None,
+    ) -> StreamResult:
+        """
+        流式发送聊天请求并收集完整结果
+
+        Args:
+            messages: 消息列表
+            temperature: 温度参数
+            max_tokens: 最大生成 token 数
+
+        Returns:
+            包含完整内容、首 token 延迟、增量间隔、用量和结束原因的结果
+        """
+        with collect_stream_metadata(StreamAccumulator()) as accumulator:
+            async for chunk in self.chat_stream(
+                messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                max_completion_tokens=max_completion_tokens,
+                reasoning_effort=reasoning_effort,
+            ):
+                accumulator.add(chunk)
+        return accumulator.result()
+
+    async def close(self):
+        """关闭客户端连接（默认无需处理）"""
+        pass
+
+
+def request_fingerprint(
+    model: str, messages: List[Dict[str, Any]], **params: Any
+) -> str:
+    """
+    计算请求的规范化指纹
+
+    相同的模型、消息列表和生成参数得到相同的指纹，用于合并或缓存相同的请求。
+
+    Args:
+        model: 模型名称
+        messages: 消息列表
+        **params: 生成参数（temperature、max_tokens 等）
+
+    Returns:
+        十六进制 SHA-256 摘要
+    """
+    digest = hashlib.sha256(encode_json({"model": model, "params": params}))
+    # 历史消息直接使用缓存的编码，不重新序列化
+    digest.update(encode_messages(messages))
+    return digest.hexdigest()
+
+
+class LLMClientWrapper(BaseLLMClient):
+    """LLM 客户端包装器基类，默认把所有调用委托给被包装的客户端"""
+
+    def __init__(self, inner: BaseLLMClient):
+        """
+        初始化包装器
+
+        Args:
+            inner: 被包装的 LLM 客户端
+        """
+        self.inner = inner
+
+    @property  # type: ignore[override]
+    def model_name(self) -> str:
+        """被包装客户端使用的模型名称"""
+        return self.inner.model_name
+
+    @model_name.setter
+    def model_name(self, value: str) -> None:
+        self.inner.model_name = value
+
+    async def chat(
+        self,
+        messages: List[Dict[str, Any]],
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        max_completion_tokens: Optional[int] = None,
+        reasoning_effort: Optional[str] = None,
+        stream: bool = False,
+    ) -> str:
+        """发送聊天请求（委托给被包装的客户端）"""
+        return await self.inner.chat(
+            messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            max_completion_tokens=max_completion_tokens,
+            reasoning_effort=reasoning_effort,
+            stream=stream,
+        )
+
+    async def chat_stream(
+        self,
+        messages: List[Dict[str, Any]],
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        max_completion_tokens: Optional[int] = None,
+        reasoning_effort: Optional[str] = None,
+    ) -> AsyncGenerator[str, None]:
+        """流式发送聊天请求（委托给被包装的客户端）"""
+        async for chunk in self.inner.chat_stream(
+            messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            max_completion_tokens=max_completion_tokens,
+            reasoning_effort=reasoning_effort,
+        ):
+            yield chunk
+
+    async def close(self):
+        """关闭被包装的客户端"""
+        await self.inner.close()
+
 
 class DoubaoClient(BaseLLMClient):
     """火山引擎豆包模型客户端"""
@@ -66,6 +209,7 @@ class DoubaoClient(BaseLLMClient):
         api_key: Optional[str] = None,
         api_endpoint: Optional[str] = None,
         model_name: Optional[str] = None,
+        http_client: Optional[httpx.AsyncClient] = None,
     ):
         """
         初始化豆包客户端
@@ -74,11 +218,19 @@ class DoubaoClient(BaseLLMClient):
             api_key: API 密钥，默认从配置读取
             api_endpoint: API 端点，默认从配置读取
             model_name: 模型名称，默认从配置读取
+            http_client: HTTP 客户端，默认使用按主机共享的连接池
         """
         self.api_key = api_key or settings.llm_api_key
         self.api_endpoint = api_endpoint or settings.llm_api_endpoint
         self.model_name = model_name or settings.llm_model_id
-        self.client = httpx.AsyncClient(timeout=float(settings.llm_timeout))
+        self._http_client = http_client
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """HTTP 客户端（未指定时为 API 端点所在主机的共享客户端）"""
+        if self._http_client is not None:
+            return self._http_client
+        return get_http_client(self.api_endpoint)
 
     async def chat(
         self,
@@ -92,7 +244,7 @@ class DoubaoClient(BaseLLMClient):
         """发送聊天请求（非流式）"""
         if stream:
             # 如果要求流式，但调用的是非流式方法，则收集流式结果
-            full_response = ""
+            parts = []
             async for chunk in self.chat_stream(
                 messages,
                 temperature,
@@ -100,12 +252,11 @@ class DoubaoClient(BaseLLMClient):
                 max_completion_tokens,
                 reasoning_effort,
             ):
-                full_response += chunk
-            return full_response
+                parts.append(chunk)
+            return "".join(parts)
 
-        payload = {
+        payload: Dict[str, Any] = {
             "model": self.model_name,
-            "messages": messages,
             "temperature": temperature,
         }
 
@@ -124,39 +275,77 @@ class DoubaoClient(BaseLLMClient):
         }
 
         try:
+            # 历史消息复用缓存的 JSON 编码，只有新消息需要序列化
             response = await self.client.post(
-                self.api_endpoint, json=payload, headers=headers
+                self.api_endpoint,
+                content=encode_request_body(payload, messages),
+                headers=headers,
             )
             response.raise_for_status()
-            result = response.json()
+            result = codec.loads(response.content)
 
             # 解析响应
             if "choices" in result and len(result["choices"]) > 0:
+                record_usage(result.get("usage"))
+                record_finish_reason(result["choices"][0].get("finish_reason"))
                 return result["choices"][0]["message"]["content"]
             else:
                 raise ValueError(f"Unexpected response format: {result}")
 
         except httpx.HTTPStatusError as e:
-            raise Exception(
-                f"API request failed with status {e.response.status_code}: {e.response.text}"
-            )
+            raise classify_error(
+                e,
+                f"API request failed with status {e.response.status_code}: {e.response.text}",
+            ) from e
         except Exception as e:
-            raise Exception(f"Error calling Doubao API: {str(e)}")
+            raise classify_error(e, f"Error calling Doubao API: {str(e)}") from e
 
-    async def chat_stream(  # type: ignore[override,misc]
+    async def chat_stream(
         self,
         messages: List[Dict[str, Any]],
         temperature: float = 0.7,
         max_tokens: Optional[int] = None,
         max_completion_tokens: Optional[int] = None,
         reasoning_effort: Optional[str] = None,
-    ) -> AsyncIterator[str]:
+    ) -> AsyncGenerator[str, None]:
         """流式发送聊天请求"""
-        payload = {
+        async for event in self.chat_stream_events(
+            messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            max_completion_tokens=max_completion_tokens,
+            reasoning_effort=reasoning_effort,
+        ):
+            if event.type == DELTA:
+                yield event.content
+            elif event.type == FINISH:
+                record_finish_reason(event.finish_reason)
+            elif event.type == USAGE:
+                record_usage(event.usage)
+
+    async def chat_stream_events(
+        self,
+        messages: List[Dict[str, Any]],
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        max_completion_tokens: Optional[int] = None,
+        reasoning_effort: Optional[str] = None,
+    ) -> AsyncIterator[ChatStreamEvent]:
+        """
+        流式发送聊天请求，产出结构化事件
+
+        直接在原始字节块上增量解码 SSE，除文本增量外还产出 finish_reason、
+        usage 和 [DONE] 事件；上游在流中途发送的错误事件作为异常抛出。
+
+        Yields:
+            ChatStreamEvent（delta、finish、usage 或 done）
+        """
+        payload: Dict[str, Any] = {
             "model": self.model_name,
-            "messages": messages,
             "temperature": temperature,
             "stream": True,
+            # 最后一个增量之后返回 token 用量
+            "stream_options": {"include_usage": True},
         }
 
         # 火山引擎 API 使用 max_completion_tokens 而不是 max_tokens
@@ -171,54 +360,58 @@ class DoubaoClient(BaseLLMClient):
         headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json",
+            "Accept": "text/event-stream",
         }
 
         try:
             async with self.client.stream(
-                "POST", self.api_endpoint, json=payload, headers=headers
+                "POST",
+                self.api_endpoint,
+                content=encode_request_body(payload, messages),
+                headers=headers,
             ) as response:
-                response.raise_for_status()
-
-                async for line in response.aiter_lines():
-                    if not line.strip():
-                        continue
-
-                    # 处理 SSE 格式
-                    if line.startswith("data: "):
-                        data_str = line[6:]  # 移除 "data: " 前缀
-                        if data_str == "[DONE]":
-                            break
-
-                        try:
-                            import json
-
-                            data = json.loads(data_str)
-                            if "choices" in data and len(data["choices"]) > 0:
-                                delta = data["choices"][0].get("delta", {})
-                                content = delta.get("content", "")
-                                if content:
-                                    yield content
-                        except json.JSONDecodeError:
-                            continue
+                try:
+                    response.raise_for_status()
+                except httpx.HTTPStatusError:
+                    # 流式响应的错误体需要先读取
+                    await response.aread()
+                    raise
+
+                parser = ChatStreamParser()
+                async for chunk in response.aiter_bytes():
+                    for event in parser.feed(chunk):
+                        if event.type == ERROR:
+                            raise LLMError(f"upstream error event: {event.error}")
+                        yield event
+                        if event.type == DONE:
+                            return
+                for event in parser.close():
+                    if event.type == ERROR:
+                        raise LLMError(f"upstream error event: {event.error}")
+                    yield event
 
         except httpx.HTTPStatusError as e:
             error_detail = ""
             try:
-                error_json = e.response.json()
+                error_json = codec.loads(e.response.content)
                 if "error" in error_json:
                     error_detail = f" - {error_json['error']}"
-            except (json.JSONDecodeError, ValueError, TypeError):
+            except (ValueError, TypeError):
                 error_detail = f" - {e.response.text[:200]}"
-            raise Exception(
-                f"API request failed with status {e.response.status_code}{error_detail}"
-            )
+            raise classify_error(
+                e,
+                f"API request failed with status {e.response.status_code}{error_detail}",
+            ) from e
         except Exception as e:
             error_msg = str(e) if str(e) else repr(e)
-            raise Exception(f"Error calling Doubao API (stream): {error_msg}")
+            raise classify_error(
+                e, f"Error calling Doubao API (stream): {error_msg}"
+            ) from e
 
     async def close(self):
-        """关闭客户端连接"""
-        await self.client.aclose()
+        """关闭客户端连接（共享连接池在应用关闭时统一关闭）"""
+        if self._http_client is not None:
+            await self._http_client.aclose()
 
     async def __aenter__(self):
         """异步上下文管理器入口"""
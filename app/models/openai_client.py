@@ -1,11 +1,30 @@
 """OpenAI SDK 客户端"""
 
-from typing import Any, AsyncIterator, Dict, List, Optional
+from typing import Any, AsyncGenerator, Dict, List, Optional
 
 from openai import AsyncOpenAI
 
 from app.config import settings
+from app.models.errors import classify_error
+from app.models.http_pool import build_timeout, get_http_client
 from app.models.llm_client import BaseLLMClient
+from app.models.stream_result import record_finish_reason, record_usage
+
+# 未配置 base_url 时 OpenAI SDK 使用的地址
+DEFAULT_OPENAI_BASE_URL = "https://api.openai.com/v1"
+
+
+def _record_metadata(response: Any) -> None:
+    """记录响应（或流式增量）中的结束原因和 token 用量"""
+    if response.choices:
+        finish_reason = getattr(response.choices[0], "finish_reason", None)
+        if isinstance(finish_reason, str):
+            record_finish_reason(finish_reason)
+    usage = getattr(response, "usage", None)
+    if usage is not None and hasattr(usage, "model_dump"):
+        dumped = usage.model_dump(exclude_none=True)
+        if isinstance(dumped, dict):
+            record_usage(dumped)
 
 
 class OpenAIClient(BaseLLMClient):
@@ -32,10 +51,13 @@ class OpenAIClient(BaseLLMClient):
         self.model_name = model_name or settings.llm_model_id
         self.timeout = timeout if timeout is not None else settings.llm_timeout
 
-        # 初始化 OpenAI 客户端
+        # 初始化 OpenAI 客户端，与指向同一主机的其他客户端共享连接池。
+        # 关闭 SDK 自带的重试，统一由 RetryingLLMClient 按重试策略处理
         client_kwargs: Dict[str, Any] = {
             "api_key": self.api_key,
-            "timeout": self.timeout,
+            "max_retries": 0,
+            "timeout": build_timeout(float(timeout) if timeout is not None else None),
+            "http_client": get_http_client(self.base_url or DEFAULT_OPENAI_BASE_URL),
         }
         if self.base_url:
             client_kwargs["base_url"] = self.base_url
@@ -54,7 +76,7 @@ class OpenAIClient(BaseLLMClient):
         """发送聊天请求（非流式）"""
         if stream:
             # 如果要求流式，但调用的是非流式方法，则收集流式结果
-            full_response = ""
+            parts = []
             async for chunk in self.chat_stream(
                 messages,
                 temperature,
@@ -62,8 +84,8 @@ class OpenAIClient(BaseLLMClient):
                 max_completion_tokens,
                 reasoning_effort,
             ):
-                full_response += chunk
-            return full_response
+                parts.append(chunk)
+            return "".join(parts)
 
         # 构建请求参数
         request_params: Dict[str, Any] = {
@@ -87,22 +109,23 @@ class OpenAIClient(BaseLLMClient):
 
             # 解析响应
             if response.choices and len(response.choices) > 0:
+                _record_metadata(response)
                 return response.choices[0].message.content or ""
             else:
                 raise ValueError(f"Unexpected response format: {response}")
 
         except Exception as e:
             error_msg = str(e) if str(e) else repr(e)
-            raise Exception(f"Error calling OpenAI API: {error_msg}")
+            raise classify_error(e, f"Error calling OpenAI API: {error_msg}") from e
 
-    async def chat_stream(  # type: ignore[override,misc]
+    async def chat_stream(
         self,
         messages: List[Dict[str, Any]],
         temperature: float = 0.7,
         max_tokens: Optional[int] = None,
         max_completion_tokens: Optional[int] = None,
         reasoning_effort: Optional[str] = None,
-    ) -> AsyncIterator[str]:
+    ) -> AsyncGenerator[str, None]:
         """流式发送聊天请求"""
         # 构建请求参数
         request_params: Dict[str, Any] = {
@@ -110,6 +133,8 @@ class OpenAIClient(BaseLLMClient):
             "messages": messages,
             "temperature": temperature,
             "stream": True,
+            # 最后一个增量之后返回 token 用量
+            "stream_options": {"include_usage": True},
         }
 
         # OpenAI API 使用 max_tokens，但某些兼容 API 可能使用 max_completion_tokens
@@ -125,15 +150,22 @@ class OpenAIClient(BaseLLMClient):
         try:
             stream = await self.client.chat.completions.create(**request_params)  # type: ignore[call-overload]
 
-            async for chunk in stream:
-                if chunk.choices and len(chunk.choices) > 0:
-                    delta = chunk.choices[0].delta
-                    if delta and delta.content:
-                        yield delta.content
+            try:
+                async for chunk in stream:
+                    if chunk.choices and len(chunk.choices) > 0:
+                        delta = chunk.choices[0].delta
+                        if delta and delta.content:
+                            yield delta.content
+                    _record_metadata(chunk)
+            finally:
+                # 调用方提前结束迭代（如客户端断开）时立即关闭上游连接
+                await stream.close()
 
         except Exception as e:
             error_msg = str(e) if str(e) else repr(e)
-            raise Exception(f"Error calling OpenAI API (stream): {error_msg}")
+            raise classify_error(
+                e, f"Error calling OpenAI API (stream): {error_msg}"
+            ) from e
 
     async def close(self):
         """关闭客户端连接"""
@@ -0,0 +1,68 @@
+"""LLM 客户端中间层装配"""
+
+from typing import Optional
+
+from app.config import settings
+from app.models.cache import CachingLLMClient, ResponseCache
+from app.models.coalescing import CoalescingLLMClient
+from app.models.hedging import HedgeBudget, HedgingLLMClient
+from app.models.llm_client import BaseLLMClient
+from app.models.retry import RetryingLLMClient, RetryPolicy
+from app.models.semantic_cache import SemanticCache, SemanticCachingLLMClient
+
+
+def build_llm_client(
+    client: BaseLLMClient,
+    provider: str,
+    hedge_client: Optional[BaseLLMClient] = None,
+) -> BaseLLMClient:
+    """
+    按配置为客户端叠加中间层
+
+    由内到外依次为：请求对冲、失败重试、相同请求合并、语义缓存、精确匹配缓存。
+
+    Args:
+        client: 直接访问上游的 LLM 客户端
+        provider: 提供者名称（如 doubao、openai），用作指标标签
+        hedge_client: 发送对冲请求的客户端，默认使用 client
+
+    Returns:
+        叠加中间层后的客户端
+    """
+    if settings.llm_hedge_enabled:
+        client = HedgingLLMClient(
+            client,
+            alternate=hedge_client,
+            percentile=settings.llm_hedge_percentile,
+            min_delay=settings.llm_hedge_min_delay,
+            budget=HedgeBudget(ratio=settings.llm_hedge_max_ratio),
+            provider=provider,
+        )
+    if settings.llm_retry_max_attempts > 1:
+        policy = RetryPolicy(
+            max_attempts=settings.llm_retry_max_attempts,
+            base_delay=settings.llm_retry_base_delay,
+            max_delay=settings.llm_retry_max_delay,
+            budget=settings.llm_retry_budget,
+        )
+        client = RetryingLLMClient(client, policy, provider)
+    if settings.llm_coalesce_requests:
+        client = CoalescingLLMClient(client)
+    if settings.semantic_cache_enabled:
+        semantic_cache = SemanticCache(
+            threshold=settings.semantic_cache_threshold,
+            num_perm=settings.semantic_cache_num_perm,
+            bands=settings.semantic_cache_bands,
+            max_entries=settings.semantic_cache_max_entries,
+            ttl=settings.semantic_cache_ttl,
+            name=provider,
+        )
+        client = SemanticCachingLLMClient(client, semantic_cache)
+    if settings.llm_cache_enabled:
+        cache = ResponseCache(
+            max_entries=settings.llm_cache_max_entries,
+            ttl=settings.llm_cache_ttl,
+            name=provider,
+        )
+        client = CachingLLMClient(client, cache)
+    return client
@@ -0,0 +1,395 @@
+"""客户端限流：按账号和模型的每分钟请求数（RPM）和每分钟 token 数（TPM）令牌桶"""
+
+import asyncio
+import hashlib
+import time
+from typing import Any, AsyncGenerator, Callable, Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.metrics import metrics
+from app.models.circuit_breaker import CircuitBreakerLLMClient, CircuitOpenError
+from app.models.llm_client import BaseLLMClient, LLMClientWrapper
+from app.models.stream_result import (
+    StreamAccumulator,
+    collect_stream_metadata,
+    record_finish_reason,
+    record_usage,
+)
+from app.models.tokens import estimate_message_tokens
+
+
+class TokenBucket:
+    """
+    令牌桶：按每分钟 per_minute 个的速度连续补充，最多 per_minute 个
+
+    余额可以为负（实际用量超过预估时补扣），之后的请求等待余额恢复。
+    """
+
+    def __init__(self, per_minute: float, clock: Callable[[], float] = time.monotonic):
+        """
+        初始化令牌桶（初始为满）
+
+        Args:
+            per_minute: 每分钟的额度
+            clock: 计时函数（测试时可替换）
+        """
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+
+    @property
+    def tokens(self) -> float:
+        """当前余额"""
+        now = self._clock()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+        return self._tokens
+
+    def wait_time(self, amount: float) -> float:
+        """余额达到 amount（不超过容量）还需要等待的秒数"""
+        missing = min(amount, self.capacity) - self.tokens
+        return max(0.0, missing / self.rate)
+
+    def consume(self, amount: float) -> None:
+        """扣除额度（amount 为负时退还）"""
+        self._tokens = self.tokens - amount
+
+
+class RateLimiter:
+    """
+    一个账号下某个模型的限流器
+
+    调用前按预估的 token 数（提示 + 最大输出）同时从 RPM 和 TPM 令牌桶中扣除，
+    额度不足时按先来先到排队等待；调用结束后按上游返回的实际用量多退少补。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rpm: int = 0,
+        tpm: int = 0,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], Any] = asyncio.sleep,
+    ):
+        """
+        初始化限流器
+
+        Args:
+            name: 限流器名称（模型名称），用作指标标签
+            rpm: 每分钟请求数上限，0 表示不限制
+            tpm: 每分钟 token 数上限，0 表示不限制
+            clock: 计时函数（测试时可替换）
+            sleep: 等待函数（测试时可替换）
+        """
+        self.name = name
+        self.requests = TokenBucket(rpm, clock) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm, clock) if tpm > 0 else None
+        self._sleep = sleep
+        # asyncio.Lock 按请求获取的顺序唤醒，排队的调用方先来先到
+        self._lock = asyncio.Lock()
+        self._waiting = 0
+        labels = {"model": name}
+        self._wait = metrics.histogram("llm_ratelimit_wait_seconds", labels)
+        self._waiting_gauge = metrics.gauge("llm_ratelimit_waiting", labels)
+        self._estimated = metrics.counter(
+            "llm_ratelimit_tokens_total", {"model": name, "kind": "estimated"}
+        )
+        self._actual = metrics.counter(
+            "llm_ratelimit_tokens_total", {"model": name, "kind": "actual"}
+        )
+
+    def _wait_time(self, tokens: int) -> float:
+        wait = 0.0
+        if self.requests is not None:
+            wait = self.requests.wait_time(1)
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.wait_time(tokens))
+        return wait
+
+    async def acquire(self, tokens: int) -> None:
+        """
+        等待额度并扣除一个请求和 tokens 个 token
+
+        Args:
+            tokens: 预估的 token 数
+        """
+        started = time.monotonic()
+        self._waiting += 1
+        self._waiting_gauge.set(self._waiting)
+        try:
+            async with self._lock:
+                while True:
+                    wait = self._wait_time(tokens)
+                    if wait <= 0:
+                        break
+                    await self._sleep(wait)
+                if self.requests is not None:
+                    self.requests.consume(1)
+                if self.tokens is not None:
+                    self.tokens.consume(tokens)
+        finally:
+            self._waiting -= 1
+            self._waiting_gauge.set(self._waiting)
+        self._wait.observe(time.monotonic() - started)
+        self._estimated.inc(tokens)
+
+    def reconcile(self, estimated: int, actual: int) -> None:
+        """
+        按实际用量调整 TPM 余额
+
+        Args:
+            estimated: 调用前预估并扣除的 token 数
+            actual: 上游返回的实际 token 数
+        """
+        self._actual.inc(actual)
+        if self.tokens is not None:
+            self.tokens.consume(actual - estimated)
+
+    def refund(self, estimated: int) -> None:
+        """
+        退还请求没有发往上游时扣除的一个请求和预估的 token
+
+        Args:
+            estimated: 调用前预估并扣除的 token 数
+        """
+        if self.requests is not None:
+            self.requests.consume(-1)
+        if self.tokens is not None:
+            self.tokens.consume(-estimated)
+
+
+def estimate_request_tokens(
+    messages: List[Dict[str, Any]],
+    max_tokens: Optional[int] = None,
+    max_completion_tokens: Optional[int] = None,
+) -> int:
+    """
+    预估一次请求占用的 token 数：提示 token 加最大输出 token
+
+    上游按最大输出预留额度，未指定最大输出时使用 llm_rate_limit_default_output_tokens。
+    """
+    prompt = sum(estimate_message_tokens(message) for message in messages)
+    output = (
+        max_completion_tokens
+        or max_tokens
+        or settings.llm_rate_limit_default_output_tokens
+    )
+    return prompt + output
+
+
+def _usage_tokens(usage: Optional[Dict[str, Any]]) -> Optional[int]:
+    if not usage:
+        return None
+    total = usage.get("total_tokens")
+    if isinstance(total, int):
+        return total
+    prompt = usage.get("prompt_tokens")
+    completion = usage.get("completion_tokens")
+    if isinstance(prompt, int) and isinstance(completion, int):
+        return prompt + completion
+    return None
+
+
+class RateLimitedLLMClient(LLMClientWrapper):
+    """
+    调用上游前按 RPM / TPM 额度排队的客户端
+
+    调用期间单独收集上游返回的 usage，用于多退少补，再转交给外层的收集器。
+    没有返回 usage 时保留预估值；调用失败时退还预估的 token（请求数不退还）。
+    上游的熔断器打开时不占用额度：直接交给熔断器快速失败，
+    排队期间熔断器打开导致请求没有发出时退还扣除的请求数和 token。
+    """
+
+    def __init__(self, inner: BaseLLMClient, account: str = ""):
+        """
+        初始化限流客户端
+
+        Args:
+            inner: 直接访问上游的 LLM 客户端
+            account: 账号标识（如 API Key），同一账号下同一模型的调用共享额度
+        """
+        super().__init__(inner)
+        self.account = account
+
+    def _limiter(self) -> Optional[RateLimiter]:
+        if self._circuit_open():
+            return None
+        return get_rate_limiter(self.account, self.model_name)
+
+    def _circuit_open(self) -> bool:
+        """被包装的熔断器当前是否会拒绝请求"""
+        inner = self.inner
+        while isinstance(inner, LLMClientWrapper):
+            if isinstance(inner, CircuitBreakerLLMClient):
+                return not inner.breaker.available
+            inner = inner.inner
+        return False
+
+    async def chat(
+        self,
+        messages: List[Dict[str, Any]],
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        max_completion_tokens: Optional[int] = None,
+        reasoning_effort: Optional[str] = None,
+        stream: bool = False,
+    ) -> str:
+        """等待额度后发送聊天请求"""
+        limiter = self._limiter()
+        params: Dict[str, Any] = {
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "max_completion_tokens": max_completion_tokens,
+            "reasoning_effort": reasoning_effort,
+            "stream": stream,
+        }
+        if limiter is None:
+            return await self.inner.chat(messages, **params)
+
+        estimated = estimate_request_tokens(messages, max_tokens, max_completion_tokens)
+        await limiter.acquire(estimated)
+        accumulator = StreamAccumulator()
+        try:
+            with collect_stream_metadata(accumulator):
+                result = await self.inner.chat(messages, **params)
+        except CircuitOpenError:
+            limiter.refund(estimated)
+            raise
+        except BaseException:
+            limiter.reconcile(estimated, 0)
+            raise
+        self._finish(limiter, estimated, accumulator)
+        return result
+
+    async def chat_stream(
+        self,
+        messages: List[Dict[str, Any]],
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        max_completion_tokens: Optional[int] = None,
+        reasoning_effort: Optional[str] = None,
+    ) -> AsyncGenerator[str, None]:
+        """等待额度后流式发送聊天请求"""
+        limiter = self._limiter()
+        stream = self.inner.chat_stream(
+            messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            max_completion_tokens=max_completion_tokens,
+            reasoning_effort=reasoning_effort,
+        )
+        if limiter is None:
+            async for chunk in stream:
+                yield chunk
+            return
+
+        estimated = estimate_request_tokens(messages, max_tokens, max_completion_tokens)
+        await limiter.acquire(estimated)
+        accumulator = StreamAccumulator()
+        try:
+            while True:
+                # 只在读取上游时使用自己的收集器，不跨越 yield
+                with collect_stream_metadata(accumulator):
+                    try:
+                        chunk = await stream.__anext__()
+                    except StopAsyncIteration:
+                        break
+                yield chunk
+        except CircuitOpenError:
+            limiter.refund(estimated)
+            raise
+        except BaseException:
+            if accumulator.usage is None:
+                limiter.reconcile(estimated, 0)
+            else:
+                self._finish(limiter, estimated, accumulator)
+            raise
+        finally:
+            await stream.aclose()
+        self._finish(limiter, estimated, accumulator)
+
+    @staticmethod
+    def _finish(
+        limiter: RateLimiter, estimated: int, accumulator: StreamAccumulator
+    ) -> None:
+        """按实际用量多退少补，并把元数据转交给外层的收集器"""
+        actual = _usage_tokens(accumulator.usage)
+        limiter.reconcile(estimated, estimated if actual is None else actual)
+        record_usage(accumulator.usage)
+        record_finish_reason(accumulator.finish_reason)
+
+
+# 按（账号, 模型）共享的限流器；未配置限额的模型为 None
+_limiters: Dict[Tuple[str, str], Optional[RateLimiter]] = {}
+
+
+def rate_limits_for(model: str) -> Tuple[int, int]:
+    """
+    某个模型的 RPM / TPM 限额
+
+    Args:
+        model: 模型名称
+
+    Returns:
+        (rpm, tpm)，0 表示不限制；llm_rate_limits 中单独配置的值优先
+    """
+    limits = settings.llm_rate_limits.get(model, {})
+    return (
+        int(limits.get("rpm", settings.llm_rate_limit_rpm)),
+        int(limits.get("tpm", settings.llm_rate_limit_tpm)),
+    )
+
+
+def get_rate_limiter(account: str, model: str) -> Optional[RateLimiter]:
+    """
+    获取某个账号下某个模型的限流器
+
+    Args:
+        account: 账号标识
+        model: 模型名称
+
+    Returns:
+        限流器；该模型没有配置限额时返回 None
+    """
+    key = (account, model)
+    if key not in _limiters:
+        rpm, tpm = rate_limits_for(model)
+        _limiters[key] = RateLimiter(model, rpm, tpm) if rpm > 0 or tpm > 0 else None
+    return _limiters[key]
+
+
+def rate_limiting_enabled() -> bool:
+    """是否配置了任何限额"""
+    return bool(
+        settings.llm_rate_limit_rpm
+        or settings.llm_rate_limit_tpm
+        or settings.llm_rate_limits
+    )
+
+
+def with_rate_limit(client: BaseLLMClient) -> BaseLLMClient:
+    """
+    按配置为访问上游的客户端加上限流
+
+    同一 API Key 下同一模型的调用共享额度（豆包客户端和 OpenAI SDK 客户端之间也共享）。
+
+    Args:
+        client: 访问上游的客户端（可以已经加上熔断器，排队时间不计入上游耗时）
+
+    Returns:
+        配置了限额时为 RateLimitedLLMClient，否则原样返回
+    """
+    if not rate_limiting_enabled():
+        return client
+    # 熔断器等包装器下面才是持有 API Key 的客户端
+    inner = client
+    while isinstance(inner, LLMClientWrapper):
+        inner = inner.inner
+    api_key = getattr(inner, "api_key", None) or ""
+    # 不把 API Key 本身保存在进程内的键中
+    account = hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+    return RateLimitedLLMClient(client, account)
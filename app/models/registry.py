@@ -0,0 +1,289 @@
+"""LLM 提供者注册表：应用启动时创建客户端并预热连接，关闭时统一释放"""
+
+import asyncio
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from app.config import settings
+from app.models.circuit_breaker import get_circuit_breaker, with_circuit_breaker
+from app.models.http_pool import (
+    close_http_clients,
+    get_http_client,
+    get_http_transport,
+    pool_key,
+)
+from app.models.llm_client import BaseLLMClient, DoubaoClient
+from app.models.openai_client import DEFAULT_OPENAI_BASE_URL, OpenAIClient
+from app.models.pipeline import build_llm_client
+from app.models.rate_limit import with_rate_limit
+from app.models.routing import Backend, RoutingLLMClient
+
+
+class ProviderRegistry:
+    """
+    LLM 提供者注册表
+
+    每个提供者登记一个客户端工厂和上游地址。start() 创建所有客户端，
+    并向需要预热的上游主机预先建立若干条长连接；空闲期间后台任务定期重新预热，
+    避免长连接过期。close() 停止后台任务并关闭客户端和共享连接池。
+    未启动时 get() 按需创建客户端（如测试中不运行 lifespan）。
+    """
+
+    def __init__(
+        self,
+        warm_connections: int = 2,
+        keepalive_interval: float = 20.0,
+    ):
+        """
+        初始化注册表
+
+        Args:
+            warm_connections: 每个上游主机预先建立的长连接数，小于等于 0 表示不预热
+            keepalive_interval: 空闲多久（秒）后重新预热，小于等于 0 表示不保持
+        """
+        self.warm_connections = warm_connections
+        self.keepalive_interval = keepalive_interval
+        self._factories: Dict[str, Callable[[], BaseLLMClient]] = {}
+        self._urls: Dict[str, List[str]] = {}
+        self._aliases: Dict[str, str] = {}
+        self._warm: List[str] = []
+        self._clients: Dict[str, BaseLLMClient] = {}
+        self._keepalive_task: Optional["asyncio.Task[None]"] = None
+
+    def register(
+        self,
+        name: str,
+        factory: Callable[[], BaseLLMClient],
+        *urls: str,
+        warm: bool = True,
+    ) -> None:
+        """
+        登记提供者
+
+        Args:
+            name: 提供者名称（如 doubao、openai）
+            factory: 创建客户端（含中间层）的函数
+            *urls: 上游 API 地址，用于预热连接
+            warm: 启动时是否预热这些上游
+        """
+        self._factories[name] = factory
+        self._urls[name] = list(urls)
+        if warm:
+            self._warm.append(name)
+
+    def alias(self, name: str, target: str) -> None:
+        """让 name 使用已登记的提供者 target 的客户端"""
+        self._aliases[name] = target
+
+    def get(self, name: str) -> BaseLLMClient:
+        """获取提供者的客户端（未创建时立即创建）"""
+        while name in self._aliases:
+            name = self._aliases[name]
+        client = self._clients.get(name)
+        if client is None:
+            client = self._clients[name] = self._factories[name]()
+        return client
+
+    @property
+    def warm_hosts(self) -> List[str]:
+        """需要预热的上游主机（去重）"""
+        hosts: Dict[str, str] = {}
+        for name in self._warm:
+            for url in self._urls[name]:
+                hosts.setdefault(pool_key(url), url)
+        return list(hosts.values())
+
+    async def start(self) -> None:
+        """创建所有客户端，预热连接并启动保持连接的后台任务"""
+        for name in self._factories:
+            self.get(name)
+        if self.warm_connections <= 0:
+            return
+        await self.prewarm()
+        if self.keepalive_interval > 0:
+            self._keepalive_task = asyncio.create_task(self._keepalive())
+
+    async def prewarm(self, only_idle: bool = False) -> None:
+        """
+        向每个上游主机并发发送轻量请求，建立 warm_connections 条长连接
+
+        并发请求迫使连接池建立多条连接，响应结束后连接保留在池中。
+        上游返回什么状态码都不重要，请求失败时只打印日志。
+
+        Args:
+            only_idle: 只预热空闲超过 keepalive_interval 的主机
+        """
+        now = time.monotonic()
+        for url in self.warm_hosts:
+            client = get_http_client(url)
+            transport = get_http_transport(url)
+            if only_idle and now - transport.last_activity < self.keepalive_interval:
+                continue
+            origin = pool_key(url) + "/"
+            results = await asyncio.gather(
+                *(client.head(origin) for _ in range(self.warm_connections)),
+                return_exceptions=True,
+            )
+            errors = [r for r in results if isinstance(r, Exception)]
+            if errors:
+                print(f"Prewarming {origin} failed: {errors[0]!r}")
+
+    async def _keepalive(self) -> None:
+        """空闲期间定期重新预热，避免长连接因空闲过期被关闭"""
+        while True:
+            await asyncio.sleep(self.keepalive_interval)
+            try:
+                await self.prewarm(only_idle=True)
+            except Exception as e:
+                print(f"Keeping upstream connections warm failed: {e!r}")
+
+    async def close(self) -> None:
+        """停止后台任务，关闭所有客户端和共享连接池"""
+        if self._keepalive_task is not None:
+            self._keepalive_task.cancel()
+            try:
+                await self._keepalive_task
+            except asyncio.CancelledError:
+                pass
+            self._keepalive_task = None
+        clients = list(self._clients.values())
+        self._clients.clear()
+        for client in clients:
+            try:
+                await client.close()
+            except Exception as e:
+                print(f"Closing LLM client failed: {e!r}")
+        await close_http_clients()
+
+
+def _build_backend(index: int, config: Dict[str, Any]) -> Backend:
+    """
+    按 llm_backends 中的一项创建上游
+
+    Args:
+        index: 在列表中的位置，未配置 name 时用于生成名称
+        config: 上游配置
+
+    Returns:
+        上游
+    """
+    kind = config.get("type", "doubao")
+    client: BaseLLMClient
+    if kind == "doubao":
+        client = DoubaoClient(
+            api_key=config.get("api_key"),
+            api_endpoint=config.get("api_endpoint"),
+            model_name=config.get("model"),
+        )
+    elif kind == "openai":
+        client = OpenAIClient(
+            api_key=config.get("api_key"),
+            base_url=config.get("base_url"),
+            model_name=config.get("model"),
+        )
+    else:
+        raise ValueError(f"Unknown LLM backend type: {kind}")
+    name = config.get("name") or f"{kind}-{index}"
+    if not settings.llm_breaker_enabled:
+        return Backend(name, with_rate_limit(client))
+    return Backend(
+        name,
+        with_rate_limit(with_circuit_breaker(client, name)),
+        breaker=get_circuit_breaker(name),
+    )
+
+
+def _backend_url(config: Dict[str, Any]) -> str:
+    """上游配置对应的 API 地址"""
+    if config.get("type", "doubao") == "doubao":
+        return config.get("api_endpoint") or settings.llm_api_endpoint
+    return config.get("base_url") or settings.llm_base_url or DEFAULT_OPENAI_BASE_URL
+
+
+def _build_pool() -> BaseLLMClient:
+    """在 llm_backends 配置的所有上游之间路由的客户端"""
+    backends = [_build_backend(i, c) for i, c in enumerate(settings.llm_backends)]
+    return build_llm_client(RoutingLLMClient(backends), "pool")
+
+
+def _register_summary(registry: ProviderRegistry) -> None:
+    """
+    登记历史压缩使用的摘要提供者
+
+    未单独配置摘要模型时直接使用豆包提供者；配置了时创建访问同一接入点的客户端，
+    与豆包提供者共用熔断器，并按账号和模型计入客户端限流。
+    """
+    model = settings.history_compaction_model
+    if not model or model == settings.llm_model_id:
+        registry.alias("summary", "doubao")
+        return
+    # 与豆包提供者是同一个上游主机，不重复预热
+    registry.register(
+        "summary",
+        lambda: build_llm_client(
+            with_rate_limit(
+                with_circuit_breaker(DoubaoClient(model_name=model), "doubao")
+            ),
+            "summary",
+        ),
+        settings.llm_api_endpoint,
+        warm=False,
+    )
+
+
+def _build_provider_registry() -> ProviderRegistry:
+    """
+    按配置登记豆包和 OpenAI SDK 两个提供者，配置了多个上游时两者共用上游池；
+    另外登记历史压缩使用的摘要提供者
+    """
+    registry = ProviderRegistry(
+        warm_connections=settings.llm_prewarm_connections,
+        keepalive_interval=settings.llm_prewarm_interval,
+    )
+    _register_summary(registry)
+    if settings.llm_backends:
+        urls = [_backend_url(config) for config in settings.llm_backends]
+        registry.register("pool", _build_pool, *urls)
+        registry.alias("doubao", "pool")
+        registry.alias("openai", "pool")
+        return registry
+    registry.register(
+        "doubao",
+        lambda: build_llm_client(
+            with_rate_limit(with_circuit_breaker(DoubaoClient(), "doubao")),
+            "doubao",
+            hedge_client=(
+                with_rate_limit(
+                    with_circuit_breaker(
+                        DoubaoClient(api_endpoint=settings.llm_hedge_api_endpoint),
+                        "doubao-hedge",
+                    )
+                )
+                if settings.llm_hedge_api_endpoint
+                else None
+            ),
+        ),
+        settings.llm_api_endpoint,
+    )
+    # 未配置 base_url 时 OpenAI SDK 指向 OpenAI 官方 API，不一定会用到，不预热
+    registry.register(
+        "openai",
+        lambda: build_llm_client(
+            with_rate_limit(with_circuit_breaker(OpenAIClient(), "openai")), "openai"
+        ),
+        settings.llm_base_url or DEFAULT_OPENAI_BASE_URL,
+        warm=settings.llm_base_url is not None,
+    )
+    return registry
+
+
+# 全局注册表实例
+provider_registry: Optional[ProviderRegistry] = None
+
+
+def get_provider_registry() -> ProviderRegistry:
+    """获取提供者注册表（单例模式）"""
+    global provider_registry
+    if provider_registry is None:
+        provider_registry = _build_provider_registry()
+    return provider_registry
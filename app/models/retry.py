@@ -0,0 +1,219 @@
+"""上游调用重试：指数退避（decorrelated jitter）、Retry-After 和总时间预算"""
+
+import asyncio
+import random
+import time
+from typing import Any, AsyncGenerator, Callable, Dict, List, Optional
+
+from app.metrics import metrics
+from app.models.errors import LLMError, classify_error
+from app.models.llm_client import BaseLLMClient, LLMClientWrapper
+
+
+class RetryPolicy:
+    """
+    重试策略
+
+    两次尝试之间的等待时间使用 decorrelated jitter：
+    下一次等待在 [base_delay, 上一次等待 * 3] 之间随机取值，不超过 max_delay。
+    上游返回 Retry-After 时至少等待该时长。从第一次尝试开始的总耗时加上下一次等待
+    超过 budget 时不再重试，避免重试把请求拖到远超调用方可以接受的时长。
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        base_delay: float = 0.2,
+        max_delay: float = 5.0,
+        budget: float = 15.0,
+        rand: Callable[[float, float], float] = random.uniform,
+    ):
+        """
+        初始化重试策略
+
+        Args:
+            max_attempts: 最多尝试次数（包括第一次），1 表示不重试
+            base_delay: 最短等待时间（秒）
+            max_delay: 退避的最长等待时间（秒），不限制 Retry-After
+            budget: 重试的总时间预算（秒），小于等于 0 表示不限制
+            rand: 随机数函数（测试时可替换）
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget
+        self._rand = rand
+
+    def backoff(self, previous: float) -> float:
+        """
+        计算下一次等待时间
+
+        Args:
+            previous: 上一次等待时间，第一次重试时为 0
+
+        Returns:
+            等待秒数
+        """
+        upper = max(self.base_delay, previous * 3)
+        return min(self.max_delay, self._rand(self.base_delay, upper))
+
+    def next_delay(
+        self, error: LLMError, attempt: int, elapsed: float, previous: float
+    ) -> Optional[float]:
+        """
+        判断是否重试，并给出等待时间
+
+        Args:
+            error: 本次尝试的错误
+            attempt: 已经尝试的次数（从 1 开始）
+            elapsed: 从第一次尝试开始经过的时间（秒）
+            previous: 上一次等待时间，第一次重试时为 0
+
+        Returns:
+            等待秒数；不应重试时返回 None
+        """
+        if not error.retryable or attempt >= self.max_attempts:
+            return None
+        delay = self.backoff(previous)
+        if error.retry_after is not None:
+            delay = max(delay, error.retry_after)
+        if self.budget > 0 and elapsed + delay > self.budget:
+            return None
+        return delay
+
+
+class _RetryState:
+    """一次调用的重试过程，负责等待和记录指标"""
+
+    def __init__(self, client: "RetryingLLMClient"):
+        self.client = client
+        self.started = time.monotonic()
+        # 最后一次尝试开始的时间；与 started 之差即重试增加的延迟
+        self.last_attempt = self.started
+        self.attempt = 0
+        self.delay = 0.0
+
+    async def should_retry(self, error: Exception) -> bool:
+        """本次尝试失败后判断是否重试，需要重试时等待后返回 True"""
+        self.attempt += 1
+        llm_error = classify_error(error)
+        delay = self.client.policy.next_delay(
+            llm_error, self.attempt, time.monotonic() - self.started, self.delay
+        )
+        if delay is None:
+            if llm_error.retryable:
+                self.client._exhausted.inc()
+            self.finish()
+            return False
+        reason = str(llm_error.status_code) if llm_error.status_code else "network"
+        metrics.counter(
+            "llm_retries_total", {"provider": self.client.provider, "reason": reason}
+        ).inc()
+        self.client._delay.observe(delay)
+        self.delay = delay
+        await asyncio.sleep(delay)
+        self.last_attempt = time.monotonic()
+        return True
+
+    def finish(self) -> None:
+        """调用结束（成功或放弃），发生过重试时记录重试增加的延迟"""
+        if self.last_attempt > self.started:
+            self.client._added_latency.observe(self.last_attempt - self.started)
+
+
+class RetryingLLMClient(LLMClientWrapper):
+    """
+    按重试策略重试失败的上游调用
+
+    只重试 LLMError.retryable 为 True 的错误（限流、网关错误、连接失败等）。
+    流式调用只在收到第一个增量之前重试：已经向调用方输出内容后失败直接抛出，
+    否则调用方会收到重复的内容。
+    """
+
+    def __init__(
+        self,
+        inner: BaseLLMClient,
+        policy: Optional[RetryPolicy] = None,
+        provider: str = "default",
+    ):
+        """
+        初始化重试客户端
+
+        Args:
+            inner: 被包装的 LLM 客户端
+            policy: 重试策略，默认使用 RetryPolicy()
+            provider: 提供者名称，用作指标标签
+        """
+        super().__init__(inner)
+        self.policy = policy or RetryPolicy()
+        self.provider = provider
+        labels = {"provider": provider}
+        self._delay = metrics.histogram("llm_retry_delay_seconds", labels)
+        self._added_latency = metrics.histogram(
+            "llm_retry_added_latency_seconds", labels
+        )
+        self._exhausted = metrics.counter("llm_retries_exhausted_total", labels)
+
+    async def chat(
+        self,
+        messages: List[Dict[str, Any]],
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        max_completion_tokens: Optional[int] = None,
+        reasoning_effort: Optional[str] = None,
+        stream: bool = False,
+    ) -> str:
+        """发送聊天请求，失败时按策略重试"""
+        state = _RetryState(self)
+        while True:
+            try:
+                result = await self.inner.chat(
+                    messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    max_completion_tokens=max_completion_tokens,
+                    reasoning_effort=reasoning_effort,
+                    stream=stream,
+                )
+            except Exception as e:
+                if await state.should_retry(e):
+                    continue
+                raise
+            state.finish()
+            return result
+
+    async def chat_stream(
+        self,
+        messages: List[Dict[str, Any]],
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        max_completion_tokens: Optional[int] = None,
+        reasoning_effort: Optional[str] = None,
+    ) -> AsyncGenerator[str, None]:
+        """流式发送聊天请求，收到第一个增量之前失败时按策略重试"""
+        state = _RetryState(self)
+        while True:
+            stream = self.inner.chat_stream(
+                messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                max_completion_tokens=max_completion_tokens,
+                reasoning_effort=reasoning_effort,
+            )
+            try:
+                first = await stream.__anext__()
+            except StopAsyncIteration:
+                state.finish()
+                return
+            except Exception as e:
+                if await state.should_retry(e):
+                    continue
+                raise
+            state.finish()
+            try:
+                yield first
+                async for chunk in stream:
+                    yield chunk
+            finally:
+                await stream.aclose()
+            return
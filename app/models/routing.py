@@ -0,0 +1,233 @@
+"""多个上游之间的负载均衡和故障转移"""
+
+import random
+import time
+from typing import Any, AsyncGenerator, Dict, List, Optional
+
+from app.metrics import metrics
+from app.models.circuit_breaker import CircuitBreaker, CircuitOpenError
+from app.models.errors import classify_error
+from app.models.llm_client import BaseLLMClient
+
+# 请求本身有问题的状态码：换一个上游也会失败，不做故障转移
+NON_FAILOVER_STATUS_CODES = frozenset({400, 413, 422})
+
+
+class Backend:
+    """
+    一个上游（接入点或账号）
+
+    记录正在进行的请求数和响应耗时的指数加权移动平均（EWMA）。
+    非流式调用的耗时为完整耗时，流式调用为收到第一个增量的耗时。
+    失败按 error_penalty 秒计入 EWMA，使出错的上游在一段时间内少分到请求。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        client: BaseLLMClient,
+        alpha: float = 0.3,
+        initial_latency: float = 1.0,
+        error_penalty: float = 10.0,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        """
+        初始化上游
+
+        Args:
+            name: 上游名称，用作指标标签
+            client: 访问该上游的客户端
+            alpha: EWMA 平滑系数，越大越偏向最近的耗时
+            initial_latency: 还没有耗时样本时假设的耗时（秒）
+            error_penalty: 失败时计入 EWMA 的耗时（秒）
+            breaker: 该上游的熔断器（client 已通过它访问上游），打开时不优先选择
+        """
+        self.name = name
+        self.client = client
+        self.breaker = breaker
+        self.alpha = alpha
+        self.error_penalty = error_penalty
+        self.ewma = initial_latency
+        self.outstanding = 0
+        labels = {"backend": name}
+        self._outstanding_gauge = metrics.gauge("llm_backend_outstanding", labels)
+        self._ewma_gauge = metrics.gauge("llm_backend_latency_ewma_seconds", labels)
+        self._ewma_gauge.set(self.ewma)
+        self._results = {
+            outcome: metrics.counter(
+                "llm_backend_requests_total", {"backend": name, "outcome": outcome}
+            )
+            for outcome in ("success", "error")
+        }
+
+    @property
+    def available(self) -> bool:
+        """熔断器是否会放行请求"""
+        return self.breaker is None or self.breaker.available
+
+    @property
+    def score(self) -> float:
+        """预计等待时间：EWMA 耗时乘以（正在进行的请求数 + 1），越小越优先"""
+        return self.ewma * (self.outstanding + 1)
+
+    def acquire(self) -> float:
+        """开始一个请求，返回开始时间"""
+        self.outstanding += 1
+        self._outstanding_gauge.set(self.outstanding)
+        return time.monotonic()
+
+    def release(self) -> None:
+        """结束一个请求"""
+        self.outstanding -= 1
+        self._outstanding_gauge.set(self.outstanding)
+
+    def _update(self, latency: float) -> None:
+        self.ewma += self.alpha * (latency - self.ewma)
+        self._ewma_gauge.set(self.ewma)
+
+    def observe(self, latency: float) -> None:
+        """记录一次成功的耗时"""
+        self._update(latency)
+        self._results["success"].inc()
+
+    def observe_error(self) -> None:
+        """记录一次失败"""
+        self._update(max(self.error_penalty, self.ewma))
+        self._results["error"].inc()
+
+
+class RoutingLLMClient(BaseLLMClient):
+    """
+    在多个上游之间分配请求
+
+    每次选择预计等待时间（EWMA 耗时 ×（正在进行的请求数 + 1））最小的上游，
+    得分相同时随机选择，熔断器打开的上游排在最后。调用失败时依次换到下一个上游（每个上游最多尝试一次），
+    请求本身有问题（400、413、422）时直接抛出。
+    流式调用只在收到第一个增量之前故障转移。
+    """
+
+    def __init__(
+        self,
+        backends: List[Backend],
+        provider: str = "pool",
+        rand: Optional[random.Random] = None,
+    ):
+        """
+        初始化路由客户端
+
+        Args:
+            backends: 上游列表，至少一个
+            provider: 提供者名称，用作指标标签
+            rand: 随机数生成器（测试时可替换）
+        """
+        if not backends:
+            raise ValueError("RoutingLLMClient requires at least one backend")
+        self.backends = backends
+        # 会话历史和缓存按第一个上游的模型计算
+        self.model_name = backends[0].client.model_name
+        self._rand = rand or random.Random()
+        self._failovers = metrics.counter("llm_failovers_total", {"provider": provider})
+
+    def candidates(self) -> List[Backend]:
+        """按预计等待时间从小到大排列的上游，熔断器打开的上游排在最后"""
+        keyed = [
+            (not b.available, b.score, self._rand.random(), b) for b in self.backends
+        ]
+        keyed.sort(key=lambda item: item[:3])
+        return [item[3] for item in keyed]
+
+    def _should_failover(self, error: Exception) -> bool:
+        """上游的问题（而不是请求本身的问题）才换上游，并计入该上游的失败"""
+        status_code = classify_error(error).status_code
+        return status_code not in NON_FAILOVER_STATUS_CODES
+
+    async def chat(
+        self,
+        messages: List[Dict[str, Any]],
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        max_completion_tokens: Optional[int] = None,
+        reasoning_effort: Optional[str] = None,
+        stream: bool = False,
+    ) -> str:
+        """发送聊天请求，失败时换到下一个上游"""
+        candidates = self.candidates()
+        for index, backend in enumerate(candidates):
+            started = backend.acquire()
+            try:
+                result = await backend.client.chat(
+                    messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    max_completion_tokens=max_completion_tokens,
+                    reasoning_effort=reasoning_effort,
+                    stream=stream,
+                )
+            except Exception as e:
+                if not self._should_failover(e):
+                    raise
+                if not isinstance(e, CircuitOpenError):
+                    backend.observe_error()
+                if index + 1 == len(candidates):
+                    raise
+                self._failovers.inc()
+                continue
+            finally:
+                backend.release()
+            backend.observe(time.monotonic() - started)
+            return result
+        raise AssertionError("unreachable")
+
+    async def chat_stream(
+        self,
+        messages: List[Dict[str, Any]],
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        max_completion_tokens: Optional[int] = None,
+        reasoning_effort: Optional[str] = None,
+    ) -> AsyncGenerator[str, None]:
+        """流式发送聊天请求，收到第一个增量之前失败时换到下一个上游"""
+        candidates = self.candidates()
+        for index, backend in enumerate(candidates):
+            started = backend.acquire()
+            try:
+                stream = backend.client.chat_stream(
+                    messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    max_completion_tokens=max_completion_tokens,
+                    reasoning_effort=reasoning_effort,
+                )
+                try:
+                    first = await stream.__anext__()
+                except StopAsyncIteration:
+                    backend.observe(time.monotonic() - started)
+                    return
+                except Exception as e:
+                    if not self._should_failover(e):
+                        raise
+                    if not isinstance(e, CircuitOpenError):
+                        backend.observe_error()
+                    if index + 1 == len(candidates):
+                        raise
+                    self._failovers.inc()
+                    continue
+                backend.observe(time.monotonic() - started)
+                try:
+                    yield first
+                    async for chunk in stream:
+                        yield chunk
+                except Exception:
+                    # 已经输出内容，不能再换上游，只记录失败
+                    backend.observe_error()
+                    raise
+                finally:
+                    await stream.aclose()
+                return
+            finally:
+                backend.release()
+
+    async def close(self):
+        """关闭所有上游的客户端"""
+        for backend in self.backends:
+            await backend.client.close()
@@ -0,0 +1,319 @@
+"""近似重复请求的语义缓存（MinHash + LSH）"""
+
+import re
+import time
+import zlib
+from collections import OrderedDict, defaultdict
+from typing import Any, AsyncGenerator, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from app.metrics import metrics
+from app.models.cache import CACHE_BYPASS, CACHE_FORCE, cache_mode
+from app.models.llm_client import BaseLLMClient, LLMClientWrapper, request_fingerprint
+
+# MinHash 使用的梅森素数 2^61 - 1
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+
+# 去除标点符号（保留字母、数字、下划线、中文等字符和空白）
+_PUNCTUATION_RE = re.compile(r"[^\w\s]+")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """规范化文本：小写、去除标点、合并空白"""
+    text = _PUNCTUATION_RE.sub(" ", text.lower())
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+def shingle(text: str, size: int = 3) -> Set[str]:
+    """
+    把文本切分为字符级 shingle
+
+    使用字符 n-gram 而不是词，中文等没有空格分词的文本同样适用。
+
+    Args:
+        text: 规范化后的文本
+        size: 每个 shingle 的字符数
+
+    Returns:
+        shingle 集合；文本短于 size 时返回整个文本
+    """
+    if len(text) <= size:
+        return {text} if text else set()
+    return {text[i : i + size] for i in range(len(text) - size + 1)}
+
+
+class MinHasher:
+    """向量化的 MinHash 签名计算"""
+
+    def __init__(self, num_perm: int = 128, seed: int = 1):
+        """
+        初始化哈希函数族 h(x) = (a * x + b) mod p
+
+        Args:
+            num_perm: 哈希函数个数（签名长度）
+            seed: 随机种子，保证同一进程内签名稳定
+        """
+        rng = np.random.default_rng(seed)
+        # a、b 限制在 32 位内：与 32 位 shingle 哈希相乘不会溢出 uint64
+        self.a = rng.integers(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, 1 << 32, size=num_perm, dtype=np.uint64)
+        self.num_perm = num_perm
+
+    def signature(self, shingles: Set[str]) -> np.ndarray:
+        """计算 shingle 集合的 MinHash 签名"""
+        if not shingles:
+            return np.full(self.num_perm, _MERSENNE_PRIME, dtype=np.uint64)
+        hashes = np.fromiter(
+            (zlib.crc32(s.encode("utf-8")) for s in shingles),
+            dtype=np.uint64,
+            count=len(shingles),
+        )
+        # (n_shingles, num_perm) 一次性计算所有哈希函数，再按列取最小值
+        values = (hashes[:, None] * self.a[None, :] + self.b[None, :]) % _MERSENNE_PRIME
+        return values.min(axis=0)
+
+
+class _Entry:
+    """语义缓存条目"""
+
+    __slots__ = ("scope", "signature", "bands", "content", "expires_at")
+
+    def __init__(
+        self,
+        scope: str,
+        signature: np.ndarray,
+        bands: List[bytes],
+        content: str,
+        expires_at: float,
+    ):
+        self.scope = scope
+        self.signature = signature
+        self.bands = bands
+        self.content = content
+        self.expires_at = expires_at
+
+
+class SemanticCache:
+    """
+    基于 MinHash + LSH 的近似重复缓存
+
+    条目按作用域（模型、生成参数和历史消息指纹）隔离，只有作用域相同且
+    最后一条用户消息的估计 Jaccard 相似度不低于阈值时才命中。
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.8,
+        num_perm: int = 128,
+        bands: int = 32,
+        shingle_size: int = 3,
+        max_entries: int = 1024,
+        ttl: float = 600.0,
+        name: str = "",
+    ):
+        """
+        初始化语义缓存
+
+        Args:
+            threshold: 命中所需的最小 Jaccard 相似度
+            num_perm: MinHash 签名长度，必须能被 bands 整除
+            bands: LSH 分带数，越多召回越高、候选越多
+            shingle_size: 字符 shingle 长度
+            max_entries: 最大缓存条目数，超过后淘汰最久未使用的条目
+            ttl: 条目存活时间（秒）
+            name: 缓存名称，用作指标标签
+        """
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hasher = MinHasher(num_perm)
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._buckets: Dict[Tuple[str, int, bytes], Set[int]] = defaultdict(set)
+        self._next_id = 0
+
+        labels = {"cache": name} if name else None
+        self._hits = metrics.counter("llm_semantic_cache_hits_total", labels)
+        self._misses = metrics.counter("llm_semantic_cache_misses_total", labels)
+        self._hit_rate = metrics.gauge("llm_semantic_cache_hit_rate", labels)
+        self._lookup_latency = metrics.histogram(
+            "llm_semantic_cache_lookup_seconds", labels
+        )
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def hit_rate(self) -> float:
+        """命中率"""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def _signature(self, text: str) -> Tuple[np.ndarray, List[bytes]]:
+        signature = self.hasher.signature(
+            shingle(normalize_text(text), self.shingle_size)
+        )
+        bands = [
+            signature[i * self.rows : (i + 1) * self.rows].tobytes()
+            for i in range(self.bands)
+        ]
+        return signature, bands
+
+    def get(self, scope: str, text: str) -> Optional[str]:
+        """查找与 text 近似重复的缓存回复"""
+        started = time.perf_counter()
+        try:
+            signature, bands = self._signature(text)
+            candidates: Set[int] = set()
+            for i, band in enumerate(bands):
+                candidates |= self._buckets.get((scope, i, band), set())
+
+            now = time.monotonic()
+            best_id, best_score = None, 0.0
+            for entry_id in candidates:
+                entry = self._entries[entry_id]
+                if entry.expires_at <= now:
+                    self._remove(entry_id)
+                    continue
+                score = float(np.mean(entry.signature == signature))
+                if score >= self.threshold and score > best_score:
+                    best_id, best_score = entry_id, score
+
+            if best_id is None:
+                self.misses += 1
+                self._misses.inc()
+                return None
+
+            self._entries.move_to_end(best_id)
+            self.hits += 1
+            self._hits.inc()
+            return self._entries[best_id].content
+        finally:
+            self._hit_rate.set(self.hit_rate)
+            self._lookup_latency.observe(time.perf_counter() - started)
+
+    def set(self, scope: str, text: str, content: str) -> None:
+        """写入缓存，超过容量时淘汰最久未使用的条目"""
+        signature, bands = self._signature(text)
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = _Entry(
+            scope, signature, bands, content, time.monotonic() + self.ttl
+        )
+        for i, band in enumerate(bands):
+            self._buckets[(scope, i, band)].add(entry_id)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id)
+        for i, band in enumerate(entry.bands):
+            key = (entry.scope, i, band)
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[key]
+
+
+class SemanticCachingLLMClient(LLMClientWrapper):
+    """
+    在客户端前增加近似重复缓存
+
+    对最后一条用户消息做 shingle + MinHash，之前的消息（历史）计算精确指纹
+    并与模型、生成参数一起作为作用域。与精确匹配缓存使用相同的缓存模式：
+    默认只处理 temperature 为 0 的请求，bypass 时跳过。多模态消息不参与缓存。
+    """
+
+    def __init__(self, inner: BaseLLMClient, cache: SemanticCache):
+        """
+        初始化语义缓存客户端
+
+        Args:
+            inner: 被包装的 LLM 客户端
+            cache: 语义缓存
+        """
+        super().__init__(inner)
+        self.cache = cache
+
+    def _lookup_key(
+        self, messages: List[Dict[str, Any]], params: Dict[str, Any]
+    ) -> Optional[Tuple[str, str]]:
+        """返回 (作用域, 最后一条用户消息)；不应使用缓存时返回 None"""
+        mode = cache_mode.get()
+        if mode == CACHE_BYPASS:
+            return None
+        if mode != CACHE_FORCE and params["temperature"] != 0:
+            return None
+        if not messages:
+            return None
+        last = messages[-1]
+        if last.get("role") != "user" or not isinstance(last.get("content"), str):
+            return None
+        scope = request_fingerprint(self.model_name, list(messages[:-1]), **params)
+        return scope, last["content"]
+
+    async def chat(
+        self,
+        messages: List[Dict[str, Any]],
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        max_completion_tokens: Optional[int] = None,
+        reasoning_effort: Optional[str] = None,
+        stream: bool = False,
+    ) -> str:
+        """发送聊天请求，存在近似重复的缓存回复时直接返回"""
+        params: Dict[str, Any] = {
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "max_completion_tokens": max_completion_tokens,
+            "reasoning_effort": reasoning_effort,
+        }
+        key = self._lookup_key(messages, params)
+        if key is not None:
+            cached = self.cache.get(*key)
+            if cached is not None:
+                return cached
+
+        content = await self.inner.chat(messages, stream=stream, **params)
+        if key is not None:
+            self.cache.set(*key, content)
+        return content
+
+    async def chat_stream(
+        self,
+        messages: List[Dict[str, Any]],
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        max_completion_tokens: Optional[int] = None,
+        reasoning_effort: Optional[str] = None,
+    ) -> AsyncGenerator[str, None]:
+        """流式发送聊天请求，命中时一次性返回缓存内容"""
+        params: Dict[str, Any] = {
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "max_completion_tokens": max_completion_tokens,
+            "reasoning_effort": reasoning_effort,
+        }
+        key = self._lookup_key(messages, params)
+        if key is not None:
+            cached = self.cache.get(*key)
+            if cached is not None:
+                yield cached
+                return
+
+        parts = []
+        async for chunk in self.inner.chat_stream(messages, **params):
+            parts.append(chunk)
+            yield chunk
+
+        if key is not None:
+            self.cache.set(*key, "".join(parts))
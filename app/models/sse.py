@@ -0,0 +1,270 @@
+"""增量 SSE（Server-Sent Events）解码：直接处理 aiter_bytes() 的原始字节块"""
+
+from typing import Any, Dict, Iterable, List, Optional
+
+from app import codec
+from app.metrics import metrics
+
+_BOM = b"\xef\xbb\xbf"
+_DATA_PREFIX = b"data: "
+_DONE = b"[DONE]"
+
+
+class SSEEvent:
+    """
+    一条 SSE 事件
+
+    data 保持为原始字节（多行 data 字段以换行连接），JSON 数据直接交给解码器，
+    不需要先解码成字符串。
+    """
+
+    __slots__ = ("event", "data", "id", "retry")
+
+    def __init__(
+        self,
+        data: bytes,
+        event: str = "message",
+        id: Optional[str] = None,
+        retry: Optional[int] = None,
+    ):
+        self.data = data
+        self.event = event
+        self.id = id
+        self.retry = retry
+
+    @property
+    def text(self) -> str:
+        """事件数据的文本形式"""
+        return self.data.decode("utf-8", "replace")
+
+    def __repr__(self) -> str:
+        return f"SSEEvent(event={self.event!r}, data={self.data!r}, id={self.id!r})"
+
+
+class SSEDecoder:
+    """
+    按 WHATWG 规范增量解码 SSE 字节流
+
+    支持 \\n、\\r\\n、\\r 三种换行、注释行、多行 data、event / id / retry 字段，
+    字节块可以在任意位置切开（包括 UTF-8 多字节字符和 \\r\\n 中间）。
+    事件只在空行处分发；流结束时未以空行结束的事件按规范丢弃。
+    """
+
+    def __init__(self):
+        # 还没有收到换行的字节块，收到换行时一次拼接
+        self._parts: List[bytes] = []
+        # 上一个字节块以 \r 结尾，需要看下一个字节是否为 \n
+        self._pending_cr = False
+        self._started = False
+        self._data: List[bytes] = []
+        self._event: Optional[str] = None
+        self._retry: Optional[int] = None
+        self.last_event_id: Optional[str] = None
+
+    def feed(self, chunk: bytes) -> List[SSEEvent]:
+        """
+        输入一个字节块
+
+        Args:
+            chunk: 从网络读到的原始字节
+
+        Returns:
+            本次输入后完整的事件（可能为空）
+        """
+        if b"\n" not in chunk and b"\r" not in chunk and not self._pending_cr:
+            if chunk:
+                self._parts.append(chunk)
+            return []
+        if self._parts:
+            self._parts.append(chunk)
+            buffer = b"".join(self._parts)
+        else:
+            buffer = chunk
+        if not self._started:
+            self._started = True
+            if buffer.startswith(_BOM):
+                buffer = buffer[len(_BOM) :]
+
+        pending_cr = b""
+        self._pending_cr = False
+        if b"\r" in buffer:
+            # 结尾的 \r 可能是被切开的 \r\n，留到下一个字节块再处理
+            if buffer.endswith(b"\r"):
+                buffer = buffer[:-1]
+                pending_cr = b"\r"
+                self._pending_cr = True
+            buffer = buffer.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+
+        # 空行分隔事件；最后一段是还没有以空行结束的不完整事件，留到下一个字节块
+        blocks = buffer.split(b"\n\n")
+        tail = blocks.pop() + pending_cr
+        self._parts = [tail] if tail else []
+        events: List[SSEEvent] = []
+        for block in blocks:
+            if block.startswith(_DATA_PREFIX) and b"\n" not in block:
+                # 最常见的单行 "data: ..." 事件走快速路径（数据为空时按规范不分发）
+                if len(block) > 6:
+                    events.append(SSEEvent(block[6:], "message", self.last_event_id))
+                continue
+            for line in block.split(b"\n"):
+                if not line:
+                    # 多个连续空行
+                    self._dispatch(events)
+                elif line.startswith(_DATA_PREFIX):
+                    self._data.append(line[6:])
+                else:
+                    self._field(line)
+            self._dispatch(events)
+        return events
+
+    def close(self) -> List[SSEEvent]:
+        """
+        流结束
+
+        以 \\r 结尾的最后一行在这里完成；未以空行结束的事件按规范丢弃。
+        """
+        events = self.feed(b"\n") if self._pending_cr else []
+        self._parts = []
+        self._pending_cr = False
+        self._data = []
+        self._event = None
+        self._retry = None
+        return events
+
+    def _field(self, line: bytes) -> None:
+        if line[0] == 0x3A:  # ":" 开头是注释
+            return
+        colon = line.find(b":")
+        if colon < 0:
+            name, value = line, b""
+        else:
+            name, value = line[:colon], line[colon + 1 :]
+            if value[:1] == b" ":
+                value = value[1:]
+        if name == b"data":
+            self._data.append(value)
+        elif name == b"event":
+            self._event = value.decode("utf-8", "replace")
+        elif name == b"id":
+            if b"\0" not in value:
+                self.last_event_id = value.decode("utf-8", "replace")
+        elif name == b"retry":
+            if value.isdigit():
+                self._retry = int(value)
+        # 其他字段按规范忽略
+
+    def _dispatch(self, events: List[SSEEvent]) -> None:
+        data = self._data
+        self._data = []
+        # 只有一个空的 data 字段时数据为空字符串，按规范不分发
+        if data and data != [b""]:
+            events.append(
+                SSEEvent(
+                    data[0] if len(data) == 1 else b"\n".join(data),
+                    self._event or "message",
+                    self.last_event_id,
+                    self._retry,
+                )
+            )
+        self._event = None
+        self._retry = None
+
+
+# 聊天流事件类型
+DELTA = "delta"
+FINISH = "finish"
+USAGE = "usage"
+ERROR = "error"
+DONE = "done"
+
+
+class ChatStreamEvent:
+    """
+    从 OpenAI 兼容的聊天补全流中解析出的结构化事件
+
+    type 为 delta（content 为文本增量）、finish（finish_reason）、usage（token 用量）、
+    error（上游在流中途发送的错误）或 done（[DONE] 结束标记）。
+    """
+
+    __slots__ = ("type", "content", "finish_reason", "usage", "error")
+
+    def __init__(
+        self,
+        type: str,
+        content: str = "",
+        finish_reason: Optional[str] = None,
+        usage: Optional[Dict[str, Any]] = None,
+        error: Any = None,
+    ):
+        self.type = type
+        self.content = content
+        self.finish_reason = finish_reason
+        self.usage = usage
+        self.error = error
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, ChatStreamEvent):
+            return NotImplemented
+        return all(
+            getattr(self, name) == getattr(other, name) for name in self.__slots__
+        )
+
+    def __repr__(self) -> str:
+        fields = ", ".join(
+            f"{name}={getattr(self, name)!r}"
+            for name in self.__slots__
+            if getattr(self, name) not in (None, "")
+        )
+        return f"ChatStreamEvent({fields})"
+
+
+class ChatStreamParser:
+    """把原始 SSE 字节块解析为 ChatStreamEvent"""
+
+    def __init__(self):
+        self.decoder = SSEDecoder()
+        self._loads = codec.get_codec().loads
+        self._malformed = metrics.counter("llm_stream_malformed_frames_total")
+
+    def feed(self, chunk: bytes) -> List[ChatStreamEvent]:
+        """输入一个字节块，返回解析出的结构化事件"""
+        return self._parse(self.decoder.feed(chunk))
+
+    def close(self) -> List[ChatStreamEvent]:
+        """流结束，返回剩余的结构化事件"""
+        return self._parse(self.decoder.close())
+
+    def _parse(self, events: Iterable[SSEEvent]) -> List[ChatStreamEvent]:
+        parsed: List[ChatStreamEvent] = []
+        for event in events:
+            if event.data == _DONE:
+                parsed.append(ChatStreamEvent(DONE))
+                continue
+            try:
+                data = self._loads(event.data)
+            except ValueError:
+                if event.event == "error":
+                    parsed.append(ChatStreamEvent(ERROR, error=event.text))
+                else:
+                    self._malformed.inc()
+                continue
+            if event.event == "error" or (isinstance(data, dict) and "error" in data):
+                error = data.get("error", data) if isinstance(data, dict) else data
+                parsed.append(ChatStreamEvent(ERROR, error=error))
+                continue
+            if not isinstance(data, dict):
+                self._malformed.inc()
+                continue
+            choices = data.get("choices")
+            if choices:
+                choice = choices[0]
+                content = (choice.get("delta") or {}).get("content")
+                if content:
+                    parsed.append(ChatStreamEvent(DELTA, content=content))
+                if choice.get("finish_reason"):
+                    parsed.append(
+                        ChatStreamEvent(FINISH, finish_reason=choice["finish_reason"])
+                    )
+            if data.get("usage"):
+                parsed.append(ChatStreamEvent(USAGE, usage=data["usage"]))
+        return parsed
@@ -0,0 +1,186 @@
+"""流式结果收集：拼接增量，记录首 token 延迟、增量间隔、用量和结束原因"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from app.metrics import metrics
+
+
+class StreamResult:
+    """
+    一次生成的完整结果
+
+    时间单位为秒，从发起请求开始计时。非流式请求只有一个增量，
+    首 token 延迟即收到完整回复的时间。
+    usage 和 finish_reason 来自上游，命中缓存等情况下为 None。
+    """
+
+    __slots__ = (
+        "content",
+        "chunk_count",
+        "ttft",
+        "duration",
+        "gaps",
+        "usage",
+        "finish_reason",
+    )
+
+    def __init__(
+        self,
+        content: str,
+        chunk_count: int,
+        ttft: Optional[float],
+        duration: float,
+        gaps: List[float],
+        usage: Optional[Dict[str, Any]] = None,
+        finish_reason: Optional[str] = None,
+    ):
+        self.content = content
+        self.chunk_count = chunk_count
+        self.ttft = ttft
+        self.duration = duration
+        self.gaps = gaps
+        self.usage = usage
+        self.finish_reason = finish_reason
+
+    @property
+    def inter_chunk_mean(self) -> Optional[float]:
+        """相邻增量的平均间隔"""
+        return sum(self.gaps) / len(self.gaps) if self.gaps else None
+
+    @property
+    def inter_chunk_max(self) -> Optional[float]:
+        """相邻增量的最大间隔"""
+        return max(self.gaps) if self.gaps else None
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        响应中返回的统计信息（时间单位为毫秒）
+
+        Returns:
+            finish_reason、usage、ttft_ms、duration_ms、chunk_count、
+            inter_chunk_mean_ms、inter_chunk_max_ms
+        """
+        return {
+            "finish_reason": self.finish_reason,
+            "usage": self.usage,
+            "ttft_ms": _ms(self.ttft),
+            "duration_ms": _ms(self.duration),
+            "chunk_count": self.chunk_count,
+            "inter_chunk_mean_ms": _ms(self.inter_chunk_mean),
+            "inter_chunk_max_ms": _ms(self.inter_chunk_max),
+        }
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return round(seconds * 1000, 3) if seconds is not None else None
+
+
+class StreamAccumulator:
+    """
+    收集一次生成的增量和元数据
+
+    增量保存在列表中，结束时一次拼接（线性时间）；每个增量到达时记录时间。
+    客户端通过 record_usage / record_finish_reason 把上游返回的元数据写入当前收集器。
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.perf_counter):
+        """
+        初始化收集器，从此刻开始计时
+
+        Args:
+            clock: 计时函数（测试时可替换）
+        """
+        self._clock = clock
+        self.started = clock()
+        self._parts: List[str] = []
+        self._gaps: List[float] = []
+        self._first: Optional[float] = None
+        self._last: Optional[float] = None
+        self.usage: Optional[Dict[str, Any]] = None
+        self.finish_reason: Optional[str] = None
+
+    def add(self, chunk: str) -> None:
+        """记录一个增量"""
+        now = self._clock()
+        if self._last is None:
+            self._first = now
+        else:
+            self._gaps.append(now - self._last)
+        self._last = now
+        self._parts.append(chunk)
+
+    @property
+    def content(self) -> str:
+        """目前收到的全部内容"""
+        return "".join(self._parts)
+
+    def result(self) -> StreamResult:
+        """结束计时并生成结果"""
+        return StreamResult(
+            content=self.content,
+            chunk_count=len(self._parts),
+            ttft=self._first - self.started if self._first is not None else None,
+            duration=self._clock() - self.started,
+            gaps=self._gaps,
+            usage=self.usage,
+            finish_reason=self.finish_reason,
+        )
+
+
+# 当前请求的元数据收集器；客户端把上游返回的 usage、finish_reason 写入其中。
+# 流式调用在独立任务中读取上游时，任务创建时复制上下文，写入的仍是同一个收集器
+stream_metadata: ContextVar[Optional[StreamAccumulator]] = ContextVar(
+    "stream_metadata", default=None
+)
+
+
+@contextmanager
+def collect_stream_metadata(
+    accumulator: StreamAccumulator,
+) -> Iterator[StreamAccumulator]:
+    """在上下文内把上游元数据写入指定的收集器"""
+    token = stream_metadata.set(accumulator)
+    try:
+        yield accumulator
+    finally:
+        stream_metadata.reset(token)
+
+
+def record_usage(usage: Optional[Dict[str, Any]]) -> None:
+    """记录上游返回的 token 用量（没有收集器时忽略）"""
+    accumulator = stream_metadata.get()
+    if accumulator is not None and usage:
+        accumulator.usage = usage
+
+
+def record_finish_reason(finish_reason: Optional[str]) -> None:
+    """记录上游返回的结束原因（没有收集器时忽略）"""
+    accumulator = stream_metadata.get()
+    if accumulator is not None and finish_reason:
+        accumulator.finish_reason = finish_reason
+
+
+def observe_stream_result(result: StreamResult, provider: str) -> None:
+    """
+    把一次生成的耗时写入指标
+
+    Args:
+        result: 生成结果
+        provider: 提供者名称，用作指标标签
+    """
+    labels = {"provider": provider}
+    metrics.histogram("llm_duration_seconds", labels).observe(result.duration)
+    if result.ttft is not None:
+        metrics.histogram("llm_ttft_seconds", labels).observe(result.ttft)
+    if result.inter_chunk_mean is not None:
+        metrics.histogram("llm_inter_chunk_seconds", labels).observe(
+            result.inter_chunk_mean
+        )
+    if result.finish_reason:
+        metrics.counter(
+            "llm_finish_reason_total",
+            {"provider": provider, "reason": result.finish_reason},
+        ).inc()
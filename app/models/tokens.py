@@ -0,0 +1,77 @@
+"""Token 数估算（本地近似，无需下载分词器）"""
+
+from typing import Any, Dict
+
+# 每条消息的固定开销（角色、分隔符等）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# 每张图片按固定 token 数估算
+IMAGE_TOKENS = 765
+
+# 非 CJK 文本平均每个 token 的字符数
+CHARS_PER_TOKEN = 4
+
+
+def _is_cjk(char: str) -> bool:
+    """是否为中日韩字符（通常每个字符约占一个 token）"""
+    code = ord(char)
+    return (
+        0x4E00 <= code <= 0x9FFF  # CJK 统一表意文字
+        or 0x3400 <= code <= 0x4DBF  # CJK 扩展 A
+        or 0x3040 <= code <= 0x30FF  # 日文假名
+        or 0xAC00 <= code <= 0xD7AF  # 韩文音节
+        or 0xF900 <= code <= 0xFAFF  # CJK 兼容表意文字
+        or 0x3000 <= code <= 0x303F  # CJK 标点
+        or 0xFF00 <= code <= 0xFFEF  # 全角字符
+    )
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    估算文本的 token 数
+
+    CJK 字符按每个字符 1 个 token 计，其余字符按每 4 个字符 1 个 token 计。
+
+    Args:
+        text: 文本
+
+    Returns:
+        估算的 token 数
+    """
+    if not text:
+        return 0
+    cjk = sum(1 for char in text if _is_cjk(char))
+    other = len(text) - cjk
+    return cjk + (other + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def estimate_content_tokens(content: Any) -> int:
+    """
+    估算消息内容的 token 数
+
+    Args:
+        content: 字符串，或多模态内容数组（text / image_url 等部分）
+
+    Returns:
+        估算的 token 数
+    """
+    if isinstance(content, str):
+        return estimate_tokens(content)
+    if isinstance(content, list):
+        total = 0
+        for part in content:
+            if not isinstance(part, dict):
+                total += estimate_tokens(str(part))
+            elif part.get("type") == "text":
+                total += estimate_tokens(part.get("text", ""))
+            elif part.get("type") in ("image_url", "image"):
+                total += IMAGE_TOKENS
+            else:
+                total += estimate_tokens(str(part))
+        return total
+    return estimate_tokens(str(content)) if content is not None else 0
+
+
+def estimate_message_tokens(message: Dict[str, Any]) -> int:
+    """估算单条消息的 token 数（内容 + 固定开销）"""
+    return MESSAGE_OVERHEAD_TOKENS + estimate_content_tokens(message.get("content"))
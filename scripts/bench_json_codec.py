@@ -0,0 +1,79 @@
+"""
+JSON 编解码基准
+
+模拟一次流式聊天请求中的 JSON 处理：解析并校验 ChatRequest 请求体、解码上游的每个 SSE
+增量、编码发给客户端的每个 SSE 事件，对比标准库 json 和当前可用的最快编解码器。
+
+用法：
+    LLM_API_KEY=test python scripts/bench_json_codec.py [增量数] [请求消息数]
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.api.chat import ChatRequest  # noqa: E402
+from app.codec import JSONCodec, _build_codec  # noqa: E402
+
+
+def _request_body(messages: int) -> bytes:
+    return JSONCodec().dumps(
+        {
+            "messages": [
+                {"role": "user", "content": f"第 {i} 个问题：" + "请解释一下" * 40}
+                for i in range(messages)
+            ],
+            "session_id": "s-1",
+            "temperature": 0.7,
+            "stream": True,
+        }
+    )
+
+
+def _upstream_chunk(i: int) -> str:
+    return (
+        JSONCodec()
+        .dumps(
+            {
+                "id": "chatcmpl-1",
+                "object": "chat.completion.chunk",
+                "model": "doubao-seed-1-6-lite-251015",
+                "choices": [{"index": 0, "delta": {"content": f"片段{i}"}}],
+            }
+        )
+        .decode("utf-8")
+    )
+
+
+def main() -> None:
+    chunks = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    messages = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    body = _request_body(messages)
+    upstream = [_upstream_chunk(i) for i in range(chunks)]
+    print(f"请求体 {len(body)} 字节，{chunks} 个流式增量")
+
+    def request_cycle(codec) -> None:
+        ChatRequest.model_validate(codec.loads(body))
+        for line in upstream:
+            data = codec.loads(line)
+            content = data["choices"][0]["delta"]["content"]
+            codec.dumps({"content": content})
+        codec.dumps({"session_id": "s-1", "model": "doubao", "finish_reason": "stop"})
+
+    results = {}
+    for codec in (JSONCodec(), _build_codec("auto")):
+        number = 200
+        seconds = min(
+            timeit.repeat(lambda: request_cycle(codec), number=number, repeat=5)
+        )
+        results[codec.name] = seconds / number
+        print(f"  {codec.name:<8} {seconds / number * 1e6:10.1f} µs CPU / 请求")
+    fast = _build_codec("auto").name
+    if fast != "json":
+        print(f"  {fast} 相对标准库加速 {results['json'] / results[fast]:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+请求体编码基准
+
+对比每次请求重新序列化整个对话历史（httpx 的 json= 参数）和拼接缓存的消息编码。
+
+用法：
+    LLM_API_KEY=test python scripts/bench_request_encoding.py [轮数] [每条消息字符数]
+"""
+
+import asyncio
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.api.session_store import SessionStore  # noqa: E402
+from app.models.encoding import encode_request_body  # noqa: E402
+
+
+async def _history(turns: int, length: int) -> list:
+    """写入会话存储后读出的历史（消息带有缓存的编码）"""
+    store = SessionStore()
+    for turn in range(turns):
+        await store.append(
+            "s", {"role": "user", "content": f"问题 {turn} " + "问" * length}, 1
+        )
+        await store.append(
+            "s", {"role": "assistant", "content": f"回复 {turn} " + "答" * length}, 1
+        )
+    session = await store.get("s")
+    return list(session.messages)
+
+
+def main() -> None:
+    turns = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    length = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    history = asyncio.run(_history(turns, length))
+    new_message = {"role": "user", "content": "新的问题"}
+    payload = {"model": "doubao-seed-1-6-lite-251015", "temperature": 0.7}
+    messages = history + [new_message]
+    plain = [dict(m) for m in messages]
+
+    def full_encode() -> bytes:
+        # 与 httpx 处理 json= 参数的方式相同
+        return json.dumps({**payload, "messages": plain}, ensure_ascii=False).encode()
+
+    def fragments() -> bytes:
+        return encode_request_body(payload, messages)
+
+    assert json.loads(full_encode()) == json.loads(fragments())
+    number = 200
+    print(
+        f"{turns} 轮对话，每条消息约 {length} 个字符（请求体 {len(fragments())} 字节）"
+    )
+    results = {}
+    for name, func in (("重新序列化", full_encode), ("拼接缓存编码", fragments)):
+        seconds = min(timeit.repeat(func, number=number, repeat=5)) / number
+        results[name] = seconds
+        print(f"  {name:<8} {seconds * 1e6:10.1f} µs / 请求")
+    print(f"  加速 {results['重新序列化'] / results['拼接缓存编码']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
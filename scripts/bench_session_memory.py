@@ -0,0 +1,87 @@
+"""
+会话存储内存占用基准
+
+对比原来的 dict + list 表示和 SessionStore 的紧凑表示在大量会话下的内存占用。
+
+用法：
+    LLM_API_KEY=test python scripts/bench_session_memory.py [会话数] [每个会话的轮数]
+"""
+
+import asyncio
+import os
+import sys
+import tracemalloc
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.api.session_store import SessionStore  # noqa: E402
+
+COMMON_REPLIES = ["好的", "谢谢", "继续", "明白了，请继续。", "OK"]
+
+
+def _turns(session_index: int, turns: int):
+    """生成一个会话的消息：部分是常见的重复内容，部分是唯一内容"""
+    for turn in range(turns):
+        if turn % 2:
+            user = COMMON_REPLIES[(session_index + turn) % len(COMMON_REPLIES)]
+        else:
+            user = f"第 {turn} 个问题：会话 {session_index} 想了解的内容"
+        # 从 JSON 解析出的字符串每次都是新对象，这里同样每次构造新字符串
+        yield "".join(["us", "er"]), "".join(list(user))
+        yield "".join(["assis", "tant"]), f"回复 {session_index}-{turn}：" + "内容" * 20
+
+
+def measure_legacy(sessions: int, turns: int) -> int:
+    tracemalloc.start()
+    histories = defaultdict(list)
+    token_counts = defaultdict(list)
+    for i in range(sessions):
+        session_id = f"session-{i:08d}"
+        for role, content in _turns(i, turns):
+            histories[session_id].append({"role": role, "content": content})
+            token_counts[session_id].append(len(content))
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current
+
+
+async def _fill(store: SessionStore, sessions: int, turns: int) -> None:
+    for i in range(sessions):
+        session_id = f"session-{i:08d}"
+        for role, content in _turns(i, turns):
+            await store.append(
+                session_id, {"role": role, "content": content}, len(content)
+            )
+
+
+def measure_compact(sessions: int, turns: int) -> int:
+    # 事件循环在开始统计之前创建，不计入会话存储的内存
+    loop = asyncio.new_event_loop()
+    tracemalloc.start()
+    store = SessionStore(max_sessions=0, max_bytes=0, ttl=0)
+    loop.run_until_complete(_fill(store, sessions, turns))
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    loop.close()
+    print(f"  SessionStore 估算内存: {store.nbytes / 1024 / 1024:.1f} MiB")
+    return current
+
+
+def main() -> None:
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    turns = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    print(f"{sessions} 个会话，每个会话 {turns} 轮（{2 * turns} 条消息）")
+
+    legacy = measure_legacy(sessions, turns)
+    compact = measure_compact(sessions, turns)
+    for name, total in (("dict + list", legacy), ("SessionStore", compact)):
+        print(
+            f"  {name:<14} {total / 1024 / 1024:8.1f} MiB"
+            f"  每个会话 {total / sessions:8.0f} B"
+        )
+    print(f"  节省 {(1 - compact / legacy) * 100:.0f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+SSE 流解析基准
+
+回放一段录制格式的流式响应（数千个很小的增量，按网络字节块切分），对比原来的
+aiter_lines() + 字符串前缀判断 + json.loads 解析，和直接处理原始字节块的增量解码器。
+
+用法：
+    LLM_API_KEY=test python scripts/bench_sse_decoder.py [增量数] [字节块大小]
+"""
+
+import json
+import os
+import sys
+import timeit
+
+from httpx._decoders import LineDecoder, TextDecoder
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.models.sse import DELTA, ChatStreamParser  # noqa: E402
+
+
+def _captured_stream(deltas: int) -> bytes:
+    """生成与豆包接口相同格式的流式响应体"""
+    frames = []
+    for i in range(deltas):
+        chunk = {
+            "choices": [{"delta": {"content": "字" if i % 2 else "a"}, "index": 0}],
+            "created": 1760000000,
+            "id": "021760000000000abcdef",
+            "model": "doubao-seed-1-6-lite-251015",
+            "service_tier": "default",
+            "object": "chat.completion.chunk",
+            "usage": None,
+        }
+        frames.append("data: " + json.dumps(chunk, ensure_ascii=False) + "\n\n")
+    frames.append("data: [DONE]\n\n")
+    return "".join(frames).encode("utf-8")
+
+
+def _split(body: bytes, size: int):
+    return [body[i : i + size] for i in range(0, len(body), size)]
+
+
+def legacy_parse(chunks) -> str:
+    """原来的解析方式：httpx aiter_lines() 的解码步骤 + 逐行 json.loads"""
+    text_decoder = TextDecoder()
+    line_decoder = LineDecoder()
+    content = []
+
+    def lines():
+        for chunk in chunks:
+            yield from line_decoder.decode(text_decoder.decode(chunk))
+        yield from line_decoder.decode(text_decoder.flush())
+        yield from line_decoder.flush()
+
+    for line in lines():
+        if not line.strip():
+            continue
+        if line.startswith("data: "):
+            data_str = line[6:]
+            if data_str == "[DONE]":
+                break
+            try:
+                data = json.loads(data_str)
+                if "choices" in data and len(data["choices"]) > 0:
+                    delta = data["choices"][0].get("delta", {})
+                    text = delta.get("content", "")
+                    if text:
+                        content.append(text)
+            except json.JSONDecodeError:
+                continue
+    return "".join(content)
+
+
+def decoder_parse(chunks) -> str:
+    """增量字节解码器"""
+    parser = ChatStreamParser()
+    content = []
+    for chunk in chunks:
+        for event in parser.feed(chunk):
+            if event.type == DELTA:
+                content.append(event.content)
+    for event in parser.close():
+        if event.type == DELTA:
+            content.append(event.content)
+    return "".join(content)
+
+
+def main() -> None:
+    deltas = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 512
+    body = _captured_stream(deltas)
+    chunks = _split(body, size)
+    assert legacy_parse(chunks) == decoder_parse(chunks)
+    print(f"{deltas} 个增量，{len(body)} 字节，{len(chunks)} 个 {size} 字节的字节块")
+
+    results = {}
+    for name, func in (("aiter_lines", legacy_parse), ("SSEDecoder", decoder_parse)):
+        seconds = min(timeit.repeat(lambda: func(chunks), number=5, repeat=5)) / 5
+        results[name] = seconds
+        print(
+            f"  {name:<12} {seconds * 1e3:8.2f} ms / 流"
+            f"  {seconds / deltas * 1e6:6.2f} µs / 增量"
+        )
+    print(f"  加速 {results['aiter_lines'] / results['SSEDecoder']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
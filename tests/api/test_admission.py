@@ -0,0 +1,148 @@
+"""准入控制测试"""
+
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app.api.admission import Admission, AdmissionController
+from app.main import app
+
+
+@pytest.mark.asyncio
+async def test_admits_up_to_concurrency_limit():
+    """测试并发未满时立即放行，归还后名额可复用"""
+    admission = Admission(2, 2, max_queue=0, queue_timeout=1)
+    first = await admission.acquire("doubao")
+    second = await admission.acquire("doubao")
+    assert admission.global_controller.in_flight == 2
+
+    first.release()
+    first.release()  # 重复归还无效
+    third = await admission.acquire("doubao")
+    assert admission.global_controller.in_flight == 2
+
+    second.release()
+    third.release()
+    assert admission.global_controller.in_flight == 0
+    assert admission.provider("doubao").in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_rejects_with_429_when_queue_full():
+    """测试等待队列已满时返回 429 和 Retry-After"""
+    admission = Admission(1, 1, max_queue=0, queue_timeout=1)
+    slot = await admission.acquire("doubao")
+
+    with pytest.raises(HTTPException) as exc_info:
+        await admission.acquire("doubao")
+    assert exc_info.value.status_code == 429
+    assert int(exc_info.value.headers["Retry-After"]) >= 1
+    slot.release()
+
+
+@pytest.mark.asyncio
+async def test_rejects_with_503_after_queue_timeout():
+    """测试排队超过时间预算时返回 503"""
+    admission = Admission(1, 1, max_queue=10, queue_timeout=0.05)
+    slot = await admission.acquire("doubao")
+
+    with pytest.raises(HTTPException) as exc_info:
+        await admission.acquire("doubao")
+    assert exc_info.value.status_code == 503
+    assert "Retry-After" in exc_info.value.headers
+    assert admission.provider("doubao").waiting == 0
+    slot.release()
+
+
+@pytest.mark.asyncio
+async def test_free_slot_admitted_with_exhausted_budget():
+    """测试排队时间预算已在前一级用完时，有空闲名额仍直接放行"""
+    controller = AdmissionController("free-slot", 4, 4)
+    await controller.acquire(0)
+    await controller.acquire(-1)
+    assert controller.in_flight == 2
+
+    controller.release(0)
+    controller.release(0)
+
+
+@pytest.mark.asyncio
+async def test_queued_request_admitted_on_release():
+    """测试排队中的请求在名额归还后获得放行"""
+    admission = Admission(1, 1, max_queue=10, queue_timeout=1)
+    slot = await admission.acquire("doubao")
+
+    waiter = asyncio.create_task(admission.acquire("doubao"))
+    await asyncio.sleep(0.01)
+    assert admission.provider("doubao").waiting == 1
+
+    slot.release()
+    (await waiter).release()
+
+
+@pytest.mark.asyncio
+async def test_providers_limited_independently():
+    """测试不同提供者的并发上限互不影响"""
+    admission = Admission(10, 1, max_queue=0, queue_timeout=1)
+    doubao = await admission.acquire("doubao")
+    openai = await admission.acquire("openai")
+
+    with pytest.raises(HTTPException):
+        await admission.acquire("doubao")
+    # 被拒绝的请求不占用全局名额
+    assert admission.global_controller.in_flight == 2
+
+    doubao.release()
+    openai.release()
+
+
+def test_chat_endpoint_returns_admission_rejection():
+    """测试路由把准入拒绝原样返回给调用方"""
+    mock_client = MagicMock()
+    mock_client.model_name = "test-model"
+    mock_client.chat = AsyncMock(return_value="AI response")
+    mock_admission = MagicMock()
+    mock_admission.acquire = AsyncMock(
+        side_effect=HTTPException(
+            status_code=503, detail="busy", headers={"Retry-After": "3"}
+        )
+    )
+
+    with patch("app.api.chat.get_llm_client", return_value=mock_client), patch(
+        "app.api.chat.get_admission", return_value=mock_admission
+    ):
+        response = TestClient(app).post(
+            "/chat", json={"messages": [{"role": "user", "content": "Hello"}]}
+        )
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "3"
+    mock_client.chat.assert_not_called()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "path, module", [("/chat", "app.api.chat"), ("/chat/openai", "app.api.chat_openai")]
+)
+async def test_unread_stream_releases_slot(post_and_disconnect, path, module):
+    """测试客户端在流式响应开始前断开时，准入名额仍被归还"""
+    mock_client = MagicMock()
+    mock_client.model_name = "test-model"
+    admission = Admission(1, 1, max_queue=0, queue_timeout=1)
+
+    getter = "get_llm_client" if module == "app.api.chat" else "get_openai_client"
+    with patch(f"{module}.{getter}", return_value=mock_client), patch(
+        f"{module}.get_admission", return_value=admission
+    ):
+        await post_and_disconnect(
+            app,
+            path,
+            {"messages": [{"role": "user", "content": "Hello"}], "stream": True},
+        )
+
+    assert admission.global_controller.in_flight == 0
+    assert admission.provider("doubao").in_flight == 0
+    assert admission.provider("openai").in_flight == 0
+    mock_client.chat_stream.assert_not_called()
@@ -0,0 +1,95 @@
+"""批量对话接口测试"""
+
+import asyncio
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import MagicMock, patch
+
+from app.api.batch import run_bounded
+from app.api.chat_history import generate_session_id, get_history
+from app.main import app
+
+
+@pytest.mark.asyncio
+async def test_run_bounded_yields_in_completion_order():
+    """测试结果按完成顺序产出，并发数不超过上限"""
+    running = 0
+    peak = 0
+
+    async def worker(index, delay):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(delay)
+        running -= 1
+        return {"index": index}
+
+    results = [r async for r in run_bounded([0.05, 0.01, 0.02], worker, 2)]
+    assert [r["index"] for r in results] == [1, 2, 0]
+    assert peak == 2
+
+
+@pytest.mark.asyncio
+async def test_run_bounded_reports_errors_per_item():
+    """测试单个任务失败不影响其他任务"""
+
+    async def worker(index, item):
+        if item == "bad":
+            raise ValueError("boom")
+        return {"index": index, "ok": True}
+
+    results = [r async for r in run_bounded(["good", "bad"], worker, 4)]
+    assert sorted(results, key=lambda r: r["index"]) == [
+        {"index": 0, "ok": True},
+        {"index": 1, "error": "boom"},
+    ]
+
+
+def test_chat_batch_endpoint_streams_ndjson():
+    """测试批量接口逐行返回 NDJSON 结果并保存各会话历史"""
+
+    async def fake_chat(messages, **kwargs):
+        if messages[-1]["content"] == "fail":
+            raise Exception("API Error")
+        return f"reply to {messages[-1]['content']}"
+
+    mock_client = MagicMock()
+    mock_client.model_name = "test-model"
+    mock_client.chat = fake_chat
+    session_id = generate_session_id()
+
+    with patch("app.api.chat.get_llm_client", return_value=mock_client):
+        response = TestClient(app).post(
+            "/chat/batch",
+            json={
+                "conversations": [
+                    {
+                        "messages": [{"role": "user", "content": "a"}],
+                        "session_id": session_id,
+                    },
+                    {"messages": [{"role": "user", "content": "fail"}]},
+                    {"messages": [{"role": "user", "content": "b"}]},
+                ],
+                "max_concurrency": 2,
+            },
+        )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    by_index = {line["index"]: line for line in lines}
+    assert len(lines) == 3
+    assert by_index[0]["content"] == "reply to a"
+    assert by_index[0]["session_id"] == session_id
+    assert "API Error" in by_index[1]["error"]
+    assert by_index[2]["content"] == "reply to b"
+    history = asyncio.run(get_history(session_id))
+    assert [m["content"] for m in history] == ["a", "reply to a"]
+
+
+def test_chat_batch_requires_conversations():
+    """测试空批量请求被拒绝"""
+    response = TestClient(app).post("/chat/batch", json={"conversations": []})
+    assert response.status_code == 422
@@ -1,5 +1,7 @@
 """Chat API 路由测试"""
 
+import asyncio
+
 import pytest
 from fastapi.testclient import TestClient
 from unittest.mock import patch, AsyncMock, MagicMock
@@ -19,7 +21,7 @@ def mock_doubao_client():
     mock_client = MagicMock()
     mock_client.model_name = "test-model"
     mock_client.chat = AsyncMock(return_value="AI response")
-    mock_client.chat_stream = AsyncMock()
+    mock_client.chat_stream = MagicMock()
 
     async def stream_gen():
         yield "AI "
@@ -52,6 +54,8 @@ def test_chat_endpoint_success(client, mock_doubao_client):
             assert "session_id" in data
             assert "model" in data
             assert data["content"] == "AI response"
+            assert data["chunk_count"] == 1
+            assert 0 <= data["ttft_ms"] <= data["duration_ms"]
     finally:
         chat_module.llm_client = original_client
 
@@ -65,7 +69,7 @@ def test_chat_endpoint_with_session_id(client, mock_doubao_client):
 
     try:
         session_id = generate_session_id()
-        clear_history(session_id)
+        asyncio.run(clear_history(session_id))
 
         with patch("app.api.chat.get_llm_client", return_value=mock_doubao_client):
             # 第一条消息
@@ -136,3 +140,63 @@ def test_chat_endpoint_error(client):
             assert "Error generating response" in response.json()["detail"]
     finally:
         chat_module.llm_client = original_client
+
+
+def test_chat_endpoint_stream(client, mock_doubao_client):
+    """测试流式响应逐个返回 SSE 增量并在结束后保存历史"""
+    import json
+
+    from app.api.chat_history import get_history
+
+    session_id = generate_session_id()
+
+    with patch("app.api.chat.get_llm_client", return_value=mock_doubao_client):
+        response = client.post(
+            "/chat",
+            json={
+                "messages": [{"role": "user", "content": "Hello"}],
+                "session_id": session_id,
+                "stream": True,
+            },
+        )
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        assert response.headers["x-session-id"] == session_id
+
+        events = [e for e in response.text.split("\n\n") if e]
+        deltas = [json.loads(e[len("data: ") :]) for e in events[:-1]]
+        assert [d["content"] for d in deltas] == ["AI ", "response"]
+        assert events[-1].startswith("event: done\n")
+
+    history = asyncio.run(get_history(session_id))
+    assert [m["role"] for m in history] == ["user", "assistant"]
+    assert history[1]["content"] == "AI response"
+
+
+def test_chat_endpoint_stream_error(client):
+    """测试流式响应出错时发送 error 事件且不保存历史"""
+    from app.api.chat_history import get_history
+
+    async def failing_stream(*args, **kwargs):
+        yield "partial"
+        raise Exception("API Error")
+
+    mock_client = MagicMock()
+    mock_client.model_name = "test-model"
+    mock_client.chat_stream = failing_stream
+    session_id = generate_session_id()
+
+    with patch("app.api.chat.get_llm_client", return_value=mock_client):
+        response = client.post(
+            "/chat",
+            json={
+                "messages": [{"role": "user", "content": "Hello"}],
+                "session_id": session_id,
+                "stream": True,
+            },
+        )
+        assert response.status_code == 200
+        assert "event: error" in response.text
+        assert "API Error" in response.text
+
+    assert asyncio.run(get_history(session_id)) == []
@@ -1,5 +1,7 @@
 """对话历史管理模块测试"""
 
+import pytest
+
 from app.api.chat_history import (
     generate_session_id,
     get_history,
@@ -19,20 +21,22 @@ def test_generate_session_id():
     assert session_id.count("-") == 4
 
 
-def test_get_history_empty():
+@pytest.mark.asyncio
+async def test_get_history_empty():
     """测试获取空历史"""
     session_id = generate_session_id()
-    history = get_history(session_id)
+    history = await get_history(session_id)
     assert history == []
 
 
-def test_add_message():
+@pytest.mark.asyncio
+async def test_add_message():
     """测试添加消息"""
     session_id = generate_session_id()
-    add_message(session_id, "user", "Hello")
-    add_message(session_id, "assistant", "Hi there")
+    await add_message(session_id, "user", "Hello")
+    await add_message(session_id, "assistant", "Hi there")
 
-    history = get_history(session_id)
+    history = await get_history(session_id)
     assert len(history) == 2
     assert history[0]["role"] == "user"
     assert history[0]["content"] == "Hello"
@@ -40,45 +44,132 @@ def test_add_message():
     assert history[1]["content"] == "Hi there"
 
 
-def test_history_limit():
+@pytest.mark.asyncio
+async def test_history_limit():
     """测试历史消息数量限制"""
     session_id = generate_session_id()
     # 添加超过限制的消息
     for i in range(MAX_HISTORY_MESSAGES + 5):
-        add_message(session_id, "user", f"Message {i}")
+        await add_message(session_id, "user", f"Message {i}")
 
-    history = get_history(session_id)
+    history = await get_history(session_id)
     assert len(history) == MAX_HISTORY_MESSAGES
     # 应该保留最新的消息
     assert history[-1]["content"] == f"Message {MAX_HISTORY_MESSAGES + 4}"
 
 
-def test_clear_history():
+@pytest.mark.asyncio
+async def test_clear_history():
     """测试清除历史"""
     session_id = generate_session_id()
-    add_message(session_id, "user", "Hello")
-    assert len(get_history(session_id)) == 1
+    await add_message(session_id, "user", "Hello")
+    assert len(await get_history(session_id)) == 1
 
-    clear_history(session_id)
-    assert len(get_history(session_id)) == 0
+    await clear_history(session_id)
+    assert len(await get_history(session_id)) == 0
 
 
-def test_merge_history_and_messages():
+@pytest.mark.asyncio
+async def test_merge_history_and_messages():
     """测试合并历史和当前消息"""
     session_id = generate_session_id()
-    add_message(session_id, "user", "First")
-    add_message(session_id, "assistant", "Response")
+    await add_message(session_id, "user", "First")
+    await add_message(session_id, "assistant", "Response")
 
     current_messages = [{"role": "user", "content": "Second"}]
-    merged = merge_history_and_messages(session_id, current_messages)
+    merged = await merge_history_and_messages(session_id, current_messages)
 
     assert len(merged) == 3
     assert merged[0]["content"] == "First"
     assert merged[2]["content"] == "Second"
 
 
-def test_merge_without_session_id():
+@pytest.mark.asyncio
+async def test_merge_without_session_id():
     """测试无 session_id 时只返回当前消息"""
     current_messages = [{"role": "user", "content": "Hello"}]
-    merged = merge_history_and_messages(None, current_messages)
+    merged = await merge_history_and_messages(None, current_messages)
     assert merged == current_messages
+
+
+@pytest.mark.asyncio
+async def test_history_token_counts_cached():
+    """测试写入消息时缓存估算的 token 数"""
+    from app.api.chat_history import get_history_token_counts
+    from app.models.tokens import estimate_message_tokens
+
+    session_id = generate_session_id()
+    await add_message(session_id, "user", "Hello")
+    await add_message(session_id, "assistant", "你好" * 10)
+
+    assert await get_history_token_counts(session_id) == [
+        estimate_message_tokens(m) for m in await get_history(session_id)
+    ]
+
+
+def test_select_history_window():
+    """测试选出不超过预算的最长后缀"""
+    from app.api.chat_history import select_history_window
+
+    assert select_history_window([5, 5, 5], 100) == 0
+    assert select_history_window([5, 5, 5], 10) == 1
+    assert select_history_window([50, 5, 5], 20) == 1
+    assert select_history_window([5, 50, 5], 20) == 2
+    assert select_history_window([5, 5], 0) == 2
+    assert select_history_window([], 10) == 0
+
+
+@pytest.mark.asyncio
+async def test_merge_respects_token_budget(monkeypatch):
+    """测试合并历史时只保留能放进 token 预算的最近消息"""
+    from app.api import chat_history
+
+    monkeypatch.setattr(chat_history.settings, "history_token_budget", 100)
+    session_id = generate_session_id()
+    await add_message(session_id, "user", "x" * 1000)  # 一条超长消息
+    await add_message(session_id, "assistant", "short reply")
+    await add_message(session_id, "user", "short question")
+
+    merged = await merge_history_and_messages(
+        session_id, [{"role": "user", "content": "Next"}]
+    )
+    assert [m["content"] for m in merged] == ["short reply", "short question", "Next"]
+
+
+@pytest.mark.asyncio
+async def test_merge_uses_per_model_budget(monkeypatch):
+    """测试按模型配置的 token 预算"""
+    from app.api import chat_history
+
+    monkeypatch.setattr(chat_history.settings, "history_token_budget", 10)
+    monkeypatch.setattr(
+        chat_history.settings, "history_token_budgets", {"big-model": 10000}
+    )
+    session_id = generate_session_id()
+    await add_message(session_id, "user", "x" * 400)
+    current = [{"role": "user", "content": "Next"}]
+
+    assert len(await merge_history_and_messages(session_id, current)) == 1
+    assert len(await merge_history_and_messages(session_id, current, "big-model")) == 2
+
+
+@pytest.mark.asyncio
+async def test_save_turn():
+    """测试保存一轮对话只保存用户消息和 AI 回复"""
+    from app.api.chat_history import get_history_token_counts, save_turn
+
+    session_id = generate_session_id()
+    await save_turn(
+        session_id,
+        [
+            {"role": "system", "content": "You are helpful"},
+            {"role": "user", "content": "Hello"},
+        ],
+        "Hi there",
+    )
+
+    assert await get_history(session_id) == [
+        {"role": "user", "content": "Hello"},
+        {"role": "assistant", "content": "Hi there"},
+    ]
+    assert len(await get_history_token_counts(session_id)) == 2
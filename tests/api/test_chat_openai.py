@@ -18,7 +18,7 @@ def mock_openai_client():
     mock_client = MagicMock()
     mock_client.model_name = "test-model"
     mock_client.chat = AsyncMock(return_value="AI response")
-    mock_client.chat_stream = AsyncMock()
+    mock_client.chat_stream = MagicMock()
 
     async def stream_gen():
         yield "AI "
@@ -72,3 +72,18 @@ def test_chat_openai_simple_endpoint(client, mock_openai_client):
             assert "message" in data
     finally:
         chat_openai_module.openai_client = original_client
+
+
+def test_chat_openai_endpoint_stream(client, mock_openai_client):
+    """测试 chat_openai 流式响应返回 SSE 事件"""
+    with patch(
+        "app.api.chat_openai.get_openai_client", return_value=mock_openai_client
+    ):
+        response = client.post(
+            "/chat/openai",
+            json={"messages": [{"role": "user", "content": "Hello"}], "stream": True},
+        )
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        assert 'data: {"content":"AI "}' in response.text
+        assert "event: done" in response.text
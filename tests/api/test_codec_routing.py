@@ -0,0 +1,46 @@
+"""快速 JSON 请求解析和响应编码测试"""
+
+from fastapi import APIRouter, FastAPI
+from fastapi.testclient import TestClient
+from pydantic import BaseModel
+
+from app.api.codec_routing import CodecJSONResponse, CodecRequest, CodecRoute
+
+
+class Item(BaseModel):
+    name: str
+    tags: list[str] = []
+
+
+def _client() -> TestClient:
+    router = APIRouter(route_class=CodecRoute)
+
+    @router.post("/items", response_class=CodecJSONResponse)
+    async def create(item: Item, request: CodecRequest):
+        return {"name": item.name, "tags": item.tags, "codec": type(request).__name__}
+
+    app = FastAPI()
+    app.include_router(router)
+    return TestClient(app)
+
+
+def test_request_body_decoded_and_validated():
+    """测试请求体经编解码器解析后由 Pydantic 校验"""
+    response = _client().post("/items", json={"name": "你好", "tags": ["a"]})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/json"
+    assert response.content == (
+        '{"name":"你好","tags":["a"],"codec":"CodecRequest"}'.encode("utf-8")
+    )
+
+
+def test_invalid_json_returns_422():
+    """测试无法解析的请求体仍然返回 422"""
+    response = _client().post(
+        "/items", content=b'{"name": ', headers={"content-type": "application/json"}
+    )
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["type"] == "json_invalid"
+
+    response = _client().post("/items", json={"tags": "x"})
+    assert response.status_code == 422
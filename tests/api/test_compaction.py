@@ -0,0 +1,178 @@
+"""对话历史后台压缩测试"""
+
+import asyncio
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from app.api import compaction
+from app.api.chat_history import (
+    add_message,
+    clear_history,
+    generate_session_id,
+    get_history,
+    get_history_token_counts,
+    merge_history_and_messages,
+)
+from app.api.compaction import SUMMARY_PREFIX, HistoryCompactor, format_transcript
+from app.models.tokens import estimate_message_tokens
+
+
+def _summary_client(summary="摘要"):
+    client = MagicMock()
+    client.chat = AsyncMock(return_value=summary)
+    return client
+
+
+async def _long_session(turns=5):
+    session_id = generate_session_id()
+    for i in range(turns):
+        await add_message(session_id, "user", f"question {i} " + "x" * 200)
+        await add_message(session_id, "assistant", f"answer {i} " + "y" * 200)
+    return session_id
+
+
+def test_format_transcript():
+    """测试对话记录格式化（多模态内容中的图片用占位符表示）"""
+    transcript = format_transcript(
+        [
+            {"role": "user", "content": "你好"},
+            {
+                "role": "user",
+                "content": [
+                    {"type": "image_url", "image_url": {"url": "https://a/b.jpg"}},
+                    {"type": "text", "text": "这是什么"},
+                ],
+            },
+        ]
+    )
+    assert transcript == "user: 你好\nuser: [图片] 这是什么"
+
+
+@pytest.mark.asyncio
+async def test_below_threshold_not_scheduled():
+    """测试历史未超过阈值时不压缩"""
+    client = _summary_client()
+    compactor = HistoryCompactor(lambda: client, threshold=100000, keep_recent=2)
+    session_id = await _long_session()
+
+    assert await compactor.maybe_schedule(session_id) is None
+    client.chat.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_compaction_replaces_oldest_messages():
+    """测试摘要替换最早的消息，最近的消息保留原文"""
+    client = _summary_client("用户问了 5 个问题")
+    compactor = HistoryCompactor(lambda: client, threshold=100, keep_recent=2)
+    session_id = await _long_session()
+    recent = (await get_history(session_id))[-2:]
+
+    await (await compactor.maybe_schedule(session_id))
+
+    history = await get_history(session_id)
+    assert history[0] == {
+        "role": "system",
+        "content": SUMMARY_PREFIX + "用户问了 5 个问题",
+    }
+    assert history[1:] == recent
+    assert await get_history_token_counts(session_id) == [
+        estimate_message_tokens(m) for m in history
+    ]
+    transcript = client.chat.call_args.kwargs["messages"][1]["content"]
+    assert "question 0" in transcript
+    assert "answer 4" not in transcript
+    assert compactor.pending(session_id) is None
+
+
+@pytest.mark.asyncio
+async def test_compaction_does_not_block_next_turn():
+    """测试摘要完成前照常使用原来的历史窗口"""
+    release = asyncio.Event()
+
+    async def slow_chat(**kwargs):
+        await release.wait()
+        return "摘要"
+
+    client = MagicMock()
+    client.chat = slow_chat
+    compactor = HistoryCompactor(lambda: client, threshold=100, keep_recent=2)
+    session_id = await _long_session()
+    before = list(await get_history(session_id))
+
+    task = await compactor.maybe_schedule(session_id)
+    await asyncio.sleep(0)
+    assert await compactor.maybe_schedule(session_id) is None  # 同一会话只有一个任务
+
+    # 摘要进行中，新的一轮照常读取并写入历史
+    merged = await merge_history_and_messages(
+        session_id, [{"role": "user", "content": "hi"}]
+    )
+    assert merged[:-1] == before
+    await add_message(session_id, "user", "hi")
+    await add_message(session_id, "assistant", "hello")
+
+    release.set()
+    await task
+    history = await get_history(session_id)
+    assert history[0]["role"] == "system"
+    assert [m["content"] for m in history[-4:]] == [
+        before[-2]["content"],
+        before[-1]["content"],
+        "hi",
+        "hello",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_stale_summary_is_discarded():
+    """测试摘要期间历史被清除时丢弃摘要"""
+    release = asyncio.Event()
+
+    async def slow_chat(**kwargs):
+        await release.wait()
+        return "摘要"
+
+    client = MagicMock()
+    client.chat = slow_chat
+    compactor = HistoryCompactor(lambda: client, threshold=100, keep_recent=2)
+    session_id = await _long_session()
+
+    task = await compactor.maybe_schedule(session_id)
+    await asyncio.sleep(0)
+    await clear_history(session_id)
+    await add_message(session_id, "user", "new start")
+
+    release.set()
+    await task
+    assert await get_history(session_id) == [{"role": "user", "content": "new start"}]
+
+
+@pytest.mark.asyncio
+async def test_summary_error_keeps_history():
+    """测试摘要失败时历史保持不变"""
+    client = MagicMock()
+    client.chat = AsyncMock(side_effect=Exception("boom"))
+    compactor = HistoryCompactor(lambda: client, threshold=100, keep_recent=2)
+    session_id = await _long_session()
+    before = list(await get_history(session_id))
+
+    await (await compactor.maybe_schedule(session_id))
+    assert await get_history(session_id) == before
+
+
+@pytest.mark.asyncio
+async def test_add_message_schedules_compaction(monkeypatch):
+    """测试开启压缩后写入消息会触发后台压缩"""
+    client = _summary_client()
+    compactor = HistoryCompactor(lambda: client, threshold=100, keep_recent=1)
+    monkeypatch.setattr(compaction, "compactor", compactor)
+    monkeypatch.setattr(compaction.settings, "history_compaction_enabled", True)
+
+    session_id = await _long_session(turns=1)
+    await add_message(session_id, "user", "z" * 400)
+    await compactor.drain()
+
+    history = await get_history(session_id)
+    assert history[0]["content"] == SUMMARY_PREFIX + "摘要"
+    assert len(history) == 2
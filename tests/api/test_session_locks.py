@@ -0,0 +1,123 @@
+"""会话锁表测试"""
+
+import asyncio
+
+import httpx
+import pytest
+from unittest.mock import MagicMock, patch
+
+from app.api.chat_history import generate_session_id, get_history
+from app.api.session_locks import SessionLockTable
+from app.main import app
+
+
+@pytest.mark.asyncio
+async def test_same_session_is_serialized():
+    """测试同一会话的请求按顺序串行执行"""
+    table = SessionLockTable(shards=4)
+    order = []
+
+    async def worker(name):
+        async with await table.acquire("session"):
+            order.append(f"{name}-start")
+            await asyncio.sleep(0.01)
+            order.append(f"{name}-end")
+
+    await asyncio.gather(worker("a"), worker("b"))
+    assert order == ["a-start", "a-end", "b-start", "b-end"]
+    assert len(table) == 0
+
+
+@pytest.mark.asyncio
+async def test_different_sessions_run_in_parallel():
+    """测试不同会话互不阻塞"""
+    table = SessionLockTable(shards=1)
+    first = await table.acquire("session-a")
+
+    second = await asyncio.wait_for(table.acquire("session-b"), timeout=0.1)
+    assert len(table) == 2
+
+    first.release()
+    second.release()
+    assert len(table) == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_is_removed():
+    """测试取消排队中的请求后锁表能正确清理"""
+    table = SessionLockTable()
+    held = await table.acquire("session")
+    waiter = asyncio.create_task(table.acquire("session"))
+    await asyncio.sleep(0.01)
+
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    held.release()
+    assert len(table) == 0
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_keep_turn_order():
+    """测试同一会话的并发请求不会交错写入历史"""
+    session_id = generate_session_id()
+
+    async def slow_chat(messages, **kwargs):
+        await asyncio.sleep(0.01)
+        return f"reply to {messages[-1]['content']} after {len(messages) - 1}"
+
+    mock_client = MagicMock()
+    mock_client.model_name = "test-model"
+    mock_client.chat = slow_chat
+
+    transport = httpx.ASGITransport(app=app)
+    with patch("app.api.chat.get_llm_client", return_value=mock_client):
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test"
+        ) as client:
+            responses = await asyncio.gather(
+                *[
+                    client.post(
+                        "/chat",
+                        json={
+                            "messages": [{"role": "user", "content": f"m{i}"}],
+                            "session_id": session_id,
+                        },
+                    )
+                    for i in range(3)
+                ]
+            )
+
+    assert all(r.status_code == 200 for r in responses)
+    history = await get_history(session_id)
+    assert [m["role"] for m in history] == ["user", "assistant"] * 3
+    # 每个请求都看到了前面所有轮次的完整历史
+    for turn in range(3):
+        user, assistant = history[2 * turn], history[2 * turn + 1]
+        assert assistant["content"] == f"reply to {user['content']} after {2 * turn}"
+
+
+@pytest.mark.asyncio
+async def test_unread_stream_releases_session_lock(post_and_disconnect):
+    """测试客户端在流式响应开始前断开时，会话锁仍被释放，下一轮不会死锁"""
+    session_id = generate_session_id()
+    mock_client = MagicMock()
+    mock_client.model_name = "test-model"
+    table = SessionLockTable()
+
+    with patch("app.api.chat.get_llm_client", return_value=mock_client), patch(
+        "app.api.chat.get_session_locks", return_value=table
+    ):
+        await post_and_disconnect(
+            app,
+            "/chat",
+            {
+                "messages": [{"role": "user", "content": "Hello"}],
+                "session_id": session_id,
+                "stream": True,
+            },
+        )
+
+    assert len(table) == 0
+    handle = await asyncio.wait_for(table.acquire(session_id), timeout=0.1)
+    handle.release()
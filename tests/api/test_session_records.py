@@ -0,0 +1,79 @@
+"""紧凑会话表示测试"""
+
+from app.api.session_records import (
+    CompactSession,
+    ContentPool,
+    MessageRecord,
+    MessagesView,
+)
+
+
+def _session(count, capacity):
+    session = CompactSession(0.0)
+    for i in range(count):
+        session.push(MessageRecord("user", str(i), i), capacity)
+    return session
+
+
+def test_ring_buffer_keeps_most_recent():
+    """测试环形缓冲区按时间顺序保留最近的记录"""
+    session = _session(7, capacity=3)
+    assert [record.content for record in session.records()] == ["4", "5", "6"]
+    assert [m["content"] for m in session.messages] == ["4", "5", "6"]
+    assert list(session.token_counts) == [4, 5, 6]
+
+
+def test_view_slicing_is_zero_copy():
+    """测试视图切片不复制记录，并支持负下标"""
+    session = _session(5, capacity=4)
+    view = session.messages
+    window = view[1:]
+    assert isinstance(window, MessagesView)
+    assert window._records is view._records
+    assert list(window) == [{"role": "user", "content": str(i)} for i in (2, 3, 4)]
+    assert window[-1] == {"role": "user", "content": "4"}
+    assert len(view[10:]) == 0
+    assert view[::2] == [view[0], view[2]]
+
+
+def test_view_equality_with_lists():
+    """测试视图可与列表比较"""
+    session = _session(2, capacity=5)
+    assert session.messages == [
+        {"role": "user", "content": "0"},
+        {"role": "user", "content": "1"},
+    ]
+    assert session.token_counts == [0, 1]
+    assert session.messages != []
+
+
+def test_view_survives_reset():
+    """测试整体替换后已有视图仍读取原来的记录"""
+    session = _session(3, capacity=5)
+    view = session.messages
+    session.reset([MessageRecord("system", "summary", 1)])
+    assert [m["content"] for m in view] == ["0", "1", "2"]
+
+
+def test_content_pool_multimodal():
+    """测试多模态内容按规范化 JSON 去重"""
+    pool = ContentPool()
+    a = [
+        {"type": "text", "text": "hi"},
+        {"type": "image_url", "image_url": {"url": "u"}},
+    ]
+    b = [
+        {"text": "hi", "type": "text"},
+        {"image_url": {"url": "u"}, "type": "image_url"},
+    ]
+
+    assert pool.acquire(a) is a
+    assert pool.acquire(b) is a
+    assert pool.acquire("hi") == "hi"
+    assert len(pool) == 2
+
+    pool.release(b)
+    pool.release(a)
+    pool.release("hi")
+    assert len(pool) == 0
+    assert pool.nbytes == 0
@@ -0,0 +1,148 @@
+"""Redis 会话存储后端测试（使用 fakeredis）"""
+
+import fakeredis
+import pytest
+
+from app.api.session_redis import RedisSessionBackend
+
+
+def _message(content):
+    return {"role": "user", "content": content}
+
+
+@pytest.fixture
+def server():
+    return fakeredis.FakeServer()
+
+
+@pytest.fixture
+def backend(server):
+    return RedisSessionBackend(
+        fakeredis.FakeAsyncRedis(server=server), max_messages=3, ttl=60
+    )
+
+
+@pytest.mark.asyncio
+async def test_append_and_get(backend):
+    """测试追加和读取消息"""
+    assert await backend.get("s") is None
+    await backend.append_many("s", [(_message("你好"), 3), (_message("hi"), 1)])
+
+    session = await backend.get("s")
+    assert session.messages == [_message("你好"), _message("hi")]
+    assert session.token_counts == [3, 1]
+
+
+@pytest.mark.asyncio
+async def test_capped_lists_with_ttl(backend):
+    """测试列表按消息数上限裁剪，并设置过期时间"""
+    for i in range(5):
+        await backend.append("s", _message(str(i)), i)
+
+    session = await backend.get("s")
+    assert [m["content"] for m in session.messages] == ["2", "3", "4"]
+    assert session.token_counts == [2, 3, 4]
+    messages_key, tokens_key = backend._keys("s")
+    assert 0 < await backend.client.ttl(messages_key) <= 60
+    assert 0 < await backend.client.ttl(tokens_key) <= 60
+
+
+@pytest.mark.asyncio
+async def test_each_call_is_one_round_trip(backend, monkeypatch):
+    """测试读取和追加一轮对话各只需一次往返"""
+    calls = []
+    original = backend.client.pipeline
+
+    def pipeline(*args, **kwargs):
+        pipe = original(*args, **kwargs)
+        execute = pipe.execute
+
+        async def counted_execute(*a, **kw):
+            calls.append(len(pipe.command_stack))
+            return await execute(*a, **kw)
+
+        pipe.execute = counted_execute
+        return pipe
+
+    monkeypatch.setattr(backend.client, "pipeline", pipeline)
+    await backend.append_many("s", [(_message("q"), 1), (_message("a"), 1)])
+    await backend.get("s")
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_replace_and_delete(backend):
+    """测试替换和删除会话"""
+    await backend.append("s", _message("a"), 1)
+    await backend.replace("s", [_message("summary"), _message("b")], [5, 1])
+    assert (await backend.get("s")).token_counts == [5, 1]
+
+    assert await backend.delete("s") is True
+    assert await backend.get("s") is None
+    assert await backend.delete("s") is False
+
+
+@pytest.mark.asyncio
+async def test_shared_between_workers(server):
+    """测试多个 worker（客户端）共享同一会话"""
+    worker_a = RedisSessionBackend(fakeredis.FakeAsyncRedis(server=server))
+    worker_b = RedisSessionBackend(fakeredis.FakeAsyncRedis(server=server))
+    await worker_a.append("s", _message("from a"), 1)
+    await worker_b.append("s", _message("from b"), 1)
+
+    assert [m["content"] for m in (await worker_a.get("s")).messages] == [
+        "from a",
+        "from b",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_replace_prefix(backend):
+    """测试把历史开头的消息替换为一条摘要，prefix 不是历史开头时不替换"""
+    for i in range(3):
+        await backend.append("s", _message(str(i)), 10)
+    prefix = list((await backend.get("s")).messages[:2])
+
+    summary = {"role": "system", "content": "summary"}
+    assert await backend.replace_prefix("s", prefix, summary, 5) == 15
+    session = await backend.get("s")
+    assert session.messages == [summary, _message("2")]
+    assert session.token_counts == [5, 10]
+
+    assert await backend.replace_prefix("s", prefix, summary, 5) is None
+    assert await backend.replace_prefix("missing", prefix, summary, 5) is None
+
+
+@pytest.mark.asyncio
+async def test_replace_prefix_detects_concurrent_writes(server):
+    """测试比较之后其他 worker 清除并重写了会话时，重新比较后放弃替换"""
+    compactor = RedisSessionBackend(fakeredis.FakeAsyncRedis(server=server))
+    other = RedisSessionBackend(fakeredis.FakeAsyncRedis(server=server))
+    for i in range(3):
+        await compactor.append("s", _message(str(i)), 10)
+    prefix = list((await compactor.get("s")).messages[:2])
+
+    reads = []
+    original = compactor.client.pipeline
+
+    def pipeline(*args, **kwargs):
+        pipe = original(*args, **kwargs)
+        lrange = pipe.lrange
+
+        async def interleaved_lrange(*a, **kw):
+            reads.append(a)
+            result = await lrange(*a, **kw)
+            if len(reads) == 2:
+                # 比较之后、事务执行之前另一个 worker 清除历史并开始新的对话
+                await other.delete("s")
+                await other.append("s", _message("new start"), 1)
+            return result
+
+        pipe.lrange = interleaved_lrange
+        return pipe
+
+    compactor.client.pipeline = pipeline
+    summary = {"role": "system", "content": "summary"}
+    assert await compactor.replace_prefix("s", prefix, summary, 5) is None
+    assert len(reads) == 4
+    assert (await other.get("s")).messages == [_message("new start")]
@@ -0,0 +1,257 @@
+"""SQLite 会话存储后端测试"""
+
+import asyncio
+import sqlite3
+import time
+
+import pytest
+
+from app.api.session_sqlite import SQLiteSessionBackend
+
+
+def _message(content):
+    return {"role": "user", "content": content}
+
+
+def _rows(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(
+            "SELECT DISTINCT session_id FROM session_messages"
+        ).fetchall()
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "sessions.db")
+
+
+@pytest.mark.asyncio
+async def test_uses_wal_mode(db_path):
+    """测试数据库使用 WAL 模式"""
+    backend = SQLiteSessionBackend(db_path, start_flusher=False)
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    conn.close()
+    await backend.close()
+
+
+@pytest.mark.asyncio
+async def test_writes_are_buffered_until_flush(db_path):
+    """测试写入先缓冲在内存中，flush 时批量落盘"""
+    backend = SQLiteSessionBackend(db_path, start_flusher=False)
+    await backend.append("s1", _message("你好"), 3)
+    await backend.append("s1", _message("again"), 2)
+    await backend.append("s2", _message("hi"), 1)
+
+    assert (await backend.get("s1")).messages == [_message("你好"), _message("again")]
+    assert _rows(db_path) == []
+
+    backend.flush()
+    assert sorted(_rows(db_path)) == [("s1",), ("s2",)]
+    await backend.close()
+
+
+@pytest.mark.asyncio
+async def test_history_survives_restart(db_path):
+    """测试重启后历史仍然存在"""
+    backend = SQLiteSessionBackend(db_path, max_messages=2, start_flusher=False)
+    for i in range(3):
+        await backend.append("s", _message(str(i)), i)
+    await backend.close()
+
+    reopened = SQLiteSessionBackend(db_path, start_flusher=False)
+    session = await reopened.get("s")
+    assert [m["content"] for m in session.messages] == ["1", "2"]
+    assert session.token_counts == [1, 2]
+    await reopened.close()
+
+
+@pytest.mark.asyncio
+async def test_delete_and_replace(db_path):
+    """测试删除和替换会话"""
+    backend = SQLiteSessionBackend(db_path, start_flusher=False)
+    await backend.append("s", _message("a"), 1)
+    backend.flush()
+
+    assert await backend.delete("s") is True
+    assert await backend.get("s") is None
+    backend.flush()
+    assert _rows(db_path) == []
+    assert await backend.delete("s") is False
+
+    await backend.replace("s", [_message("summary")], [5])
+    await backend.close()
+    reopened = SQLiteSessionBackend(db_path, start_flusher=False)
+    assert (await reopened.get("s")).messages == [_message("summary")]
+    await reopened.close()
+
+
+@pytest.mark.asyncio
+async def test_read_cache_keeps_dirty_sessions(db_path):
+    """测试读缓存只淘汰已落盘的会话"""
+    backend = SQLiteSessionBackend(db_path, cache_size=1, start_flusher=False)
+    await backend.append("a", _message("a"), 1)
+    await backend.append("b", _message("b"), 1)
+    # 两个会话都未落盘，缓存暂时超过上限
+    assert (await backend.get("a")).messages == [_message("a")]
+
+    backend.flush()
+    await backend.get("b")
+    await backend.append("c", _message("c"), 1)
+    assert len(backend._cache) == 1
+    assert (await backend.get("a")).messages == [_message("a")]  # 从数据库读回
+    await backend.close()
+
+
+@pytest.mark.asyncio
+async def test_shared_between_processes(db_path):
+    """测试多个实例（进程）共享同一个数据库"""
+    writer = SQLiteSessionBackend(db_path, start_flusher=False)
+    reader = SQLiteSessionBackend(db_path, cache_ttl=0, start_flusher=False)
+    await writer.append("s", _message("from writer"), 1)
+    writer.flush()
+
+    assert (await reader.get("s")).messages == [_message("from writer")]
+    await writer.close()
+    await reader.close()
+
+
+@pytest.mark.asyncio
+async def test_appends_from_two_processes_are_kept(db_path):
+    """测试两个实例（进程）交替追加同一会话时不会互相覆盖"""
+    a = SQLiteSessionBackend(db_path, start_flusher=False)
+    b = SQLiteSessionBackend(db_path, start_flusher=False)
+    await a.append("s", _message("A1"), 1)
+    a.flush()
+    await b.append("s", _message("B1"), 1)
+    b.flush()
+    await a.append("s", _message("A2"), 1)
+    a.flush()
+
+    reader = SQLiteSessionBackend(db_path, start_flusher=False)
+    session = await reader.get("s")
+    assert [m["content"] for m in session.messages] == ["A1", "B1", "A2"]
+    for backend in (a, b, reader):
+        await backend.close()
+
+
+@pytest.mark.asyncio
+async def test_trim_applies_across_processes(db_path):
+    """测试多个实例追加后数据库中只保留最近的 N 条消息"""
+    a = SQLiteSessionBackend(db_path, max_messages=2, start_flusher=False)
+    b = SQLiteSessionBackend(db_path, max_messages=2, start_flusher=False)
+    await a.append("s", _message("A1"), 1)
+    a.flush()
+    await b.append("s", _message("B1"), 1)
+    await b.append("s", _message("B2"), 1)
+    b.flush()
+
+    reader = SQLiteSessionBackend(db_path, start_flusher=False)
+    session = await reader.get("s")
+    assert [m["content"] for m in session.messages] == ["B1", "B2"]
+    for backend in (a, b, reader):
+        await backend.close()
+
+
+@pytest.mark.asyncio
+async def test_replace_prefix(db_path):
+    """测试替换历史开头的消息：缓冲的写入先落盘，替换后的历史写入数据库"""
+    backend = SQLiteSessionBackend(db_path, start_flusher=False)
+    for content in ("a", "b", "c"):
+        await backend.append("s", _message(content), 5)
+    prefix = list((await backend.get("s")).messages[:2])
+
+    saved = await backend.replace_prefix("s", prefix, _message("summary"), 3)
+    assert saved == 7
+    assert (await backend.get("s")).messages == [_message("summary"), _message("c")]
+
+    reopened = SQLiteSessionBackend(db_path, start_flusher=False)
+    session = await reopened.get("s")
+    assert session.messages == [_message("summary"), _message("c")]
+    assert session.token_counts == [3, 5]
+
+    # 前缀已不是历史开头
+    assert await reopened.replace_prefix("s", prefix, _message("again"), 1) is None
+    await backend.close()
+    await reopened.close()
+
+
+@pytest.mark.asyncio
+async def test_replace_prefix_keeps_writes_from_other_processes(db_path):
+    """测试其他进程修改会话后，替换按数据库中的当前历史比较且不覆盖新消息"""
+    a = SQLiteSessionBackend(db_path, start_flusher=False)
+    b = SQLiteSessionBackend(db_path, cache_ttl=0, start_flusher=False)
+    for content in ("a", "b"):
+        await a.append("s", _message(content), 5)
+    a.flush()
+    prefix = list((await a.get("s")).messages)
+
+    # 另一个进程在总结期间追加了消息
+    await b.append("s", _message("c"), 5)
+    b.flush()
+    assert await a.replace_prefix("s", prefix, _message("summary"), 3) == 7
+    session = await b.get("s")
+    assert session.messages == [_message("summary"), _message("c")]
+
+    # 另一个进程清空了会话
+    await b.delete("s")
+    b.flush()
+    assert await a.replace_prefix("s", [_message("summary")], _message("x"), 1) is None
+    assert await b.get("s") is None
+    await a.close()
+    await b.close()
+
+
+@pytest.mark.asyncio
+async def test_background_flush_on_batch_size(db_path):
+    """测试脏会话数达到阈值时后台线程立即写入"""
+    backend = SQLiteSessionBackend(db_path, flush_interval=60, flush_batch_size=2)
+    await backend.append("a", _message("a"), 1)
+    await backend.append("b", _message("b"), 1)
+
+    deadline = time.monotonic() + 5
+    while len(_rows(db_path)) < 2 and time.monotonic() < deadline:
+        await asyncio.sleep(0.01)
+    assert len(_rows(db_path)) == 2
+    await backend.close()
+
+
+@pytest.mark.asyncio
+async def test_reads_do_not_block_event_loop(db_path):
+    """测试读取数据库在线程中进行，后台写入期间事件循环照常运行"""
+    backend = SQLiteSessionBackend(db_path, cache_ttl=0, start_flusher=False)
+    await backend.append("s", _message("a"), 1)
+    backend.flush()
+
+    # 模拟后台线程正在写入
+    backend._flush_lock.acquire()
+    read = asyncio.create_task(backend.get("s"))
+    await asyncio.sleep(0.05)
+    assert not read.done()
+    backend._flush_lock.release()
+
+    session = await asyncio.wait_for(read, timeout=5)
+    assert session.messages == [_message("a")]
+    await backend.close()
+
+
+@pytest.mark.asyncio
+async def test_delete_not_read_back_while_flushing(db_path):
+    """测试删除尚未提交时不会从数据库读回已删除的会话"""
+    backend = SQLiteSessionBackend(db_path, cache_ttl=0, start_flusher=False)
+    await backend.append("s", _message("a"), 1)
+    backend.flush()
+    await backend.delete("s")
+
+    # 后台线程已取出删除操作，尚未提交
+    backend._take_pending()
+    assert _rows(db_path) == [("s",)]
+    assert await backend.get("s") is None
+
+    # 删除后重新写入的会话可以读取
+    await backend.append("s", _message("b"), 1)
+    assert (await backend.get("s")).messages == [_message("b")]
+    await backend.close()
@@ -0,0 +1,193 @@
+"""会话存储测试"""
+
+import pytest
+
+from app.api.session_records import (
+    POOL_ENTRY_BYTES,
+    RECORD_BYTES,
+    SESSION_OVERHEAD_BYTES,
+    estimate_content_bytes,
+)
+from app.api.session_store import SessionStore
+
+
+def _message(content="hello", role="user"):
+    return {"role": role, "content": content}
+
+
+@pytest.mark.asyncio
+async def test_append_and_trim():
+    """测试追加消息并按每会话消息数上限丢弃最早的消息"""
+    store = SessionStore(max_messages=3, cache_json=False)
+    for i in range(5):
+        await store.append("s", _message(str(i)), i)
+
+    session = await store.get("s")
+    assert [m["content"] for m in session.messages] == ["2", "3", "4"]
+    assert list(session.token_counts) == [2, 3, 4]
+    assert store.nbytes == SESSION_OVERHEAD_BYTES + 3 * RECORD_BYTES + sum(
+        estimate_content_bytes(str(i)) + POOL_ENTRY_BYTES for i in range(2, 5)
+    )
+
+
+@pytest.mark.asyncio
+async def test_idle_ttl_expiry(monkeypatch):
+    """测试空闲超过 TTL 的会话过期删除"""
+    now = [1000.0]
+    monkeypatch.setattr("app.api.session_store.time.monotonic", lambda: now[0])
+    store = SessionStore(ttl=10)
+    await store.append("old", _message(), 1)
+    now[0] += 5
+    await store.append("active", _message(), 1)
+
+    now[0] += 6
+    assert await store.get("old") is None
+    assert await store.get("active") is not None
+    assert store.evictions["ttl"] == 1
+
+    # 访问会刷新空闲时间
+    now[0] += 9
+    assert await store.get("active") is not None
+
+
+@pytest.mark.asyncio
+async def test_max_sessions_evicts_least_recently_used():
+    """测试会话数超过上限时淘汰最久未访问的会话"""
+    store = SessionStore(max_sessions=2)
+    await store.append("a", _message(), 1)
+    await store.append("b", _message(), 1)
+    await store.get("a")
+    await store.append("c", _message(), 1)
+
+    assert "b" not in store
+    assert "a" in store and "c" in store
+    assert store.evictions["max_sessions"] == 1
+
+
+@pytest.mark.asyncio
+async def test_max_bytes_evicts_until_under_cap():
+    """测试估算内存超过上限时按 LRU 淘汰，当前会话不会被淘汰"""
+    per_session = (
+        SESSION_OVERHEAD_BYTES
+        + RECORD_BYTES
+        + estimate_content_bytes("x" * 10000)
+        + POOL_ENTRY_BYTES
+    )
+    store = SessionStore(max_bytes=2 * per_session + 100, cache_json=False)
+    for session_id in ("a", "b", "c"):
+        await store.append(session_id, _message(session_id * 10000), 1)
+
+    assert len(store) == 2
+    assert "a" not in store
+    assert store.nbytes <= store.max_bytes
+    assert store.evictions["max_bytes"] == 1
+
+    # 单个会话超过上限时保留该会话，淘汰其他所有会话
+    await store.append("c", _message("y" * 50000), 1)
+    assert len(store) == 1 and "c" in store
+
+
+@pytest.mark.asyncio
+async def test_identical_content_is_shared():
+    """测试相同内容在会话之间只保存一份，角色字符串驻留"""
+    store = SessionStore(cache_json=False)
+    prompt = "You are a helpful assistant. " * 50
+    for i in range(100):
+        await store.append(
+            f"s{i}", _message("".join(list(prompt)), role="".join("user")), 1
+        )
+
+    first = (await store.get("s0")).messages[0]
+    last = (await store.get("s99")).messages[0]
+    assert first["content"] is last["content"]
+    assert first["role"] is last["role"]
+    assert store.stats()["content_pool_entries"] == 1
+    assert store.stats()["content_pool_hits"] == 99
+
+    # 所有引用释放后内容从池中移除
+    for i in range(100):
+        await store.delete(f"s{i}")
+    assert store.stats()["content_pool_entries"] == 0
+    assert store.nbytes == 0
+
+
+@pytest.mark.asyncio
+async def test_ring_buffer_releases_overwritten_content():
+    """测试环形缓冲区覆盖最早的消息时释放其内容"""
+    store = SessionStore(max_messages=2, cache_json=False)
+    await store.append("s", _message("first"), 1)
+    await store.append("s", _message("second"), 1)
+    await store.append("s", _message("third"), 1)
+
+    assert list((await store.get("s")).messages) == [
+        _message("second"),
+        _message("third"),
+    ]
+    assert store.stats()["content_pool_entries"] == 2
+
+
+@pytest.mark.asyncio
+async def test_replace_over_limit_does_not_pin_dropped_content():
+    """测试替换的消息超过上限时，丢弃的消息不占用去重池"""
+    store = SessionStore(max_messages=2)
+    await store.replace("s", [_message(str(i)) for i in range(5)], [1] * 5)
+    assert list((await store.get("s")).messages) == [_message("3"), _message("4")]
+    assert store.stats()["content_pool_entries"] == 4  # 两条消息的内容和编码
+
+    await store.delete("s")
+    assert store.stats()["content_pool_entries"] == 0
+    assert store.nbytes == 0
+
+
+@pytest.mark.asyncio
+async def test_delete_and_replace_track_bytes():
+    """测试删除和替换时内存占用随之更新"""
+    store = SessionStore(cache_json=False)
+    await store.append("s", _message("x" * 1000), 1)
+    await store.replace("s", [_message("short")], [2])
+    assert store.nbytes == (
+        SESSION_OVERHEAD_BYTES
+        + RECORD_BYTES
+        + estimate_content_bytes("short")
+        + POOL_ENTRY_BYTES
+    )
+    assert list((await store.get("s")).token_counts) == [2]
+
+    assert await store.delete("s") is True
+    assert await store.delete("s") is False
+    assert store.nbytes == 0
+    assert store.stats()["sessions"] == 0
+
+
+@pytest.mark.asyncio
+async def test_assistant_replies_are_not_pooled():
+    """测试模型回复不进入去重池，但计入会话内存"""
+    store = SessionStore(cache_json=False)
+    await store.append("s", _message("回复内容", role="assistant"), 1)
+
+    assert store.stats()["content_pool_entries"] == 0
+    assert store.nbytes == (
+        SESSION_OVERHEAD_BYTES + RECORD_BYTES + estimate_content_bytes("回复内容")
+    )
+
+
+@pytest.mark.asyncio
+async def test_cached_json_encoding():
+    """测试每条消息写入时缓存 JSON 编码，读取时随消息返回"""
+    from app.models.encoding import EncodedMessage, encode_json
+
+    store = SessionStore()
+    for i in range(10):
+        await store.append(f"s{i}", _message("你好"), 1)
+    await store.append("s0", _message("回复", role="assistant"), 1)
+
+    messages = list((await store.get("s0")).messages)
+    assert all(isinstance(m, EncodedMessage) for m in messages)
+    assert [m.encoded for m in messages] == [encode_json(m) for m in messages]
+    # 相同的用户消息共享内容和编码
+    assert messages[0].encoded is (await store.get("s9")).messages[0].encoded
+    assert store.stats()["content_pool_entries"] == 2
+
+    for i in range(10):
+        await store.delete(f"s{i}")
+    assert store.nbytes == 0
@@ -0,0 +1,167 @@
+"""SSE 流式响应工具测试"""
+
+import asyncio
+import json
+
+import anyio
+import pytest
+from unittest.mock import MagicMock
+
+from app.api import chat_history
+from app.api.chat_history import TRUNCATED_MARKER, generate_session_id, get_history
+from app.api.session_store import SessionStore
+from app.api.streaming import sse_event, stream_chat_completion
+
+
+class FakeRequest:
+    """模拟 HTTP 请求：disconnect 事件被设置后 receive 返回 http.disconnect"""
+
+    def __init__(self):
+        self.disconnect = asyncio.Event()
+
+    async def receive(self):
+        await self.disconnect.wait()
+        return {"type": "http.disconnect"}
+
+
+def test_sse_event_format():
+    """测试 SSE 事件编码"""
+    assert sse_event({"content": "你好"}) == 'data: {"content":"你好"}\n\n'
+    assert sse_event({"a": 1}, event="done") == 'event: done\ndata: {"a":1}\n\n'
+
+
+@pytest.mark.asyncio
+async def test_stream_cancels_upstream_on_disconnect():
+    """测试客户端断开时关闭上游流并保存带截断标记的部分回复"""
+    upstream_closed = asyncio.Event()
+
+    async def endless_stream(*args, **kwargs):
+        try:
+            yield "partial"
+            await asyncio.Event().wait()  # 模拟上游长时间生成
+            yield "never"
+        finally:
+            upstream_closed.set()
+
+    client = MagicMock()
+    client.model_name = "test-model"
+    client.chat_stream = endless_stream
+    request = FakeRequest()
+    session_id = generate_session_id()
+    current_messages = [{"role": "user", "content": "Hello"}]
+
+    events = []
+    async for event in stream_chat_completion(
+        client, session_id, current_messages, current_messages, request=request
+    ):
+        events.append(event)
+        request.disconnect.set()
+
+    await asyncio.wait_for(upstream_closed.wait(), timeout=1)
+    assert [json.loads(e[len("data: ") :]) for e in events] == [{"content": "partial"}]
+    history = await get_history(session_id)
+    assert history[0] == {"role": "user", "content": "Hello"}
+    assert history[1]["content"] == "partial" + TRUNCATED_MARKER
+
+
+@pytest.mark.asyncio
+async def test_stream_aborted_response_saves_truncated():
+    """测试响应被中止（生成器被关闭）时同样取消上游并保存截断内容"""
+    upstream_closed = asyncio.Event()
+
+    async def endless_stream(*args, **kwargs):
+        try:
+            while True:
+                yield "x"
+                await asyncio.sleep(0)
+        finally:
+            upstream_closed.set()
+
+    client = MagicMock()
+    client.model_name = "test-model"
+    client.chat_stream = endless_stream
+    session_id = generate_session_id()
+    current_messages = [{"role": "user", "content": "Hello"}]
+
+    stream = stream_chat_completion(
+        client, session_id, current_messages, current_messages
+    )
+    await stream.__anext__()
+    await stream.aclose()
+
+    await asyncio.wait_for(upstream_closed.wait(), timeout=1)
+    assert (await get_history(session_id))[-1]["content"].endswith(TRUNCATED_MARKER)
+
+
+class SlowSessionStore(SessionStore):
+    """写入时挂起的会话存储（模拟需要 I/O 的 SQLite、Redis 后端）"""
+
+    async def append_many(self, session_id, entries):
+        await asyncio.sleep(0.01)
+        await super().append_many(session_id, entries)
+
+
+@pytest.mark.asyncio
+async def test_truncated_reply_saved_while_response_is_cancelled(monkeypatch):
+    """测试发送响应的任务被取消时，挂起的存储后端仍能写入截断的回复"""
+    monkeypatch.setattr(chat_history, "session_store", SlowSessionStore())
+
+    async def endless_stream(*args, **kwargs):
+        yield "partial"
+        await asyncio.Event().wait()
+
+    client = MagicMock()
+    client.model_name = "test-model"
+    client.chat_stream = endless_stream
+    session_id = generate_session_id()
+    current_messages = [{"role": "user", "content": "Hello"}]
+
+    stream = stream_chat_completion(
+        client, session_id, current_messages, current_messages
+    )
+    # 与 Starlette 一样：客户端断开时取消发送响应的任务组，再关闭响应体生成器
+    with anyio.CancelScope() as scope:
+        try:
+            await stream.__anext__()
+            scope.cancel()
+            await anyio.sleep(1)
+        finally:
+            await stream.aclose()
+
+    history = await get_history(session_id)
+    assert [m["content"] for m in history] == ["Hello", "partial" + TRUNCATED_MARKER]
+
+
+@pytest.mark.asyncio
+async def test_done_event_includes_stream_stats():
+    """测试 done 事件包含首 token 延迟、增量数、用量和结束原因"""
+    from app.models.stream_result import record_finish_reason, record_usage
+
+    async def stream(*args, **kwargs):
+        yield "a"
+        yield "b"
+        # 上游在最后一个增量之后返回结束原因和用量
+        record_finish_reason("stop")
+        record_usage({"total_tokens": 7})
+
+    client = MagicMock()
+    client.model_name = "test-model"
+    client.chat_stream = stream
+    session_id = generate_session_id()
+    current_messages = [{"role": "user", "content": "Hello"}]
+
+    events = [
+        e
+        async for e in stream_chat_completion(
+            client, session_id, current_messages, current_messages
+        )
+    ]
+
+    assert events[-1].startswith("event: done\n")
+    done = json.loads(events[-1].split("data: ", 1)[1])
+    assert done["finish_reason"] == "stop"
+    assert done["usage"] == {"total_tokens": 7}
+    assert done["chunk_count"] == 2
+    assert done["ttft_ms"] <= done["duration_ms"]
+    assert done["inter_chunk_max_ms"] >= 0
+    assert (await get_history(session_id))[-1]["content"] == "ab"
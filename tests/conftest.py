@@ -1,5 +1,7 @@
 """pytest 配置和共享 fixtures"""
 
+import json
+
 import pytest
 from unittest.mock import AsyncMock
 from app.config import Settings
@@ -29,3 +31,43 @@ def mock_httpx_client():
 def mock_openai_client():
     """Mock OpenAI AsyncOpenAI client"""
     return AsyncMock()
+
+
+@pytest.fixture
+def post_and_disconnect():
+    """
+    直接调用 ASGI 应用发送 POST 请求，客户端在响应头发出之前就已断开
+
+    响应体（流式响应的生成器）从未被读取。
+    """
+
+    async def post(app, path, payload):
+        body = json.dumps(payload).encode("utf-8")
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0", "spec_version": "2.4"},
+            "http_version": "1.1",
+            "method": "POST",
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode("utf-8"),
+            "query_string": b"",
+            "root_path": "",
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("ascii")),
+            ],
+            "client": ("testclient", 50000),
+            "server": ("testserver", 80),
+        }
+
+        async def receive():
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        async def send(message):
+            raise OSError("client disconnected")
+
+        with pytest.raises(Exception):
+            await app(scope, receive, send)
+
+    return post
@@ -0,0 +1,128 @@
+"""响应缓存测试"""
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from app.models.cache import (
+    CACHE_AUTO,
+    CACHE_BYPASS,
+    CACHE_FORCE,
+    CachingLLMClient,
+    ResponseCache,
+    cache_mode,
+    resolve_cache_mode,
+)
+
+
+def make_client(cache=None):
+    """创建包装 mock 客户端的缓存客户端"""
+    inner = MagicMock()
+    inner.model_name = "test-model"
+    inner.chat = AsyncMock(return_value="AI response")
+    return CachingLLMClient(inner, cache or ResponseCache()), inner
+
+
+def test_response_cache_lru_eviction():
+    """测试超过容量时淘汰最久未使用的条目"""
+    cache = ResponseCache(max_entries=2)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    assert cache.get("a") == "1"  # 刷新 a 的 LRU 顺序
+    cache.set("c", "3")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.get("c") == "3"
+    assert cache.evictions == 1
+
+
+def test_response_cache_ttl_expiry(monkeypatch):
+    """测试条目过期后视为未命中"""
+    now = [1000.0]
+    monkeypatch.setattr("app.models.cache.time.monotonic", lambda: now[0])
+    cache = ResponseCache(ttl=10)
+    cache.set("a", "1")
+    assert cache.get("a") == "1"
+
+    now[0] += 11
+    assert cache.get("a") is None
+    assert len(cache) == 0
+    assert cache.hits == 1
+    assert cache.misses == 1
+
+
+def test_resolve_cache_mode():
+    """测试根据请求头和参数确定缓存模式"""
+    assert resolve_cache_mode(None) == CACHE_AUTO
+    assert resolve_cache_mode(None, opt_in=True) == CACHE_FORCE
+    assert resolve_cache_mode("no-cache", opt_in=True) == CACHE_BYPASS
+    assert resolve_cache_mode("max-age=0, No-Store") == CACHE_BYPASS
+
+
+@pytest.mark.asyncio
+async def test_deterministic_requests_are_cached():
+    """测试 temperature 为 0 的请求被缓存"""
+    client, inner = make_client()
+    messages = [{"role": "user", "content": "Hello"}]
+
+    assert await client.chat(messages, temperature=0) == "AI response"
+    assert await client.chat(messages, temperature=0) == "AI response"
+    assert inner.chat.call_count == 1
+    assert client.cache.hits == 1
+
+
+@pytest.mark.asyncio
+async def test_non_deterministic_requests_need_opt_in():
+    """测试 temperature 不为 0 的请求只有主动开启时才缓存"""
+    client, inner = make_client()
+    messages = [{"role": "user", "content": "Hello"}]
+
+    await client.chat(messages, temperature=0.7)
+    await client.chat(messages, temperature=0.7)
+    assert inner.chat.call_count == 2
+
+    token = cache_mode.set(CACHE_FORCE)
+    try:
+        await client.chat(messages, temperature=0.7)
+        await client.chat(messages, temperature=0.7)
+    finally:
+        cache_mode.reset(token)
+    assert inner.chat.call_count == 3
+
+
+@pytest.mark.asyncio
+async def test_bypass_skips_cache():
+    """测试 bypass 模式既不读取也不写入缓存"""
+    client, inner = make_client()
+    messages = [{"role": "user", "content": "Hello"}]
+
+    token = cache_mode.set(CACHE_BYPASS)
+    try:
+        await client.chat(messages, temperature=0)
+        await client.chat(messages, temperature=0)
+    finally:
+        cache_mode.reset(token)
+    assert inner.chat.call_count == 2
+    assert len(client.cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_stream_is_cached_after_completion():
+    """测试完整结束的流被缓存，命中时一次性返回"""
+    client, inner = make_client()
+    calls = 0
+
+    async def stream(*args, **kwargs):
+        nonlocal calls
+        calls += 1
+        yield "AI "
+        yield "response"
+
+    inner.chat_stream = stream
+    messages = [{"role": "user", "content": "Hello"}]
+
+    first = [c async for c in client.chat_stream(messages, temperature=0)]
+    second = [c async for c in client.chat_stream(messages, temperature=0)]
+    assert first == ["AI ", "response"]
+    assert second == ["AI response"]
+    assert calls == 1
@@ -0,0 +1,223 @@
+"""熔断器测试"""
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from app.models.circuit_breaker import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+    CircuitBreakerLLMClient,
+    CircuitOpenError,
+)
+from app.models.errors import LLMError
+from app.models.routing import Backend, RoutingLLMClient
+
+MESSAGES = [{"role": "user", "content": "Hi"}]
+
+
+class FakeClock:
+    """可手动推进的时钟"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_breaker(clock: FakeClock, name: str = "cb-test", **kwargs) -> CircuitBreaker:
+    params = dict(
+        window=10.0,
+        min_requests=4,
+        error_rate=0.5,
+        slow_call_duration=2.0,
+        slow_call_rate=0.75,
+        open_duration=5.0,
+        half_open_probes=2,
+    )
+    params.update(kwargs)
+    return CircuitBreaker(name, clock=clock, **params)
+
+
+def _call(breaker: CircuitBreaker, ok: bool = True, latency: float = 0.1) -> None:
+    token = breaker.acquire()
+    assert token is not None
+    if ok:
+        breaker.record_success(token, latency)
+    else:
+        breaker.record_failure(token)
+
+
+def test_opens_on_error_rate():
+    """测试窗口内失败比例达到阈值时打开，调用数不足时不打开"""
+    clock = FakeClock()
+    breaker = make_breaker(clock)
+    for _ in range(3):
+        _call(breaker, ok=False)
+    assert breaker.state == CLOSED
+
+    _call(breaker, ok=True)
+    assert breaker.state == OPEN
+    assert breaker.acquire() is None
+    assert breaker.snapshot()["retry_after"] == 5.0
+
+
+def test_opens_on_slow_calls():
+    """测试慢调用比例达到阈值时打开"""
+    clock = FakeClock()
+    breaker = make_breaker(clock)
+    _call(breaker, latency=0.1)
+    for _ in range(3):
+        _call(breaker, latency=3.0)
+    assert breaker.state == OPEN
+
+
+def test_old_calls_leave_the_window():
+    """测试超出统计窗口的调用不再计入"""
+    clock = FakeClock()
+    breaker = make_breaker(clock)
+    for _ in range(3):
+        _call(breaker, ok=False)
+    clock.now += 11
+    _call(breaker, ok=False)
+    assert breaker.state == CLOSED
+    assert breaker.snapshot()["requests"] == 1
+
+
+def test_half_open_probes_close_or_reopen():
+    """测试打开一段时间后放行有限的探测请求，全部成功关闭，任何失败重新打开"""
+    clock = FakeClock()
+    breaker = make_breaker(clock)
+    for _ in range(4):
+        _call(breaker, ok=False)
+    assert breaker.state == OPEN
+
+    clock.now += 5
+    assert breaker.available
+    first = breaker.acquire()
+    second = breaker.acquire()
+    assert breaker.state == HALF_OPEN
+    assert first is not None and second is not None
+    assert breaker.acquire() is None
+    assert not breaker.available
+
+    breaker.record_success(first, 0.1)
+    assert breaker.state == HALF_OPEN
+    breaker.record_failure(second)
+    assert breaker.state == OPEN
+
+    clock.now += 5
+    _call(breaker)
+    _call(breaker)
+    assert breaker.state == CLOSED
+    assert breaker.snapshot()["requests"] == 0
+
+
+def test_stale_calls_are_not_counted_as_probes():
+    """测试打开前放行的请求在半开状态下结束时不算作探测"""
+    clock = FakeClock()
+    breaker = make_breaker(clock)
+    stale = breaker.acquire()
+    for _ in range(4):
+        _call(breaker, ok=False)
+    clock.now += 5
+    probe = breaker.acquire()
+    assert breaker.state == HALF_OPEN
+
+    breaker.record_success(stale, 0.1)
+    breaker.record_success(probe, 0.1)
+    assert breaker.state == HALF_OPEN
+
+
+@pytest.mark.asyncio
+async def test_client_short_circuits_when_open():
+    """测试熔断器打开时不再调用上游，立即抛出 CircuitOpenError"""
+    clock = FakeClock()
+    breaker = make_breaker(clock, name="cb-client")
+    inner = MagicMock()
+    inner.model_name = "test-model"
+    inner.chat = AsyncMock(side_effect=LLMError("503", status_code=503, retryable=True))
+    client = CircuitBreakerLLMClient(inner, breaker)
+
+    for _ in range(4):
+        with pytest.raises(LLMError, match="503"):
+            await client.chat(MESSAGES)
+    assert breaker.state == OPEN
+
+    with pytest.raises(CircuitOpenError) as exc_info:
+        await client.chat(MESSAGES)
+    assert inner.chat.await_count == 4
+    assert exc_info.value.retry_after == 5.0
+
+
+@pytest.mark.asyncio
+async def test_request_errors_do_not_trip_the_breaker():
+    """测试 400 等请求本身的错误不计入失败"""
+    clock = FakeClock()
+    breaker = make_breaker(clock, name="cb-400")
+    inner = MagicMock()
+    inner.chat = AsyncMock(side_effect=LLMError("bad", status_code=400))
+    client = CircuitBreakerLLMClient(inner, breaker)
+
+    for _ in range(6):
+        with pytest.raises(LLMError):
+            await client.chat(MESSAGES)
+    assert breaker.state == CLOSED
+
+
+@pytest.mark.asyncio
+async def test_stream_records_time_to_first_chunk():
+    """测试流式调用按收到第一个增量的耗时统计，流开始前失败计入失败"""
+    clock = FakeClock()
+    breaker = make_breaker(clock, name="cb-stream", min_requests=1)
+    inner = MagicMock()
+
+    async def ok_stream(*args, **kwargs):
+        yield "Hello"
+
+    inner.chat_stream = ok_stream
+    client = CircuitBreakerLLMClient(inner, breaker)
+    assert [c async for c in client.chat_stream(MESSAGES)] == ["Hello"]
+    assert breaker.state == CLOSED
+    assert breaker.snapshot()["requests"] == 1
+
+    async def broken_stream(*args, **kwargs):
+        raise LLMError("reset", retryable=True)
+        yield  # pragma: no cover
+
+    inner.chat_stream = broken_stream
+    with pytest.raises(LLMError, match="reset"):
+        async for _ in client.chat_stream(MESSAGES):
+            pass
+    assert breaker.state == OPEN
+
+
+@pytest.mark.asyncio
+async def test_router_skips_open_backends():
+    """测试路由客户端把熔断器打开的上游排在最后，并换到其他上游"""
+    clock = FakeClock()
+    breakers = [make_breaker(clock, name=f"cb-route-{i}") for i in range(2)]
+    backends = []
+    for i, breaker in enumerate(breakers):
+        inner = MagicMock()
+        inner.model_name = "test-model"
+        inner.chat = AsyncMock(return_value=f"backend-{i}")
+        backends.append(
+            Backend(
+                f"cb-route-{i}",
+                CircuitBreakerLLMClient(inner, breaker),
+                initial_latency=0.1 if i == 0 else 1.0,
+                breaker=breaker,
+            )
+        )
+    router = RoutingLLMClient(backends)
+    assert router.candidates()[0] is backends[0]
+
+    for _ in range(4):
+        _call(breakers[0], ok=False)
+    assert router.candidates()[0] is backends[1]
+    assert await router.chat(MESSAGES) == "backend-1"
+    # 熔断导致的快速失败不计入上游的耗时
+    assert backends[0].ewma == pytest.approx(0.1)
@@ -0,0 +1,187 @@
+"""CoalescingLLMClient 测试"""
+
+import asyncio
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from app.models.coalescing import CoalescingLLMClient
+from app.models.stream_result import (
+    StreamAccumulator,
+    collect_stream_metadata,
+    record_finish_reason,
+    record_usage,
+)
+
+
+def make_inner():
+    """创建被包装的 mock 客户端"""
+    inner = MagicMock()
+    inner.model_name = "test-model"
+    return inner
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_chat_shares_one_call():
+    """测试相同的并发请求只调用一次上游"""
+    inner = make_inner()
+    release = asyncio.Event()
+
+    async def slow_chat(*args, **kwargs):
+        await release.wait()
+        return "AI response"
+
+    inner.chat = AsyncMock(side_effect=slow_chat)
+    client = CoalescingLLMClient(inner)
+    messages = [{"role": "user", "content": "Hello"}]
+
+    tasks = [asyncio.create_task(client.chat(messages)) for _ in range(5)]
+    await asyncio.sleep(0)
+    release.set()
+    results = await asyncio.gather(*tasks)
+
+    assert results == ["AI response"] * 5
+    assert inner.chat.call_count == 1
+    assert client.upstream_calls == 1
+    assert client.coalesced_calls == 4
+
+
+@pytest.mark.asyncio
+async def test_different_params_are_not_coalesced():
+    """测试参数不同的请求不会被合并"""
+    inner = make_inner()
+    inner.chat = AsyncMock(return_value="AI response")
+    client = CoalescingLLMClient(inner)
+    messages = [{"role": "user", "content": "Hello"}]
+
+    await asyncio.gather(
+        client.chat(messages, temperature=0.1), client.chat(messages, temperature=0.9)
+    )
+    assert inner.chat.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_completed_calls_are_not_cached():
+    """测试调用完成后不再复用结果"""
+    inner = make_inner()
+    inner.chat = AsyncMock(return_value="AI response")
+    client = CoalescingLLMClient(inner)
+    messages = [{"role": "user", "content": "Hello"}]
+
+    await client.chat(messages)
+    await client.chat(messages)
+    assert inner.chat.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_errors_fan_out_to_all_waiters():
+    """测试上游错误分发给所有等待者"""
+    inner = make_inner()
+    inner.chat = AsyncMock(side_effect=Exception("API Error"))
+    client = CoalescingLLMClient(inner)
+    messages = [{"role": "user", "content": "Hello"}]
+
+    results = await asyncio.gather(
+        client.chat(messages), client.chat(messages), return_exceptions=True
+    )
+    assert all(isinstance(r, Exception) for r in results)
+    assert inner.chat.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_stream_subscribers_share_one_upstream_stream():
+    """测试流式订阅者共享同一条上游流，晚加入者回放已收到的增量"""
+    inner = make_inner()
+    calls = 0
+    release = asyncio.Event()
+
+    async def stream(*args, **kwargs):
+        nonlocal calls
+        calls += 1
+        yield "AI "
+        await release.wait()
+        yield "response"
+
+    inner.chat_stream = stream
+    client = CoalescingLLMClient(inner)
+    messages = [{"role": "user", "content": "Hello"}]
+
+    async def collect():
+        return [chunk async for chunk in client.chat_stream(messages)]
+
+    first = asyncio.create_task(collect())
+    await asyncio.sleep(0.01)
+    second = asyncio.create_task(collect())
+    await asyncio.sleep(0.01)
+    release.set()
+
+    assert await first == ["AI ", "response"]
+    assert await second == ["AI ", "response"]
+    assert calls == 1
+
+
+@pytest.mark.asyncio
+async def test_stream_cancelled_when_all_subscribers_leave():
+    """测试所有订阅者离开后取消上游流"""
+    inner = make_inner()
+    upstream_closed = asyncio.Event()
+
+    async def stream(*args, **kwargs):
+        try:
+            yield "AI "
+            await asyncio.Event().wait()
+        finally:
+            upstream_closed.set()
+
+    inner.chat_stream = stream
+    client = CoalescingLLMClient(inner)
+
+    subscriber = client.chat_stream([{"role": "user", "content": "Hello"}])
+    assert await subscriber.__anext__() == "AI "
+    await subscriber.aclose()
+
+    await asyncio.wait_for(upstream_closed.wait(), timeout=1)
+
+
+@pytest.mark.asyncio
+async def test_usage_replayed_to_every_waiter():
+    """测试被合并的调用方也收到上游的用量和结束原因"""
+    inner = make_inner()
+    release = asyncio.Event()
+    usage = {"prompt_tokens": 5, "completion_tokens": 2, "total_tokens": 7}
+
+    async def slow_chat(*args, **kwargs):
+        await release.wait()
+        record_usage(usage)
+        record_finish_reason("stop")
+        return "AI response"
+
+    async def stream(*args, **kwargs):
+        yield "AI "
+        await release.wait()
+        yield "response"
+        record_usage(usage)
+        record_finish_reason("stop")
+
+    inner.chat = AsyncMock(side_effect=slow_chat)
+    inner.chat_stream = stream
+    client = CoalescingLLMClient(inner)
+    messages = [{"role": "user", "content": "Hello"}]
+
+    async def call(stream: bool) -> StreamAccumulator:
+        with collect_stream_metadata(StreamAccumulator()) as accumulator:
+            if stream:
+                async for _ in client.chat_stream(messages):
+                    pass
+            else:
+                await client.chat(messages)
+        return accumulator
+
+    tasks = [asyncio.create_task(call(stream)) for stream in (False, False, True, True)]
+    await asyncio.sleep(0.01)
+    release.set()
+    accumulators = await asyncio.gather(*tasks)
+
+    assert client.coalesced_calls == 2
+    assert [a.usage for a in accumulators] == [usage] * 4
+    assert [a.finish_reason for a in accumulators] == ["stop"] * 4
@@ -0,0 +1,56 @@
+"""消息 JSON 预编码测试"""
+
+import json
+
+from app.models.encoding import (
+    EncodedMessage,
+    encode_json,
+    encode_messages,
+    encode_request_body,
+)
+from app.models.llm_client import request_fingerprint
+
+
+def test_encoded_message_behaves_like_dict():
+    """测试预编码消息与普通字典等价"""
+    message = EncodedMessage({"role": "user", "content": "你好"})
+    assert message == {"role": "user", "content": "你好"}
+    assert message.encoded == encode_json({"content": "你好", "role": "user"})
+    assert json.loads(message.encoded) == message
+
+
+def test_request_body_reuses_cached_fragments():
+    """测试请求体直接拼接缓存的编码，而不是重新序列化"""
+    history = EncodedMessage({"role": "user", "content": "old"}, b'{"cached":true}')
+    body = encode_request_body(
+        {"model": "m", "temperature": 0.5},
+        [history, {"role": "user", "content": "新消息"}],
+    )
+    assert json.loads(body) == {
+        "model": "m",
+        "temperature": 0.5,
+        "messages": [{"cached": True}, {"role": "user", "content": "新消息"}],
+    }
+
+
+def test_request_body_matches_plain_encoding():
+    """测试拼接结果与整体序列化的结果等价"""
+    messages = [
+        EncodedMessage({"role": "user", "content": 'quote " and \\n'}),
+        {"role": "assistant", "content": [{"type": "text", "text": "多模态"}]},
+    ]
+    payload = {"model": "m", "stream": True}
+    assert json.loads(encode_request_body(payload, messages)) == json.loads(
+        encode_json({**payload, "messages": messages})
+    )
+    assert encode_request_body({}, []) == b'{"messages":[]}'
+    assert encode_messages([]) == b"[]"
+
+
+def test_fingerprint_same_for_encoded_and_plain_messages():
+    """测试预编码消息与普通消息得到相同的请求指纹"""
+    plain = [{"role": "user", "content": "hi"}]
+    encoded = [EncodedMessage(plain[0])]
+    assert request_fingerprint("m", plain, temperature=0) == request_fingerprint(
+        "m", encoded, temperature=0
+    )
@@ -0,0 +1,77 @@
+"""LLM 调用错误分类测试"""
+
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import openai
+
+from app.models.errors import LLMError, classify_error, parse_retry_after
+
+
+def _status_error(status: int, headers=None) -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "https://ark.example.com/api/v3/chat/completions")
+    response = httpx.Response(status, headers=headers, request=request)
+    return httpx.HTTPStatusError("error", request=request, response=response)
+
+
+def test_parse_retry_after():
+    """测试解析秒数、毫秒和 HTTP 日期格式的 Retry-After"""
+    assert parse_retry_after({"retry-after": "3"}) == 3.0
+    assert parse_retry_after({"retry-after": "1.5"}) == 1.5
+    assert parse_retry_after({"retry-after-ms": "250"}) == 0.25
+    assert parse_retry_after({"retry-after": "soon"}) is None
+    assert parse_retry_after({}) is None
+    assert parse_retry_after(None) is None
+
+    later = datetime.now(timezone.utc) + timedelta(seconds=30)
+    delay = parse_retry_after({"retry-after": format_datetime(later, usegmt=True)})
+    assert delay is not None and 25 < delay <= 30
+
+    earlier = datetime.now(timezone.utc) - timedelta(seconds=30)
+    assert (
+        parse_retry_after({"retry-after": format_datetime(earlier, usegmt=True)}) == 0
+    )
+
+
+def test_classify_http_status_errors():
+    """测试按状态码区分可重试和不可重试的错误"""
+    for status in (429, 500, 502, 503, 504):
+        assert classify_error(_status_error(status)).retryable, status
+    for status in (400, 401, 403, 404, 422):
+        assert not classify_error(_status_error(status)).retryable, status
+
+    error = classify_error(_status_error(429, {"Retry-After": "7"}), "rate limited")
+    assert str(error) == "rate limited"
+    assert error.status_code == 429
+    assert error.retry_after == 7.0
+
+
+def test_classify_transport_and_openai_errors():
+    """测试连接失败、超时和 OpenAI SDK 错误的分类"""
+    request = httpx.Request("POST", "https://api.example.com/v1/chat/completions")
+    assert classify_error(httpx.ConnectError("refused", request=request)).retryable
+    assert classify_error(httpx.ReadTimeout("timeout", request=request)).retryable
+    assert classify_error(ConnectionResetError("reset")).retryable
+    assert not classify_error(ValueError("Unexpected response format")).retryable
+
+    assert classify_error(openai.APIConnectionError(request=request)).retryable
+    response = httpx.Response(503, headers={"retry-after-ms": "500"}, request=request)
+    error = classify_error(
+        openai.InternalServerError("unavailable", response=response, body=None)
+    )
+    assert error.retryable
+    assert error.status_code == 503
+    assert error.retry_after == 0.5
+
+
+def test_classify_keeps_llm_error():
+    """测试 LLMError 原样返回，指定消息时保留分类信息"""
+    error = LLMError("boom", status_code=502, retry_after=1.0, retryable=True)
+    assert classify_error(error) is error
+
+    renamed = classify_error(error, "Error calling Doubao API: boom")
+    assert str(renamed) == "Error calling Doubao API: boom"
+    assert renamed.status_code == 502
+    assert renamed.retry_after == 1.0
+    assert renamed.retryable
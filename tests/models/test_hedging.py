@@ -0,0 +1,179 @@
+"""HedgingLLMClient 测试"""
+
+import asyncio
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from app.metrics import metrics
+from app.models.errors import LLMError
+from app.models.hedging import HedgeBudget, HedgingLLMClient
+
+MESSAGES = [{"role": "user", "content": "Hi"}]
+
+
+def make_inner(model: str = "test-model"):
+    """创建被包装的 mock 客户端"""
+    inner = MagicMock()
+    inner.model_name = model
+    return inner
+
+
+def _warm_up(client: HedgingLLMClient, latency: float, samples: int = 20) -> None:
+    """写入耗时样本，使对冲等待时间为 latency"""
+    histogram = client._latency(client.model_name)
+    for _ in range(samples):
+        histogram.observe(latency)
+
+
+def _full_budget() -> HedgeBudget:
+    budget = HedgeBudget(ratio=1.0, burst=10.0)
+    budget.tokens = 10.0
+    return budget
+
+
+def test_budget_caps_hedge_ratio():
+    """测试对冲请求不超过请求数的 ratio，额度积累有上限"""
+    budget = HedgeBudget(ratio=0.05, burst=2.0)
+    hedges = 0
+    for _ in range(200):
+        budget.on_request()
+        if budget.try_acquire():
+            hedges += 1
+    assert hedges == 10
+
+    for _ in range(1000):
+        budget.on_request()
+    assert budget.tokens == 2.0
+
+
+def test_hedge_delay_tracks_percentile_per_model():
+    """测试对冲等待时间为按模型统计的耗时分位数，样本不足时不对冲"""
+    client = HedgingLLMClient(
+        make_inner("delay-model"), percentile=0.9, min_delay=0.01, provider="hedge-pct"
+    )
+    assert client.hedge_delay("delay-model") is None
+
+    histogram = client._latency("delay-model")
+    for i in range(100):
+        histogram.observe(i / 100)
+    assert client.hedge_delay("delay-model") == pytest.approx(0.9)
+    assert client.hedge_delay("other-model") is None
+
+
+@pytest.mark.asyncio
+async def test_slow_primary_is_hedged_and_cancelled():
+    """测试原请求超过对冲等待时间后发送对冲请求，取先完成的结果并取消原请求"""
+    inner = make_inner("hedge-model")
+    cancelled = asyncio.Event()
+
+    async def slow_chat(*args, **kwargs):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+        return "slow"
+
+    inner.chat = AsyncMock(side_effect=slow_chat)
+    alternate = make_inner("hedge-model")
+    alternate.chat = AsyncMock(return_value="fast")
+    client = HedgingLLMClient(
+        inner,
+        alternate=alternate,
+        min_delay=0.01,
+        budget=_full_budget(),
+        provider="hedge-win",
+    )
+    _warm_up(client, 0.01)
+
+    assert await client.chat(MESSAGES, temperature=0) == "fast"
+    await asyncio.wait_for(cancelled.wait(), 1)
+    alternate.chat.assert_awaited_once()
+    assert alternate.chat.call_args.kwargs["temperature"] == 0
+    assert (
+        metrics.snapshot()['llm_hedges_total{outcome="hedge_won",provider="hedge-win"}']
+        == 1
+    )
+
+
+@pytest.mark.asyncio
+async def test_fast_primary_is_not_hedged():
+    """测试原请求在对冲等待时间内返回时不发送对冲请求"""
+    inner = make_inner()
+    inner.chat = AsyncMock(return_value="AI response")
+    client = HedgingLLMClient(
+        inner, min_delay=1.0, budget=_full_budget(), provider="hedge-fast"
+    )
+    _warm_up(client, 1.0)
+
+    assert await client.chat(MESSAGES) == "AI response"
+    assert inner.chat.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_no_hedge_without_budget():
+    """测试额度不足时不对冲，等待原请求完成"""
+    inner = make_inner()
+
+    async def slow_chat(*args, **kwargs):
+        await asyncio.sleep(0.05)
+        return "slow"
+
+    inner.chat = AsyncMock(side_effect=slow_chat)
+    client = HedgingLLMClient(inner, min_delay=0.01, provider="hedge-budget")
+    _warm_up(client, 0.01)
+
+    assert await client.chat(MESSAGES) == "slow"
+    assert inner.chat.call_count == 1
+    assert (
+        metrics.snapshot()[
+            'llm_hedges_total{outcome="budget_exhausted",provider="hedge-budget"}'
+        ]
+        == 1
+    )
+
+
+@pytest.mark.asyncio
+async def test_failed_hedge_falls_back_to_primary():
+    """测试对冲请求失败时等待原请求；两者都失败时抛出原请求的错误"""
+    inner = make_inner()
+
+    async def slow_chat(*args, **kwargs):
+        await asyncio.sleep(0.05)
+        return "primary"
+
+    inner.chat = AsyncMock(side_effect=slow_chat)
+    alternate = make_inner()
+    alternate.chat = AsyncMock(side_effect=LLMError("hedge failed"))
+    client = HedgingLLMClient(
+        inner,
+        alternate=alternate,
+        min_delay=0.01,
+        budget=_full_budget(),
+        provider="hedge-fallback",
+    )
+    _warm_up(client, 0.01)
+    assert await client.chat(MESSAGES) == "primary"
+
+    async def slow_failure(*args, **kwargs):
+        await asyncio.sleep(0.05)
+        raise LLMError("primary failed")
+
+    inner.chat = AsyncMock(side_effect=slow_failure)
+    with pytest.raises(LLMError, match="primary failed"):
+        await client.chat(MESSAGES)
+
+
+@pytest.mark.asyncio
+async def test_stream_is_not_hedged():
+    """测试 stream=True 直接委托，不对冲"""
+    inner = make_inner()
+    inner.chat = AsyncMock(return_value="streamed")
+    client = HedgingLLMClient(
+        inner, min_delay=0.0, budget=_full_budget(), provider="hedge-stream"
+    )
+    _warm_up(client, 0.0)
+
+    assert await client.chat(MESSAGES, stream=True) == "streamed"
+    assert inner.chat.call_args.kwargs["stream"] is True
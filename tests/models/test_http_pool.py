@@ -0,0 +1,92 @@
+"""上游 HTTP 连接池测试"""
+
+import asyncio
+
+import httpx
+import pytest
+
+from app.metrics import metrics
+from app.models.http_pool import (
+    InstrumentedTransport,
+    close_http_clients,
+    get_http_client,
+    get_http_transport,
+    pool_key,
+)
+
+
+def test_pool_key_and_sharing():
+    """测试指向同一主机的 URL 共享同一个客户端"""
+    assert pool_key("https://ark.example.com/api/v3/chat/completions") == (
+        "https://ark.example.com:443"
+    )
+    assert pool_key("http://localhost:8080/v1") == "http://localhost:8080"
+
+    a = get_http_client("https://ark.example.com/api/v3/chat/completions")
+    b = get_http_client("https://ark.example.com/api/v3")
+    c = get_http_client("https://other.example.com/v1")
+    assert a is b
+    assert a is not c
+    transport = get_http_transport("https://ark.example.com/api/v3")
+    assert isinstance(transport, InstrumentedTransport)
+    assert transport is not get_http_transport("https://other.example.com/v1")
+
+
+@pytest.mark.asyncio
+async def test_closed_clients_are_recreated():
+    """测试关闭后再次获取时重新创建客户端"""
+    first = get_http_client("https://closed.example.com")
+    await close_http_clients()
+    assert first.is_closed
+    assert get_http_client("https://closed.example.com") is not first
+
+
+async def _serve(delay: float):
+    """本地 HTTP/1.1 服务：每个请求延迟 delay 秒后返回，保持长连接"""
+
+    async def handle(reader, writer):
+        while True:
+            try:
+                await reader.readuntil(b"\r\n\r\n")
+            except (asyncio.IncompleteReadError, ConnectionError):
+                break
+            await asyncio.sleep(delay)
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n"
+                b"Connection: keep-alive\r\n\r\nok"
+            )
+            await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    return server, f"http://127.0.0.1:{port}"
+
+
+@pytest.mark.asyncio
+async def test_transport_reports_reuse_and_acquire_wait():
+    """测试连接复用，以及连接池满时的等待时间和利用率"""
+    server, url = await _serve(delay=0.1)
+    host = pool_key(url)
+    transport = InstrumentedTransport(
+        host, 1, limits=httpx.Limits(max_connections=1, max_keepalive_connections=1)
+    )
+    try:
+        async with httpx.AsyncClient(transport=transport) as client:
+            await client.get(url)
+            await client.get(url)
+            snapshot = metrics.snapshot()
+            assert snapshot[f'http_pool_connections_opened_total{{host="{host}"}}'] == 1
+
+            # 只有一个连接：第二个请求要等第一个请求结束
+            responses = await asyncio.gather(client.get(url), client.get(url))
+            assert [r.text for r in responses] == ["ok", "ok"]
+    finally:
+        server.close()
+        await server.wait_closed()
+
+    wait = metrics.snapshot()[f'http_pool_acquire_wait_seconds{{host="{host}"}}']
+    assert wait["count"] == 4
+    assert wait["max"] >= 0.08
+    assert transport.active == 0 and transport.waiting == 0
+    assert metrics.snapshot()[f'http_pool_utilization{{host="{host}"}}'] == 0
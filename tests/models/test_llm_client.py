@@ -22,9 +22,9 @@ async def test_doubao_client_chat_success(mock_settings, monkeypatch):
     monkeypatch.setattr("app.models.llm_client.settings", mock_settings)
 
     mock_response = MagicMock()
-    mock_response.json.return_value = {
-        "choices": [{"message": {"content": "AI response"}}]
-    }
+    mock_response.content = json.dumps(
+        {"choices": [{"message": {"content": "AI response"}}]}
+    ).encode()
     mock_response.raise_for_status = MagicMock()
 
     client = DoubaoClient()
@@ -34,48 +34,140 @@ async def test_doubao_client_chat_success(mock_settings, monkeypatch):
         result = await client.chat([{"role": "user", "content": "Hello"}])
         assert result == "AI response"
         mock_post.assert_called_once()
+        body = json.loads(mock_post.call_args.kwargs["content"])
+        assert body["model"] == "test-model"
+        assert body["messages"] == [{"role": "user", "content": "Hello"}]
+
+
+class MockStreamContext:
+    """模拟 httpx 流式响应的异步上下文管理器"""
+
+    def __init__(self, response):
+        self.response = response
+
+    async def __aenter__(self):
+        return self.response
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        return None
+
+
+def _mock_stream_response(body: bytes, chunk_size: int):
+    """按固定大小切分响应体，模拟网络字节块"""
+
+    async def mock_aiter_bytes():
+        for i in range(0, len(body), chunk_size):
+            yield body[i : i + chunk_size]
+
+    mock_response = AsyncMock()
+    mock_response.raise_for_status = MagicMock()
+    mock_response.aiter_bytes = mock_aiter_bytes
+    return MockStreamContext(mock_response)
+
+
+def _sse(data) -> str:
+    return "data: " + json.dumps(data, ensure_ascii=False) + "\r\n\r\n"
 
 
 @pytest.mark.asyncio
 async def test_doubao_client_chat_stream(mock_settings, monkeypatch):
-    """测试流式调用"""
+    """测试流式调用（字节块在任意位置切开）"""
     monkeypatch.setattr("app.models.llm_client.settings", mock_settings)
 
     client = DoubaoClient()
+    body = (
+        ": keep-alive\r\n\r\n"
+        + _sse({"choices": [{"delta": {"content": "你好"}}]})
+        + _sse({"choices": [{"delta": {"content": " World"}}]})
+        + "data: [DONE]\r\n\r\n"
+    ).encode()
 
-    # Mock stream response - 需要模拟异步上下文管理器
-    mock_line1 = "data: " + json.dumps({"choices": [{"delta": {"content": "Hello"}}]})
-    mock_line2 = "data: " + json.dumps({"choices": [{"delta": {"content": " World"}}]})
-    mock_line3 = "data: [DONE]"
+    for chunk_size in (1, 3, 7, len(body)):
+        stream_context = _mock_stream_response(body, chunk_size)
+        with patch.object(client.client, "stream", return_value=stream_context):
+            chunks = []
+            async for chunk in client.chat_stream([{"role": "user", "content": "Hi"}]):
+                chunks.append(chunk)
 
-    async def mock_aiter_lines():
-        yield mock_line1
-        yield mock_line2
-        yield mock_line3
+            assert chunks == ["你好", " World"]
+
+
+@pytest.mark.asyncio
+async def test_doubao_client_chat_stream_events(mock_settings, monkeypatch):
+    """测试流式调用产出 finish_reason 和 usage 事件"""
+    from app.models.sse import ChatStreamEvent
+
+    monkeypatch.setattr("app.models.llm_client.settings", mock_settings)
+
+    client = DoubaoClient()
+    usage = {"prompt_tokens": 5, "completion_tokens": 1, "total_tokens": 6}
+    body = (
+        _sse({"choices": [{"delta": {"content": "Hi"}, "finish_reason": "stop"}]})
+        + _sse({"choices": [], "usage": usage})
+        + "data: [DONE]\r\n\r\n"
+    ).encode()
+
+    with patch.object(
+        client.client, "stream", return_value=_mock_stream_response(body, 5)
+    ):
+        events = [e async for e in client.chat_stream_events([{"role": "user"}])]
+
+    assert events == [
+        ChatStreamEvent("delta", content="Hi"),
+        ChatStreamEvent("finish", finish_reason="stop"),
+        ChatStreamEvent("usage", usage=usage),
+        ChatStreamEvent("done"),
+    ]
 
-    mock_response = AsyncMock()
-    mock_response.raise_for_status = MagicMock()
-    mock_response.aiter_lines = mock_aiter_lines
 
-    # 创建异步上下文管理器
-    class MockStreamContext:
-        def __init__(self, response):
-            self.response = response
+@pytest.mark.asyncio
+async def test_doubao_client_chat_stream_result(mock_settings, monkeypatch):
+    """测试流式结果包含上游返回的用量和结束原因，并请求返回用量"""
+    monkeypatch.setattr("app.models.llm_client.settings", mock_settings)
 
-        async def __aenter__(self):
-            return self.response
+    client = DoubaoClient()
+    usage = {"prompt_tokens": 5, "completion_tokens": 2, "total_tokens": 7}
+    body = (
+        _sse({"choices": [{"delta": {"content": "He"}}]})
+        + _sse({"choices": [{"delta": {"content": "y"}, "finish_reason": "length"}]})
+        + _sse({"choices": [], "usage": usage})
+        + "data: [DONE]\r\n\r\n"
+    ).encode()
+
+    with patch.object(
+        client.client, "stream", return_value=_mock_stream_response(body, 11)
+    ) as mock_stream:
+        result = await client.chat_stream_result([{"role": "user", "content": "Hi"}])
+
+    assert result.content == "Hey"
+    assert result.chunk_count == 2
+    assert result.finish_reason == "length"
+    assert result.usage == usage
+    request_body = json.loads(mock_stream.call_args.kwargs["content"])
+    assert request_body["stream_options"] == {"include_usage": True}
 
-        async def __aexit__(self, exc_type, exc_val, exc_tb):
-            return None
 
-    mock_stream_context = MockStreamContext(mock_response)
+@pytest.mark.asyncio
+async def test_doubao_client_chat_stream_error_event(mock_settings, monkeypatch):
+    """测试上游在流中途发送的错误事件作为异常抛出"""
+    monkeypatch.setattr("app.models.llm_client.settings", mock_settings)
 
-    with patch.object(client.client, "stream", return_value=mock_stream_context):
+    client = DoubaoClient()
+    body = (
+        _sse({"choices": [{"delta": {"content": "部分"}}]})
+        + _sse({"error": {"message": "rate limited", "code": "429"}})
+    ).encode()
+
+    with patch.object(
+        client.client, "stream", return_value=_mock_stream_response(body, 16)
+    ):
         chunks = []
-        async for chunk in client.chat_stream([{"role": "user", "content": "Hi"}]):
-            chunks.append(chunk)
+        with pytest.raises(Exception) as exc_info:
+            async for chunk in client.chat_stream([{"role": "user", "content": "Hi"}]):
+                chunks.append(chunk)
 
-        assert chunks == ["Hello", " World"]
+    assert chunks == ["部分"]
+    assert "rate limited" in str(exc_info.value)
 
 
 @pytest.mark.asyncio
@@ -110,3 +202,32 @@ async def test_doubao_client_close(mock_settings, monkeypatch):
     await client.close()
     # 验证客户端已关闭（通过 mock 验证）
     assert client.client is not None
+
+
+@pytest.mark.asyncio
+async def test_doubao_client_rate_limited_error_is_retryable(
+    mock_settings, monkeypatch
+):
+    """测试 429 错误携带状态码和 Retry-After，并标记为可重试"""
+    import httpx
+
+    from app.models.errors import LLMError
+
+    monkeypatch.setattr("app.models.llm_client.settings", mock_settings)
+
+    client = DoubaoClient()
+    request = httpx.Request("POST", client.api_endpoint)
+    response = httpx.Response(
+        429, headers={"Retry-After": "2"}, content=b"Too Many Requests", request=request
+    )
+
+    with patch.object(client.client, "post", new_callable=AsyncMock) as mock_post:
+        mock_post.return_value = response
+
+        with pytest.raises(LLMError) as exc_info:
+            await client.chat([{"role": "user", "content": "Hello"}])
+
+    assert "API request failed with status 429" in str(exc_info.value)
+    assert exc_info.value.status_code == 429
+    assert exc_info.value.retry_after == 2.0
+    assert exc_info.value.retryable
@@ -5,6 +5,21 @@ from unittest.mock import AsyncMock, patch, MagicMock
 from app.models.openai_client import OpenAIClient
 
 
+class MockAsyncStream:
+    """模拟 openai.AsyncStream：可异步迭代，并支持 close()"""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.closed = False
+
+    async def __aiter__(self):
+        for chunk in self.chunks:
+            yield chunk
+
+    async def close(self):
+        self.closed = True
+
+
 @pytest.mark.asyncio
 async def test_openai_client_init(mock_settings, monkeypatch):
     """测试客户端初始化"""
@@ -53,14 +68,10 @@ async def test_openai_client_chat_stream(mock_settings, monkeypatch):
     mock_delta2.content = " World"
     mock_chunk2.choices = [MagicMock(delta=mock_delta2)]
 
-    async def mock_stream():
-        yield mock_chunk1
-        yield mock_chunk2
-
     with patch.object(
         client.client.chat.completions, "create", new_callable=AsyncMock
     ) as mock_create:
-        mock_create.return_value = mock_stream()
+        mock_create.return_value = MockAsyncStream([mock_chunk1, mock_chunk2])
 
         chunks = []
         async for chunk in client.chat_stream([{"role": "user", "content": "Hi"}]):
@@ -83,3 +94,29 @@ async def test_openai_client_chat_error(mock_settings, monkeypatch):
         with pytest.raises(Exception) as exc_info:
             await client.chat([{"role": "user", "content": "Hello"}])
         assert "Error calling OpenAI API" in str(exc_info.value)
+
+
+@pytest.mark.asyncio
+async def test_openai_client_chat_stream_closes_on_early_exit(
+    mock_settings, monkeypatch
+):
+    """测试调用方提前结束迭代时关闭上游流"""
+    monkeypatch.setattr("app.models.openai_client.settings", mock_settings)
+
+    client = OpenAIClient()
+    mock_delta = MagicMock()
+    mock_delta.content = "Hello"
+    mock_chunk = MagicMock()
+    mock_chunk.choices = [MagicMock(delta=mock_delta)]
+    upstream = MockAsyncStream([mock_chunk, mock_chunk, mock_chunk])
+
+    with patch.object(
+        client.client.chat.completions, "create", new_callable=AsyncMock
+    ) as mock_create:
+        mock_create.return_value = upstream
+
+        stream = client.chat_stream([{"role": "user", "content": "Hi"}])
+        assert await stream.__anext__() == "Hello"
+        await stream.aclose()
+
+    assert upstream.closed
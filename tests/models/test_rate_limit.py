@@ -0,0 +1,274 @@
+"""客户端限流测试"""
+
+import asyncio
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from app.config import settings
+from app.metrics import metrics
+from app.models import rate_limit
+from app.models.circuit_breaker import (
+    CircuitBreaker,
+    CircuitBreakerLLMClient,
+    CircuitOpenError,
+)
+from app.models.errors import LLMError
+from app.models.rate_limit import (
+    RateLimitedLLMClient,
+    RateLimiter,
+    TokenBucket,
+    estimate_request_tokens,
+    get_rate_limiter,
+    with_rate_limit,
+)
+from app.models.stream_result import (
+    StreamAccumulator,
+    collect_stream_metadata,
+    record_finish_reason,
+    record_usage,
+)
+
+MESSAGES = [{"role": "user", "content": "Hi"}]
+
+
+class FakeClock:
+    """可手动推进的时钟，sleep 直接推进时间"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    async def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture(autouse=True)
+def reset_limiters(monkeypatch):
+    """每个测试使用独立的限流器和配置"""
+    monkeypatch.setattr(rate_limit, "_limiters", {})
+    monkeypatch.setattr(settings, "llm_rate_limit_rpm", 0)
+    monkeypatch.setattr(settings, "llm_rate_limit_tpm", 0)
+    monkeypatch.setattr(settings, "llm_rate_limits", {})
+    monkeypatch.setattr(settings, "llm_rate_limit_default_output_tokens", 100)
+
+
+def test_token_bucket_refills_continuously():
+    """测试令牌桶按速度连续补充，不超过容量，余额可以为负"""
+    clock = FakeClock()
+    bucket = TokenBucket(60, clock)
+    bucket.consume(60)
+    assert bucket.wait_time(1) == pytest.approx(1.0)
+
+    clock.now += 30
+    assert bucket.tokens == pytest.approx(30)
+    clock.now += 60
+    assert bucket.tokens == pytest.approx(60)
+
+    bucket.consume(90)
+    assert bucket.wait_time(10) == pytest.approx(40)
+    # 超过容量的请求只等到桶满
+    assert bucket.wait_time(600) == pytest.approx(90)
+
+
+@pytest.mark.asyncio
+async def test_limiter_waits_for_request_and_token_capacity():
+    """测试 RPM 或 TPM 额度不足时等待，取两者中较长的时间"""
+    clock = FakeClock()
+    limiter = RateLimiter("rl-wait", rpm=2, tpm=600, clock=clock, sleep=clock.sleep)
+    await limiter.acquire(100)
+    await limiter.acquire(100)
+    assert clock.sleeps == []
+
+    # 请求数用完：每 30 秒补充一个
+    await limiter.acquire(100)
+    assert clock.sleeps == [pytest.approx(30)]
+
+    # token 余额 300 + 30 秒补充的 300 = 600，再要 900 只等到桶满
+    clock.sleeps.clear()
+    await limiter.acquire(900)
+    assert sum(clock.sleeps) == pytest.approx(30)
+
+
+@pytest.mark.asyncio
+async def test_limiter_reconciles_actual_usage():
+    """测试按实际用量退还或补扣 TPM 余额"""
+    clock = FakeClock()
+    limiter = RateLimiter("rl-reconcile", tpm=1000, clock=clock, sleep=clock.sleep)
+    await limiter.acquire(800)
+    limiter.reconcile(800, 300)
+    assert limiter.tokens.tokens == pytest.approx(700)
+
+    limiter.reconcile(300, 1500)
+    assert limiter.tokens.tokens == pytest.approx(-500)
+
+    snapshot = metrics.snapshot()
+    assert (
+        snapshot['llm_ratelimit_tokens_total{kind="estimated",model="rl-reconcile"}']
+        == 800
+    )
+    assert (
+        snapshot['llm_ratelimit_tokens_total{kind="actual",model="rl-reconcile"}']
+        == 1800
+    )
+
+
+@pytest.mark.asyncio
+async def test_queued_callers_are_served_in_order():
+    """测试额度不足时调用方排队，按先来先到获得额度"""
+    limiter = RateLimiter("rl-fifo", rpm=60)
+    limiter.requests.consume(60)
+    order = []
+
+    async def call(index: int) -> None:
+        await limiter.acquire(1)
+        order.append(index)
+
+    tasks = [asyncio.create_task(call(i)) for i in range(3)]
+    await asyncio.sleep(0.05)
+    assert order == []
+    assert metrics.snapshot()['llm_ratelimit_waiting{model="rl-fifo"}'] == 3
+
+    limiter.requests._tokens = 3
+    await asyncio.wait_for(asyncio.gather(*tasks), timeout=5)
+    assert order == [0, 1, 2]
+
+
+def test_estimate_includes_max_output():
+    """测试预估的 token 数包括最大输出，未指定时按默认值"""
+    prompt = estimate_request_tokens(MESSAGES, max_completion_tokens=1) - 1
+    assert estimate_request_tokens(MESSAGES) == prompt + 100
+    assert estimate_request_tokens(MESSAGES, max_tokens=50) == prompt + 50
+    assert estimate_request_tokens(MESSAGES, 50, 20) == prompt + 20
+
+
+def test_limits_are_configured_per_model(monkeypatch):
+    """测试按模型单独配置的限额优先，未配置限额时不限流"""
+    monkeypatch.setattr(settings, "llm_rate_limit_rpm", 10)
+    monkeypatch.setattr(settings, "llm_rate_limits", {"big": {"tpm": 5000}})
+
+    big = get_rate_limiter("account", "big")
+    assert big.requests.capacity == 10
+    assert big.tokens.capacity == 5000
+    assert get_rate_limiter("account", "big") is big
+    assert get_rate_limiter("other", "big") is not big
+    assert get_rate_limiter("account", "small").tokens is None
+
+    monkeypatch.setattr(settings, "llm_rate_limits", {"free": {"rpm": 0}})
+    monkeypatch.setattr(settings, "llm_rate_limit_rpm", 0)
+    assert get_rate_limiter("account", "free") is None
+
+
+def test_clients_with_same_key_share_limiter(monkeypatch):
+    """测试同一 API Key 下同一模型的客户端共享限流器，未配置限额时不包装"""
+    first, second, third = MagicMock(), MagicMock(), MagicMock()
+    for client, key in ((first, "key-a"), (second, "key-a"), (third, "key-b")):
+        client.api_key = key
+        client.model_name = "shared-model"
+    assert with_rate_limit(first) is first
+
+    monkeypatch.setattr(settings, "llm_rate_limit_rpm", 10)
+    wrapped = [
+        with_rate_limit(CircuitBreakerLLMClient(first, CircuitBreaker("rl-cb"))),
+        with_rate_limit(second),
+        with_rate_limit(third),
+    ]
+    assert all(isinstance(c, RateLimitedLLMClient) for c in wrapped)
+    limiters = [c._limiter() for c in wrapped]
+    assert limiters[0] is limiters[1]
+    assert limiters[0] is not limiters[2]
+    assert "key-a" not in wrapped[0].account
+
+
+def _limited_client(inner, monkeypatch) -> RateLimitedLLMClient:
+    monkeypatch.setattr(settings, "llm_rate_limit_tpm", 100000)
+    inner.model_name = "rl-model"
+    inner.api_key = "key"
+    client = with_rate_limit(inner)
+    assert isinstance(client, RateLimitedLLMClient)
+    return client
+
+
+@pytest.mark.asyncio
+async def test_client_reconciles_and_forwards_usage(monkeypatch):
+    """测试调用结束后按上游返回的用量多退少补，并转交给外层的收集器"""
+    inner = MagicMock()
+
+    async def chat(*args, **kwargs):
+        record_usage({"prompt_tokens": 5, "completion_tokens": 7, "total_tokens": 12})
+        record_finish_reason("stop")
+        return "AI response"
+
+    inner.chat = AsyncMock(side_effect=chat)
+    client = _limited_client(inner, monkeypatch)
+
+    outer = StreamAccumulator()
+    with collect_stream_metadata(outer):
+        assert await client.chat(MESSAGES, max_tokens=50) == "AI response"
+    assert inner.chat.call_args.kwargs["max_tokens"] == 50
+    assert outer.usage["total_tokens"] == 12
+    assert outer.finish_reason == "stop"
+    assert client._limiter().tokens.tokens == pytest.approx(100000 - 12, abs=1)
+
+
+@pytest.mark.asyncio
+async def test_client_refunds_tokens_on_error(monkeypatch):
+    """测试调用失败时退还预估的 token"""
+    inner = MagicMock()
+    inner.chat = AsyncMock(side_effect=LLMError("503", status_code=503))
+    client = _limited_client(inner, monkeypatch)
+
+    with pytest.raises(LLMError):
+        await client.chat(MESSAGES)
+    assert client._limiter().tokens.tokens == pytest.approx(100000)
+
+
+@pytest.mark.asyncio
+async def test_stream_reconciles_after_last_chunk(monkeypatch):
+    """测试流式调用在流结束后按最后一个事件中的用量多退少补"""
+    inner = MagicMock()
+
+    async def stream(*args, **kwargs):
+        yield "Hello"
+        yield " world"
+        record_usage({"prompt_tokens": 5, "completion_tokens": 2})
+
+    inner.chat_stream = stream
+    client = _limited_client(inner, monkeypatch)
+
+    outer = StreamAccumulator()
+    with collect_stream_metadata(outer):
+        chunks = [c async for c in client.chat_stream(MESSAGES)]
+    assert chunks == ["Hello", " world"]
+    assert outer.usage == {"prompt_tokens": 5, "completion_tokens": 2}
+    assert client._limiter().tokens.tokens == pytest.approx(100000 - 7, abs=1)
+
+
+@pytest.mark.asyncio
+async def test_open_circuit_does_not_spend_quota(monkeypatch):
+    """测试熔断器打开时不扣除额度，排队期间熔断时退还扣除的额度"""
+    monkeypatch.setattr(settings, "llm_rate_limit_rpm", 10)
+    inner = MagicMock()
+    inner.model_name = "rl-cb-model"
+    inner.api_key = "key"
+    inner.chat = AsyncMock(return_value="AI response")
+    breaker = CircuitBreaker("rl-cb-open", min_requests=1, open_duration=60)
+    client = with_rate_limit(CircuitBreakerLLMClient(inner, breaker))
+    limiter = get_rate_limiter(client.account, "rl-cb-model")
+
+    breaker.record_failure(breaker.acquire())
+    for _ in range(20):
+        with pytest.raises(CircuitOpenError):
+            await client.chat(MESSAGES)
+    inner.chat.assert_not_awaited()
+    assert limiter.requests.tokens == pytest.approx(10, abs=0.1)
+
+    # 扣除额度时熔断器还会放行，发出前打开
+    monkeypatch.setattr(RateLimitedLLMClient, "_circuit_open", lambda self: False)
+    with pytest.raises(CircuitOpenError):
+        await client.chat(MESSAGES)
+    assert limiter.requests.tokens == pytest.approx(10, abs=0.1)
@@ -0,0 +1,189 @@
+"""LLM 提供者注册表测试"""
+
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from app.metrics import metrics
+from app.models.http_pool import close_http_clients, pool_key
+from app.models.registry import ProviderRegistry
+
+
+def _mock_client():
+    client = MagicMock()
+    client.close = AsyncMock()
+    return client
+
+
+async def _serve():
+    """本地 HTTP/1.1 服务：HEAD 请求稍作延迟后返回空响应，保持长连接并记录连接数"""
+    connections = []
+
+    async def handle(reader, writer):
+        connections.append(writer)
+        while True:
+            try:
+                await reader.readuntil(b"\r\n\r\n")
+            except (asyncio.IncompleteReadError, ConnectionError):
+                break
+            await asyncio.sleep(0.05)
+            writer.write(b"HTTP/1.1 204 No Content\r\nConnection: keep-alive\r\n\r\n")
+            await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    return server, f"http://127.0.0.1:{port}/api/v3", connections
+
+
+def test_get_creates_client_lazily():
+    """测试未启动时按需创建客户端，并且只创建一次"""
+    factory = MagicMock(side_effect=_mock_client)
+    registry = ProviderRegistry(warm_connections=0)
+    registry.register("doubao", factory, "https://ark.example.com/api/v3")
+
+    assert factory.call_count == 0
+    client = registry.get("doubao")
+    assert registry.get("doubao") is client
+    assert factory.call_count == 1
+
+    with pytest.raises(KeyError):
+        registry.get("unknown")
+
+
+@pytest.mark.asyncio
+async def test_start_and_close_lifecycle():
+    """测试启动时创建所有客户端，关闭时逐个关闭"""
+    clients = {"doubao": _mock_client(), "openai": _mock_client()}
+    registry = ProviderRegistry(warm_connections=0)
+    registry.register("doubao", lambda: clients["doubao"], "https://a.example.com")
+    registry.register("openai", lambda: clients["openai"], "https://b.example.com")
+
+    await registry.start()
+    assert registry.get("doubao") is clients["doubao"]
+    assert registry._keepalive_task is None
+
+    await registry.close()
+    clients["doubao"].close.assert_awaited_once()
+    clients["openai"].close.assert_awaited_once()
+    # 关闭后再次获取时重新创建
+    assert registry.get("doubao") is clients["doubao"]
+
+
+def test_warm_hosts_deduplicated():
+    """测试指向同一主机的提供者只预热一次，未标记预热的提供者跳过"""
+    registry = ProviderRegistry()
+    registry.register("a", _mock_client, "https://ark.example.com/api/v3")
+    registry.register("b", _mock_client, "https://ark.example.com/api/v3/chat")
+    registry.register("c", _mock_client, "https://api.openai.com/v1", warm=False)
+    assert [pool_key(url) for url in registry.warm_hosts] == [
+        "https://ark.example.com:443"
+    ]
+
+
+@pytest.mark.asyncio
+async def test_start_prewarms_connections():
+    """测试启动时预先建立指定数量的长连接，关闭时停止保持连接的任务"""
+    server, url, connections = await _serve()
+    registry = ProviderRegistry(warm_connections=3, keepalive_interval=60)
+    registry.register("local", _mock_client, url)
+    try:
+        await registry.start()
+        assert len(connections) == 3
+        assert registry._keepalive_task is not None
+
+        key = f'http_pool_connections_opened_total{{host="{pool_key(url)}"}}'
+        assert metrics.snapshot()[key] == 3
+
+        # 连接池不空闲时不重新预热
+        await registry.prewarm(only_idle=True)
+        assert len(connections) == 3
+
+        task = registry._keepalive_task
+        await registry.close()
+        assert task.cancelled()
+        assert registry._keepalive_task is None
+    finally:
+        await close_http_clients()
+        server.close()
+        await server.wait_closed()
+
+
+@pytest.mark.asyncio
+async def test_prewarm_failure_is_not_fatal(capsys):
+    """测试上游不可用时预热失败只打印日志"""
+    server = await asyncio.start_server(lambda r, w: None, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    server.close()
+    await server.wait_closed()
+
+    registry = ProviderRegistry(warm_connections=2, keepalive_interval=0)
+    registry.register("down", _mock_client, f"http://127.0.0.1:{port}")
+    try:
+        await registry.start()
+        assert "Prewarming" in capsys.readouterr().out
+        assert registry._keepalive_task is None
+    finally:
+        await registry.close()
+
+
+def test_backends_share_routed_pool(monkeypatch):
+    """测试配置多个上游时豆包和 OpenAI 两个提供者共用同一个路由客户端"""
+    from app.models import registry as registry_module
+    from app.models.routing import RoutingLLMClient
+
+    monkeypatch.setattr(
+        registry_module.settings,
+        "llm_backends",
+        [
+            {"type": "doubao", "name": "beijing"},
+            {"type": "openai", "base_url": "https://openai-proxy.example.com/v1"},
+        ],
+    )
+    registry = registry_module._build_provider_registry()
+
+    client = registry.get("doubao")
+    assert registry.get("openai") is client
+    assert [pool_key(url) for url in registry.warm_hosts] == [
+        pool_key(registry_module.settings.llm_api_endpoint),
+        "https://openai-proxy.example.com:443",
+    ]
+
+    inner = client
+    while not isinstance(inner, RoutingLLMClient):
+        inner = inner.inner
+    assert [b.name for b in inner.backends] == ["beijing", "openai-1"]
+
+
+def test_summary_provider(monkeypatch):
+    """测试历史压缩的摘要客户端来自注册表：默认与豆包共用，单独配置模型时经过熔断器和限流"""
+    from app.api import compaction
+    from app.models import registry as registry_module
+    from app.models.circuit_breaker import CircuitBreakerLLMClient
+    from app.models.llm_client import DoubaoClient
+
+    monkeypatch.setattr(
+        registry_module.settings, "llm_backends", [{"type": "doubao", "name": "bj"}]
+    )
+    registry = registry_module._build_provider_registry()
+    assert registry.get("summary") is registry.get("doubao")
+
+    monkeypatch.setattr(registry_module.settings, "llm_backends", [])
+    monkeypatch.setattr(
+        registry_module.settings, "history_compaction_model", "summary-model"
+    )
+    monkeypatch.setattr(registry_module.settings, "llm_rate_limit_rpm", 10)
+    registry = registry_module._build_provider_registry()
+    monkeypatch.setattr(registry_module, "provider_registry", registry)
+
+    client = compaction._build_summary_client()
+    assert client is registry.get("summary")
+    assert client.model_name == "summary-model"
+    layers = []
+    while hasattr(client, "inner"):
+        layers.append(type(client).__name__)
+        client = client.inner
+    assert isinstance(client, DoubaoClient)
+    assert "RateLimitedLLMClient" in layers
+    assert CircuitBreakerLLMClient.__name__ in layers
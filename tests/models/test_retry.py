@@ -0,0 +1,163 @@
+"""RetryingLLMClient 测试"""
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from app.metrics import metrics
+from app.models.errors import LLMError
+from app.models.retry import RetryingLLMClient, RetryPolicy
+
+
+def make_inner():
+    """创建被包装的 mock 客户端"""
+    inner = MagicMock()
+    inner.model_name = "test-model"
+    return inner
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """记录重试等待时间，不实际等待"""
+    recorded = []
+
+    async def fake_sleep(delay):
+        recorded.append(delay)
+
+    monkeypatch.setattr("app.models.retry.asyncio.sleep", fake_sleep)
+    return recorded
+
+
+def _upper(low: float, high: float) -> float:
+    """总是取区间上限的随机数函数"""
+    return high
+
+
+def test_decorrelated_jitter_backoff():
+    """测试等待时间在 [base, 上一次 * 3] 之间，不超过 max_delay"""
+    policy = RetryPolicy(base_delay=0.1, max_delay=1.0, rand=_upper)
+    assert policy.backoff(0) == pytest.approx(0.1)
+    assert policy.backoff(0.1) == pytest.approx(0.3)
+    assert policy.backoff(0.3) == pytest.approx(0.9)
+    assert policy.backoff(0.9) == 1.0
+
+    policy = RetryPolicy(base_delay=0.1, max_delay=1.0)
+    for previous in (0, 0.1, 0.5, 2.0):
+        assert 0.1 <= policy.backoff(previous) <= 1.0
+
+
+def test_next_delay_respects_retry_after_and_budget():
+    """测试 Retry-After 作为最短等待时间，超出时间预算时不再重试"""
+    policy = RetryPolicy(max_attempts=3, base_delay=0.1, budget=5.0, rand=_upper)
+    retryable = LLMError("503", status_code=503, retryable=True)
+
+    assert policy.next_delay(retryable, 1, 0.0, 0.0) == pytest.approx(0.1)
+    assert policy.next_delay(retryable, 3, 0.0, 0.0) is None
+    assert policy.next_delay(LLMError("400", status_code=400), 1, 0.0, 0.0) is None
+
+    limited = LLMError("429", status_code=429, retry_after=2.0, retryable=True)
+    assert policy.next_delay(limited, 1, 0.0, 0.0) == 2.0
+    assert policy.next_delay(limited, 1, 3.5, 0.0) is None
+
+
+@pytest.mark.asyncio
+async def test_chat_retries_transient_errors(sleeps):
+    """测试可重试的错误按策略重试后成功，并导出重试指标"""
+    inner = make_inner()
+    inner.chat = AsyncMock(
+        side_effect=[
+            LLMError("429", status_code=429, retry_after=0.5, retryable=True),
+            LLMError("reset", retryable=True),
+            "AI response",
+        ]
+    )
+    client = RetryingLLMClient(
+        inner, RetryPolicy(base_delay=0.1, rand=_upper), provider="retry-test"
+    )
+
+    assert await client.chat([{"role": "user", "content": "Hi"}]) == "AI response"
+    assert inner.chat.call_count == 3
+    assert sleeps == [0.5, pytest.approx(1.5)]
+
+    snapshot = metrics.snapshot()
+    assert snapshot['llm_retries_total{provider="retry-test",reason="429"}'] == 1
+    assert snapshot['llm_retries_total{provider="retry-test",reason="network"}'] == 1
+    assert (
+        snapshot['llm_retry_added_latency_seconds{provider="retry-test"}']["count"] == 1
+    )
+
+
+@pytest.mark.asyncio
+async def test_chat_does_not_retry_permanent_errors(sleeps):
+    """测试不可重试的错误直接抛出"""
+    inner = make_inner()
+    inner.chat = AsyncMock(side_effect=LLMError("bad request", status_code=400))
+    client = RetryingLLMClient(inner, RetryPolicy(), provider="retry-permanent")
+
+    with pytest.raises(LLMError, match="bad request"):
+        await client.chat([{"role": "user", "content": "Hi"}])
+    assert inner.chat.call_count == 1
+    assert sleeps == []
+
+
+@pytest.mark.asyncio
+async def test_chat_gives_up_after_max_attempts(sleeps):
+    """测试达到最多尝试次数后抛出最后一次的错误"""
+    inner = make_inner()
+    inner.chat = AsyncMock(side_effect=LLMError("502", status_code=502, retryable=True))
+    client = RetryingLLMClient(
+        inner, RetryPolicy(max_attempts=3), provider="retry-exhausted"
+    )
+
+    with pytest.raises(LLMError, match="502"):
+        await client.chat([{"role": "user", "content": "Hi"}])
+    assert inner.chat.call_count == 3
+    assert len(sleeps) == 2
+    assert (
+        metrics.snapshot()['llm_retries_exhausted_total{provider="retry-exhausted"}']
+        == 1
+    )
+
+
+@pytest.mark.asyncio
+async def test_stream_retries_before_first_chunk(sleeps):
+    """测试流式调用在收到第一个增量之前失败时重试"""
+    inner = make_inner()
+    attempts = []
+
+    async def flaky_stream(*args, **kwargs):
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise LLMError("503", status_code=503, retryable=True)
+        yield "Hello"
+        yield " world"
+
+    inner.chat_stream = flaky_stream
+    client = RetryingLLMClient(inner, RetryPolicy(), provider="retry-stream")
+
+    chunks = [c async for c in client.chat_stream([{"role": "user", "content": "Hi"}])]
+    assert chunks == ["Hello", " world"]
+    assert len(attempts) == 2
+    assert len(sleeps) == 1
+
+
+@pytest.mark.asyncio
+async def test_stream_does_not_retry_after_first_chunk(sleeps):
+    """测试已经输出内容后失败不重试，避免调用方收到重复内容"""
+    inner = make_inner()
+    attempts = []
+
+    async def broken_stream(*args, **kwargs):
+        attempts.append(1)
+        yield "部分"
+        raise LLMError("reset", retryable=True)
+
+    inner.chat_stream = broken_stream
+    client = RetryingLLMClient(inner, RetryPolicy(), provider="retry-stream-mid")
+
+    chunks = []
+    with pytest.raises(LLMError, match="reset"):
+        async for chunk in client.chat_stream([{"role": "user", "content": "Hi"}]):
+            chunks.append(chunk)
+    assert chunks == ["部分"]
+    assert len(attempts) == 1
+    assert sleeps == []
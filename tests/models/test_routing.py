@@ -0,0 +1,157 @@
+"""RoutingLLMClient 测试"""
+
+import asyncio
+import random
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from app.metrics import metrics
+from app.models.errors import LLMError
+from app.models.routing import Backend, RoutingLLMClient
+
+MESSAGES = [{"role": "user", "content": "Hi"}]
+
+
+def make_backend(name: str, **kwargs) -> Backend:
+    """创建使用 mock 客户端的上游"""
+    client = MagicMock()
+    client.model_name = f"{name}-model"
+    client.close = AsyncMock()
+    return Backend(name, client, **kwargs)
+
+
+def test_prefers_lower_latency_and_fewer_outstanding():
+    """测试按 EWMA 耗时 ×（正在进行的请求数 + 1）选择上游"""
+    fast = make_backend("route-fast", initial_latency=1.0)
+    slow = make_backend("route-slow", initial_latency=3.0)
+    router = RoutingLLMClient([slow, fast], rand=random.Random(0))
+    assert router.candidates() == [fast, slow]
+    assert router.model_name == "route-slow-model"
+
+    # fast 上有 3 个正在进行的请求时，预计等待时间 4.0 > 3.0
+    for _ in range(3):
+        fast.acquire()
+    assert router.candidates() == [slow, fast]
+
+
+def test_ewma_tracks_latency_and_penalizes_errors():
+    """测试 EWMA 随耗时更新，失败时按惩罚耗时计入"""
+    backend = make_backend(
+        "route-ewma", alpha=0.5, initial_latency=1.0, error_penalty=10.0
+    )
+    backend.observe(3.0)
+    assert backend.ewma == pytest.approx(2.0)
+    backend.observe_error()
+    assert backend.ewma == pytest.approx(6.0)
+    snapshot = metrics.snapshot()
+    assert (
+        snapshot['llm_backend_requests_total{backend="route-ewma",outcome="error"}']
+        == 1
+    )
+    assert snapshot['llm_backend_latency_ewma_seconds{backend="route-ewma"}'] == 6.0
+
+
+@pytest.mark.asyncio
+async def test_spreads_concurrent_requests():
+    """测试并发请求按正在进行的请求数分散到各个上游"""
+    backends = [make_backend(f"route-spread-{i}") for i in range(3)]
+    release = asyncio.Event()
+
+    for backend in backends:
+
+        async def slow_chat(*args, _name=backend.name, **kwargs):
+            await release.wait()
+            return _name
+
+        backend.client.chat = AsyncMock(side_effect=slow_chat)
+
+    router = RoutingLLMClient(backends)
+    tasks = [asyncio.create_task(router.chat(MESSAGES)) for _ in range(6)]
+    await asyncio.sleep(0)
+    assert [b.outstanding for b in backends] == [2, 2, 2]
+
+    release.set()
+    results = await asyncio.gather(*tasks)
+    assert sorted(results) == sorted([b.name for b in backends] * 2)
+    assert [b.outstanding for b in backends] == [0, 0, 0]
+
+
+@pytest.mark.asyncio
+async def test_fails_over_to_next_backend():
+    """测试上游出错时换到下一个上游"""
+    broken = make_backend("route-broken", initial_latency=0.1)
+    healthy = make_backend("route-healthy", initial_latency=1.0)
+    broken.client.chat = AsyncMock(side_effect=LLMError("503", status_code=503))
+    healthy.client.chat = AsyncMock(return_value="AI response")
+    router = RoutingLLMClient([broken, healthy], provider="route-failover")
+
+    assert await router.chat(MESSAGES, temperature=0) == "AI response"
+    broken.client.chat.assert_awaited_once()
+    assert healthy.client.chat.call_args.kwargs["temperature"] == 0
+    assert broken.ewma > healthy.ewma
+    assert metrics.snapshot()['llm_failovers_total{provider="route-failover"}'] == 1
+
+    # 出错的上游之后排在后面
+    assert router.candidates()[0] is healthy
+
+
+@pytest.mark.asyncio
+async def test_raises_when_all_backends_fail():
+    """测试所有上游都失败时抛出最后一个错误"""
+    backends = [make_backend(f"route-down-{i}") for i in range(2)]
+    for backend in backends:
+        backend.client.chat = AsyncMock(side_effect=LLMError(f"{backend.name} down"))
+    router = RoutingLLMClient(backends)
+
+    with pytest.raises(LLMError, match="down"):
+        await router.chat(MESSAGES)
+    assert all(b.client.chat.await_count == 1 for b in backends)
+
+
+@pytest.mark.asyncio
+async def test_bad_request_does_not_fail_over():
+    """测试请求本身有问题时不换上游，也不计入上游的失败"""
+    first = make_backend("route-400-a", initial_latency=0.1)
+    second = make_backend("route-400-b", initial_latency=1.0)
+    first.client.chat = AsyncMock(side_effect=LLMError("bad", status_code=400))
+    second.client.chat = AsyncMock(return_value="unused")
+    router = RoutingLLMClient([first, second])
+
+    with pytest.raises(LLMError, match="bad"):
+        await router.chat(MESSAGES)
+    second.client.chat.assert_not_awaited()
+    assert first.ewma == pytest.approx(0.1)
+
+
+@pytest.mark.asyncio
+async def test_stream_fails_over_before_first_chunk():
+    """测试流式调用在收到第一个增量之前失败时换上游，之后占用上游直到流结束"""
+    broken = make_backend("route-stream-broken", initial_latency=0.1)
+    healthy = make_backend("route-stream-healthy", initial_latency=1.0)
+
+    async def broken_stream(*args, **kwargs):
+        raise LLMError("reset", retryable=True)
+        yield  # pragma: no cover
+
+    async def healthy_stream(*args, **kwargs):
+        yield "Hello"
+        assert healthy.outstanding == 1
+        yield " world"
+
+    broken.client.chat_stream = broken_stream
+    healthy.client.chat_stream = healthy_stream
+    router = RoutingLLMClient([broken, healthy])
+
+    chunks = [c async for c in router.chat_stream(MESSAGES)]
+    assert chunks == ["Hello", " world"]
+    assert broken.outstanding == healthy.outstanding == 0
+
+
+@pytest.mark.asyncio
+async def test_close_closes_all_backends():
+    """测试关闭时关闭所有上游的客户端"""
+    backends = [make_backend(f"route-close-{i}") for i in range(2)]
+    await RoutingLLMClient(backends).close()
+    for backend in backends:
+        backend.client.close.assert_awaited_once()
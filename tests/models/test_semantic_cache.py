@@ -0,0 +1,81 @@
+"""语义缓存测试"""
+
+import numpy as np
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from app.models.semantic_cache import (
+    MinHasher,
+    SemanticCache,
+    SemanticCachingLLMClient,
+    normalize_text,
+    shingle,
+)
+
+
+def test_normalize_text():
+    """测试规范化去除标点、大小写和多余空白"""
+    assert normalize_text("  Hello,   World!! ") == "hello world"
+    assert normalize_text("你好，世界。") == "你好 世界"
+
+
+def test_minhash_estimates_jaccard():
+    """测试 MinHash 签名相等比例接近真实 Jaccard 相似度"""
+    hasher = MinHasher(num_perm=256)
+    a = shingle("the quick brown fox jumps over the lazy dog")
+    b = shingle("the quick brown fox jumps over the lazy cat")
+    jaccard = len(a & b) / len(a | b)
+
+    estimate = np.mean(hasher.signature(a) == hasher.signature(b))
+    assert estimate == pytest.approx(jaccard, abs=0.1)
+
+
+def test_near_duplicate_hits():
+    """测试只在空白和标点上不同的文本命中"""
+    cache = SemanticCache(threshold=0.8)
+    cache.set("scope", "What is the capital of France?", "Paris")
+
+    assert cache.get("scope", "what is the  capital of france") == "Paris"
+    assert cache.get("scope", "How do I bake sourdough bread?") is None
+    assert cache.hits == 1
+    assert cache.misses == 1
+    assert cache.hit_rate == 0.5
+
+
+def test_scope_isolation():
+    """测试不同作用域（历史、参数）互不命中"""
+    cache = SemanticCache()
+    cache.set("scope-a", "What is the capital of France?", "Paris")
+    assert cache.get("scope-b", "What is the capital of France?") is None
+
+
+def test_lru_eviction_removes_buckets():
+    """测试淘汰条目时同时清理 LSH 分桶"""
+    cache = SemanticCache(max_entries=1)
+    cache.set("scope", "first question about python", "1")
+    cache.set("scope", "second question about rust", "2")
+
+    assert len(cache) == 1
+    assert cache.get("scope", "first question about python") is None
+    assert cache.get("scope", "second question about rust") == "2"
+
+
+@pytest.mark.asyncio
+async def test_semantic_client_reuses_near_duplicate_answer():
+    """测试语义缓存客户端对近似重复请求复用回复"""
+    inner = MagicMock()
+    inner.model_name = "test-model"
+    inner.chat = AsyncMock(return_value="Paris")
+    client = SemanticCachingLLMClient(inner, SemanticCache())
+
+    history = [{"role": "system", "content": "You are helpful."}]
+    first = history + [{"role": "user", "content": "What is the capital of France?"}]
+    second = history + [{"role": "user", "content": "what is the capital of France"}]
+
+    assert await client.chat(first, temperature=0) == "Paris"
+    assert await client.chat(second, temperature=0) == "Paris"
+    assert inner.chat.call_count == 1
+
+    # 历史不同时不复用
+    await client.chat(second[1:], temperature=0)
+    assert inner.chat.call_count == 2
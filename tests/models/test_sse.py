@@ -0,0 +1,104 @@
+"""增量 SSE 解码测试"""
+
+import json
+
+import pytest
+
+from app.metrics import metrics
+from app.models.sse import ChatStreamEvent, ChatStreamParser, SSEDecoder
+
+
+def _decode(body: bytes, chunk_size: int):
+    decoder = SSEDecoder()
+    events = []
+    for i in range(0, len(body), chunk_size):
+        events.extend(decoder.feed(body[i : i + chunk_size]))
+    events.extend(decoder.close())
+    return [(e.event, e.data, e.id, e.retry) for e in events]
+
+
+@pytest.mark.parametrize("newline", [b"\n", b"\r\n", b"\r"])
+@pytest.mark.parametrize("chunk_size", [1, 2, 5, 1000])
+def test_spec_fields_and_line_endings(newline, chunk_size):
+    """测试多行 data、event / id / retry 字段、注释和三种换行"""
+    lines = [
+        b"\xef\xbb\xbf: comment",
+        b"data: first",
+        b"data:second",
+        b"",
+        b"event: update",
+        b"id: 7",
+        b"retry: 3000",
+        b'data: {"\xe4\xbd\xa0": 1}',
+        b"unknown: ignored",
+        b"",
+        b"data",
+        b"",
+        b"event: empty",
+        b"",
+        b"data: after id",
+        b"",
+        b"data: never dispatched",
+    ]
+    body = newline.join(lines)
+    assert _decode(body, chunk_size) == [
+        ("message", b"first\nsecond", None, None),
+        ("update", '{"你": 1}'.encode(), "7", 3000),
+        ("message", b"after id", "7", None),
+    ]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 1000])
+def test_empty_data_not_dispatched(chunk_size):
+    """测试数据为空的事件按规范不分发，两个空 data 字段的数据是一个换行"""
+    body = b"data\n\ndata:\n\ndata: \n\nevent: x\ndata\n\ndata\ndata\n\n"
+    assert _decode(body, chunk_size) == [("message", b"\n", None, None)]
+
+    parser = ChatStreamParser()
+    before = metrics.snapshot().get("llm_stream_malformed_frames_total", 0)
+    assert parser.feed(b"data:\n\ndata: [DONE]\n\n")[0].type == "done"
+    assert metrics.snapshot().get("llm_stream_malformed_frames_total", 0) == before
+
+
+def test_trailing_carriage_return_dispatches_on_close():
+    """测试以 \\r 结尾的流在结束时完成最后一个事件"""
+    assert _decode(b"data: x\r\r", 1000) == [("message", b"x", None, None)]
+    assert _decode(b"data: x\r", 1000) == []
+
+
+def test_chat_stream_parser_structured_events():
+    """测试解析文本增量、finish_reason、usage、错误事件和结束标记"""
+    frames = [
+        {"choices": [{"delta": {"role": "assistant", "content": ""}}]},
+        {"choices": [{"delta": {"content": "你"}}]},
+        {"choices": [{"delta": {"content": "好"}, "finish_reason": "length"}]},
+        {"choices": [], "usage": {"total_tokens": 3}},
+    ]
+    body = b"".join(b"data: " + json.dumps(f).encode() + b"\n\n" for f in frames)
+    body += b"data: not json\n\n"
+    body += b"event: error\ndata: overloaded\n\n"
+    body += b"data: [DONE]\n\n"
+
+    parser = ChatStreamParser()
+    events = []
+    for i in range(0, len(body), 9):
+        events.extend(parser.feed(body[i : i + 9]))
+    events.extend(parser.close())
+
+    assert events == [
+        ChatStreamEvent("delta", content="你"),
+        ChatStreamEvent("delta", content="好"),
+        ChatStreamEvent("finish", finish_reason="length"),
+        ChatStreamEvent("usage", usage={"total_tokens": 3}),
+        ChatStreamEvent("error", error="overloaded"),
+        ChatStreamEvent("done"),
+    ]
+
+
+def test_carriage_return_split_across_chunks():
+    """测试 \\r\\n 被切开时不会多出空行，单独的 \\r 在下一个字节到达时生效"""
+    decoder = SSEDecoder()
+    assert decoder.feed(b"data: a\r") == []
+    assert decoder.feed(b"\n\r") == []
+    events = decoder.feed(b"x")
+    assert [(e.event, e.data) for e in events] == [("message", b"a")]
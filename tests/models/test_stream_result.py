@@ -0,0 +1,75 @@
+"""流式结果收集测试"""
+
+import pytest
+
+from app.models.llm_client import BaseLLMClient
+from app.models.stream_result import (
+    StreamAccumulator,
+    collect_stream_metadata,
+    record_finish_reason,
+    record_usage,
+    stream_metadata,
+)
+
+
+def test_accumulator_timing():
+    """测试首 token 延迟、增量间隔、总耗时和增量数"""
+    now = [10.0]
+    accumulator = StreamAccumulator(clock=lambda: now[0])
+    for delay, chunk in ((0.5, "你"), (0.1, "好"), (0.3, "！")):
+        now[0] += delay
+        accumulator.add(chunk)
+    now[0] += 0.2
+
+    result = accumulator.result()
+    assert result.content == "你好！"
+    assert result.chunk_count == 3
+    assert result.ttft == pytest.approx(0.5)
+    assert result.gaps == pytest.approx([0.1, 0.3])
+    assert result.inter_chunk_max == pytest.approx(0.3)
+    assert result.duration == pytest.approx(1.1)
+    stats = result.stats()
+    assert stats["ttft_ms"] == 500.0
+    assert stats["inter_chunk_mean_ms"] == 200.0
+
+
+def test_empty_stream():
+    """测试没有任何增量时首 token 延迟和间隔为空"""
+    stats = StreamAccumulator().result().stats()
+    assert stats["chunk_count"] == 0
+    assert stats["ttft_ms"] is None
+    assert stats["inter_chunk_mean_ms"] is None
+
+
+def test_metadata_sink():
+    """测试只有在收集上下文内才记录用量和结束原因"""
+    record_usage({"total_tokens": 1})
+    with collect_stream_metadata(StreamAccumulator()) as accumulator:
+        record_usage({"total_tokens": 3})
+        record_finish_reason("length")
+    assert stream_metadata.get() is None
+    assert accumulator.usage == {"total_tokens": 3}
+    assert accumulator.finish_reason == "length"
+
+
+class FakeStreamClient(BaseLLMClient):
+    model_name = "fake"
+
+    async def chat(self, messages, **kwargs):
+        raise NotImplementedError
+
+    async def chat_stream(self, messages, **kwargs):
+        for chunk in ("a", "b", "c"):
+            yield chunk
+        record_finish_reason("stop")
+        record_usage({"completion_tokens": 3})
+
+
+@pytest.mark.asyncio
+async def test_chat_stream_result():
+    """测试 chat_stream_result 收集完整内容和上游元数据"""
+    result = await FakeStreamClient().chat_stream_result([{"role": "user"}])
+    assert result.content == "abc"
+    assert result.chunk_count == 3
+    assert result.finish_reason == "stop"
+    assert result.usage == {"completion_tokens": 3}
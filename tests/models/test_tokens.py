@@ -0,0 +1,33 @@
+"""Token 数估算测试"""
+
+from app.models.tokens import (
+    IMAGE_TOKENS,
+    MESSAGE_OVERHEAD_TOKENS,
+    estimate_content_tokens,
+    estimate_message_tokens,
+    estimate_tokens,
+)
+
+
+def test_estimate_tokens_ascii_and_cjk():
+    """测试英文按 4 字符 / token、中文按 1 字符 / token 估算"""
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abcd") == 1
+    assert estimate_tokens("abcde") == 2
+    assert estimate_tokens("你好世界") == 4
+    assert estimate_tokens("你好 abcd") == 2 + 2
+
+
+def test_estimate_multimodal_content():
+    """测试多模态内容按文本部分和图片数估算"""
+    content = [
+        {"type": "image_url", "image_url": {"url": "https://example.com/a.jpg"}},
+        {"type": "text", "text": "图片讲了什么"},
+    ]
+    assert estimate_content_tokens(content) == IMAGE_TOKENS + 6
+
+
+def test_estimate_message_tokens_includes_overhead():
+    """测试单条消息包含固定开销"""
+    message = {"role": "user", "content": "abcd"}
+    assert estimate_message_tokens(message) == MESSAGE_OVERHEAD_TOKENS + 1
@@ -0,0 +1,55 @@
+"""JSON 编解码器测试"""
+
+import json
+from datetime import date
+
+import pytest
+
+from app.codec import CODECS, JSONCodec, _build_codec
+
+AVAILABLE = [name for name, factory in CODECS.items() if factory is not None]
+
+
+@pytest.fixture(params=AVAILABLE)
+def codec(request):
+    return CODECS[request.param]()
+
+
+def test_compact_utf8_output(codec):
+    """测试所有编解码器输出相同的紧凑 UTF-8 JSON"""
+    data = {"role": "user", "content": "你好", "n": [1, 2.5, None, True]}
+    assert codec.dumps(data) == JSONCodec().dumps(data)
+    assert codec.dumps(data) == (
+        '{"role":"user","content":"你好","n":[1,2.5,null,true]}'.encode("utf-8")
+    )
+    assert codec.loads(codec.dumps(data)) == data
+    assert codec.loads(codec.dumps(data).decode("utf-8")) == data
+
+
+def test_sort_keys_and_fallbacks(codec):
+    """测试排序键、无法序列化的对象和超出 64 位的整数"""
+    assert codec.dumps({"b": 1, "a": 2}, sort_keys=True) == b'{"a":2,"b":1}'
+    assert codec.dumps({"d": date(2024, 1, 2)}) == b'{"d":"2024-01-02"}'
+    assert json.loads(codec.dumps({"big": 2**70})) == {"big": 2**70}
+    assert json.loads(codec.dumps({1: "x"})) == {"1": "x"}
+
+
+def test_decode_error_is_json_decode_error(codec):
+    """测试解码失败统一抛出 json.JSONDecodeError"""
+    with pytest.raises(json.JSONDecodeError):
+        codec.loads(b"{not json")
+
+
+def test_build_codec_selection():
+    """测试按名称选择编解码器"""
+    assert _build_codec("json").name == "json"
+    assert _build_codec("auto").name == AVAILABLE[0]
+    with pytest.raises(ValueError):
+        _build_codec("yaml")
+
+
+def test_missing_codec_falls_back(monkeypatch):
+    """测试指定的库未安装时退回 auto"""
+    monkeypatch.setitem(CODECS, "msgspec", None)
+    monkeypatch.setitem(CODECS, "orjson", None)
+    assert _build_codec("msgspec").name == "json"
@@ -40,3 +40,28 @@ def test_cors_headers(client):
     )
     # CORS 中间件应该允许所有来源
     assert response.status_code in [200, 405]  # OPTIONS 可能返回 405
+
+
+def test_metrics_endpoint(client):
+    """测试指标端点"""
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert isinstance(response.json(), dict)
+
+
+def test_health_reports_circuit_breakers(client, monkeypatch):
+    """测试健康检查返回熔断器状态，所有上游都熔断时为 degraded"""
+    from app.models import circuit_breaker
+
+    breaker = circuit_breaker.CircuitBreaker("health-test", min_requests=1)
+    monkeypatch.setattr(circuit_breaker, "_breakers", {"health-test": breaker})
+
+    data = client.get("/health").json()
+    assert data["status"] == "healthy"
+    assert data["circuit_breakers"]["health-test"]["state"] == "closed"
+
+    breaker.record_failure(breaker.acquire())
+    data = client.get("/health").json()
+    assert data["status"] == "degraded"
+    assert data["circuit_breakers"]["health-test"]["state"] == "open"
+    assert data["circuit_breakers"]["health-test"]["error_rate"] == 1.0
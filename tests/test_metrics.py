@@ -0,0 +1,39 @@
+"""指标模块测试"""
+
+import pytest
+
+from app.metrics import MetricsRegistry
+
+
+def test_counter_and_gauge():
+    """测试计数器和瞬时值"""
+    registry = MetricsRegistry()
+    registry.counter("requests_total").inc()
+    registry.counter("requests_total").inc(2)
+    registry.gauge("queue_depth", {"provider": "doubao"}).set(5)
+
+    snapshot = registry.snapshot()
+    assert snapshot["requests_total"] == 3
+    assert snapshot['queue_depth{provider="doubao"}'] == 5
+
+
+def test_histogram_summary():
+    """测试直方图统计摘要"""
+    registry = MetricsRegistry()
+    histogram = registry.histogram("latency_seconds")
+    for value in range(1, 101):
+        histogram.observe(value / 100)
+
+    summary = registry.snapshot()["latency_seconds"]
+    assert summary["count"] == 100
+    assert summary["max"] == 1.0
+    assert summary["p50"] == pytest.approx(0.51)
+    assert summary["p99"] == pytest.approx(1.0)
+
+
+def test_metric_kind_conflict():
+    """测试同名指标不能注册为不同类型"""
+    registry = MetricsRegistry()
+    registry.counter("x")
+    with pytest.raises(ValueError):
+        registry.gauge("x")